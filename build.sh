@@ -5,5 +5,6 @@ set -o errexit
 
 pip install -r requirements.txt
 
-python manage.py collecstatic --no-input
+python manage.py build_assets
+python manage.py collectstatic --no-input
 python manage.py migrate --no-input
\ No newline at end of file
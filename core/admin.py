@@ -1,9 +1,75 @@
 from django.contrib import admin
-from .models import User, Post, Follow, Message, Comment, Like
-
-admin.site.register(User)
-admin.site.register(Post)
-admin.site.register(Follow)
-admin.site.register(Message)
-admin.site.register(Comment)
-admin.site.register(Like)
+from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
+from django.core.paginator import Paginator
+from django.utils.functional import cached_property
+
+from .bulk import estimated_count
+from .models import User, Post, Follow, Message, Comment, Like, Notification
+
+
+# ======================================================
+# LARGE-TABLE CHANGELIST DEFAULTS
+# ======================================================
+class EstimatedCountPaginator(Paginator):
+    """Avoid a full COUNT(*) on every changelist page of a big table."""
+
+    @cached_property
+    def count(self):
+        return estimated_count(self.object_list)
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    list_per_page = 50
+
+
+@admin.register(User)
+class UserAdmin(BaseUserAdmin, LargeTableAdmin):
+    fieldsets = BaseUserAdmin.fieldsets + (
+        ("Profile", {"fields": ("phone_number", "profile_image", "bio")}),
+    )
+    search_fields = ("username", "email", "phone_number")
+
+
+@admin.register(Post)
+class PostAdmin(LargeTableAdmin):
+    list_display = ("id", "author", "created_at", "like_count")
+    list_select_related = ("author",)
+    raw_id_fields = ("author",)
+    date_hierarchy = "created_at"
+
+
+@admin.register(Follow)
+class FollowAdmin(LargeTableAdmin):
+    list_display = ("id", "follower", "following", "created_at")
+    list_select_related = ("follower", "following")
+    raw_id_fields = ("follower", "following")
+
+
+@admin.register(Message)
+class MessageAdmin(LargeTableAdmin):
+    list_display = ("id", "sender", "receiver", "timestamp", "read")
+    list_select_related = ("sender", "receiver")
+    raw_id_fields = ("sender", "receiver")
+
+
+@admin.register(Comment)
+class CommentAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "post", "created_at")
+    list_select_related = ("user", "post")
+    raw_id_fields = ("user", "post")
+
+
+@admin.register(Like)
+class LikeAdmin(LargeTableAdmin):
+    list_display = ("id", "user", "post", "created_at")
+    list_select_related = ("user", "post")
+    raw_id_fields = ("user", "post")
+
+
+@admin.register(Notification)
+class NotificationAdmin(LargeTableAdmin):
+    list_display = ("id", "recipient", "verb", "actor_count", "read", "bucket")
+    list_select_related = ("recipient",)
+    raw_id_fields = ("recipient", "post")
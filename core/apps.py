@@ -4,3 +4,10 @@ from django.apps import AppConfig
 class CoreConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'core'
+
+    def ready(self):
+        # Connect the auth/user-summary/profile caches, follow-graph,
+        # text-index, thumbnail, replica-pinning and message-shard signals
+        from . import (  # noqa: F401
+            auth, graph, profiles, replicas, shards, textindex, thumbnails, usercache,
+        )
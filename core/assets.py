@@ -0,0 +1,105 @@
+import re
+from pathlib import Path
+
+from django.conf import settings
+
+
+# Bundles built into static/dist/ by `manage.py build_assets`.
+# collectstatic then content-hashes and compresses them through
+# CompressedManifestStaticFilesStorage.
+BUNDLES = {
+    "dist/app.min.css": [
+        "vendor/fontawesome/icons.css",
+        "src/css/base.css",
+        "src/css/feed.css",
+        "src/css/chat.css",
+    ],
+    "dist/base.min.js": [
+        "src/js/base.js",
+    ],
+    "dist/feed.min.js": [
+        "src/js/csrf.js",
+        "src/js/feed.js",
+    ],
+    "dist/chat.min.js": [
+        "src/js/csrf.js",
+        "src/js/chat.js",
+    ],
+}
+
+
+def static_dir():
+    return Path(settings.STATICFILES_DIRS[0])
+
+
+# ======================================================
+# MINIFIERS
+# ======================================================
+# A quoted string, a comment or a run of whitespace
+_CSS_TOKEN = re.compile(r"""("|')(?:\\.|(?!\1).)*\1|/\*.*?\*/|\s+""", re.S)
+
+
+def minify_css(source):
+    try:
+        import rcssmin
+    except ImportError:  # optional, falls back to the regex pass below
+        rcssmin = None
+    if rcssmin is not None:
+        return rcssmin.cssmin(source)
+
+    # Comments and whitespace only, and never inside quoted strings.
+    # Spaces around ":", ">" or "+" can matter ("a :hover",
+    # "calc(1px + 2px)"); next to braces, ";" or "," they don't
+    def drop_comments(match):
+        token = match.group(0)
+        if token.startswith("/*") and not token.startswith("/*!"):
+            return ""
+        return token
+
+    def squeeze(match):
+        token = match.group(0)
+        if not token.isspace():
+            return token
+        before = match.string[match.start() - 1:match.start()]
+        after = match.string[match.end():match.end() + 1]
+        return "" if before in "{};," or after in "{};," else " "
+
+    source = _CSS_TOKEN.sub(drop_comments, source)
+    return _CSS_TOKEN.sub(squeeze, source) + "\n"
+
+
+def minify_js(source):
+    try:
+        import rjsmin
+    except ImportError:  # optional, falls back to a whitespace-only pass
+        rjsmin = None
+    if rjsmin is not None:
+        return rjsmin.jsmin(source)
+
+    # Conservative: never rewrites tokens, only indentation,
+    # blank lines and whole-line comments.
+    lines = []
+    for line in source.splitlines():
+        stripped = line.strip()
+        if not stripped or stripped.startswith("//"):
+            continue
+        if stripped.startswith("/*") and stripped.endswith("*/") and not stripped.startswith("/*!"):
+            continue
+        lines.append(stripped)
+    return "\n".join(lines) + "\n"
+
+
+def build(bundles=None):
+    """Concatenate and minify each bundle. Returns {name: bytes written}."""
+    root = static_dir()
+    written = {}
+    for name, sources in (bundles or BUNDLES).items():
+        text = "\n".join((root / src).read_text(encoding="utf-8") for src in sources)
+        minify = minify_css if name.endswith(".css") else minify_js
+        output = minify(text)
+
+        target = root / name
+        target.parent.mkdir(parents=True, exist_ok=True)
+        target.write_text(output, encoding="utf-8")
+        written[name] = len(output.encode("utf-8"))
+    return written
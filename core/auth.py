@@ -0,0 +1,123 @@
+from functools import partial
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.middleware import AuthenticationMiddleware
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+from django.utils.crypto import constant_time_compare
+from django.utils.functional import SimpleLazyObject
+
+from .models import User
+from .versions import shared
+
+
+def _ttl():
+    return getattr(settings, "AUTH_USER_CACHE_TTL", 30)
+
+
+def user_key(user_id):
+    return f"authuser:{user_id}"
+
+
+def _cached_fields():
+    # Everything but the password hash, which has no business in a cache
+    return [f.attname for f in User._meta.concrete_fields if f.attname != "password"]
+
+
+def _to_cache(user):
+    return {
+        "db": user._state.db,
+        "values": [getattr(user, name) for name in _cached_fields()],
+        # An HMAC of the password hash, not the hash itself
+        "session_hash": user.get_session_auth_hash(),
+    }
+
+
+def _from_cache(entry):
+    # password is deferred: only code that reads it queries the row
+    return User.from_db(entry["db"], _cached_fields(), entry["values"])
+
+
+# ======================================================
+# CACHED USER RESOLUTION
+# ======================================================
+def get_user(request):
+    """
+    auth.get_user with a short-TTL cache in front of the User SELECT.
+    A cached row still goes through the checks Django would make: the
+    session auth hash (a password change logs other sessions out) and
+    the backend's is_active rule; anything unusual (mismatch, fallback
+    secrets, unknown backend) takes Django's path. The cache holds the
+    row without its password hash. Only with a shared cache: a
+    per-process one would miss invalidations from other workers.
+    """
+    if not shared():
+        return auth.get_user(request)
+    try:
+        user_id = request.session[SESSION_KEY]
+        backend_path = request.session[BACKEND_SESSION_KEY]
+    except KeyError:
+        return auth.get_user(request)
+
+    key = user_key(user_id)
+    entry = cache.get(key)
+    if entry is None:
+        user = auth.get_user(request)
+        if user.is_authenticated:
+            cache.set(key, _to_cache(user), _ttl())
+        return user
+
+    if backend_path not in settings.AUTHENTICATION_BACKENDS:
+        return auth.get_user(request)
+    backend = auth.load_backend(backend_path)
+    user = _from_cache(entry)
+    can_authenticate = getattr(backend, "user_can_authenticate", None)
+    session_hash = request.session.get(HASH_SESSION_KEY)
+    if (
+        (can_authenticate is None or can_authenticate(user))
+        and session_hash
+        and constant_time_compare(session_hash, entry["session_hash"])
+    ):
+        user.backend = backend_path
+        return user
+    return auth.get_user(request)
+
+
+def invalidate(user_id):
+    cache.delete(user_key(user_id))
+
+
+def _on_user_change(sender, instance, **kwargs):
+    # Profile edits, password changes, deactivation, last_login updates
+    invalidate(instance.pk)
+
+
+post_save.connect(_on_user_change, sender=User, dispatch_uid="auth_user_save")
+post_delete.connect(_on_user_change, sender=User, dispatch_uid="auth_user_delete")
+
+
+# ======================================================
+# HTTP MIDDLEWARE
+# ======================================================
+def _get_request_user(request):
+    if not hasattr(request, "_cached_user"):
+        request._cached_user = get_user(request)
+    return request._cached_user
+
+
+async def _aget_request_user(request):
+    if not hasattr(request, "_acached_user"):
+        request._acached_user = await sync_to_async(get_user)(request)
+    return request._acached_user
+
+
+class CachedAuthenticationMiddleware(AuthenticationMiddleware):
+    """AuthenticationMiddleware resolving request.user via core.auth.get_user."""
+
+    def process_request(self, request):
+        super().process_request(request)
+        request.user = SimpleLazyObject(lambda: _get_request_user(request))
+        request.auser = partial(_aget_request_user, request)
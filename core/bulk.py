@@ -0,0 +1,134 @@
+from collections import Counter
+
+from django.db import connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from .models import Post, Like, Comment, Follow, Message, MessageArchive, Notification
+
+
+# ======================================================
+# BATCHED DELETES
+# ======================================================
+def batched_delete(queryset, batch_size=500, progress=None, before_batch=None):
+    """
+    Delete `queryset` in primary-key order, `batch_size` rows per
+    transaction, so no single statement holds the write lock for long.
+    `before_batch(ids)` runs inside each transaction (e.g. to fix
+    denormalized counters); `progress(done)` after each commit.
+    Returns the number of top-level rows deleted.
+    """
+    model = queryset.model
+    done = 0
+    last_pk = None
+    while True:
+        batch = queryset.order_by("pk")
+        if last_pk is not None:
+            batch = batch.filter(pk__gt=last_pk)
+        ids = list(batch.values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            break
+
+        with transaction.atomic(using=queryset.db):
+            if before_batch:
+                before_batch(ids)
+            model.objects.using(queryset.db).filter(pk__in=ids).delete()
+
+        done += len(ids)
+        last_pk = ids[-1]
+        if progress:
+            progress(done)
+    return done
+
+
+def _release_likes(like_ids):
+    """Decrement Post.like_count for likes about to be deleted."""
+    per_post = Counter(
+        Like.objects.filter(pk__in=like_ids).values_list("post_id", flat=True)
+    )
+    for post_id, n in per_post.items():
+        # Never below zero, even if the counter had drifted low
+        Post.objects.filter(pk=post_id).update(like_count=Greatest(F("like_count") - n, 0))
+
+
+def delete_user_data(user, batch_size=500, progress=None):
+    """
+    Remove everything a user owns table by table in small batches,
+    then the user row itself (whose cascade is by then nearly empty).
+    `progress(label, done)` is called after each batch.
+    """
+    def report(label):
+        return (lambda done: progress(label, done)) if progress else None
+
+    own_posts = Post.objects.filter(author=user)
+    message_steps = []
+    for messages in Message.objects.on_shards():
+        message_steps += [
+            ("messages sent", messages.filter(sender=user), None),
+            ("messages received", messages.filter(receiver=user), None),
+        ]
+    steps = [
+        *message_steps,
+        ("archived message segments", MessageArchive.objects.filter(
+            Q(user_low=user) | Q(user_high=user)
+        ), None),
+        ("likes given", Like.objects.filter(user=user), _release_likes),
+        ("comments", Comment.objects.filter(user=user), None),
+        ("likes on own posts", Like.objects.filter(post__in=own_posts), None),
+        ("comments on own posts", Comment.objects.filter(post__in=own_posts), None),
+        ("notifications", Notification.objects.filter(recipient=user), None),
+        ("posts", own_posts, None),
+        ("following", Follow.objects.filter(follower=user), None),
+        ("followers", Follow.objects.filter(following=user), None),
+    ]
+
+    totals = {}
+    for label, queryset, before_batch in steps:
+        # Message steps repeat once per shard: their counts add up
+        totals[label] = totals.get(label, 0) + batched_delete(
+            queryset, batch_size, report(label), before_batch
+        )
+
+    with transaction.atomic():
+        user.delete()
+    return totals
+
+
+# ======================================================
+# ADMIN / COUNT HELPERS
+# ======================================================
+def estimated_count(queryset):
+    """
+    Cheap row-count estimate for an unfiltered table, from the planner
+    statistics ANALYZE keeps (pg_class on PostgreSQL, sqlite_stat1 on
+    SQLite). Filtered querysets, tables without statistics and other
+    databases get a real COUNT.
+    """
+    if queryset.query.where:
+        return queryset.count()
+
+    table = queryset.model._meta.db_table
+    connection = connections[queryset.db]
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql":
+            # -1 (or 0) until the table is first analyzed
+            cursor.execute(
+                "SELECT reltuples::bigint FROM pg_class WHERE oid = to_regclass(%s)",
+                [connection.ops.quote_name(table)],
+            )
+            row = cursor.fetchone()
+        elif connection.vendor == "sqlite":
+            cursor.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'sqlite_stat1'"
+            )
+            row = None
+            if cursor.fetchone():
+                # "rows [rows per key...]", per index or for the table itself
+                cursor.execute("SELECT stat FROM sqlite_stat1 WHERE tbl = %s LIMIT 1", [table])
+                stat = cursor.fetchone()
+                row = stat and (int(stat[0].split()[0]),)
+        else:
+            row = None
+    if row and row[0] > 0:
+        return row[0]
+    return queryset.count()
@@ -2,6 +2,9 @@ import json
 from channels.generic.websocket import AsyncWebsocketConsumer
 from channels.db import database_sync_to_async
 from .models import Message, User
+from .notifications import group_name
+from .receipts import mark_read, newest_message_id
+from .versions import bump, chat_key
 
 def room_name(a, b):
     return "_".join(sorted([a, b]))
@@ -13,6 +16,9 @@ class ChatConsumer(AsyncWebsocketConsumer):
             await self.close()
             return
         other = self.scope["url_route"]["kwargs"]["username"]
+        self.other_id = await database_sync_to_async(
+            User.objects.filter(username=other).values_list("id", flat=True).first
+        )()
         self.room_group_name = f"chat_{room_name(user.username, other)}"
         await self.channel_layer.group_add(self.room_group_name, self.channel_name)
         await self.accept()
@@ -22,6 +28,19 @@ class ChatConsumer(AsyncWebsocketConsumer):
 
     async def receive(self, text_data):
         data = json.loads(text_data)
+        if data.get("type") == "read":
+            # {"type": "read", "last_read_id": <newest message shown>}
+            try:
+                claimed = int(data.get("last_read_id") or 0)
+            except (TypeError, ValueError):
+                return
+            if self.other_id is not None and claimed > 0:
+                # Up to a message that exists, not whatever the client says
+                message_id = await database_sync_to_async(newest_message_id)(
+                    self.scope["user"].id, self.other_id, claimed
+                )
+                mark_read(self.scope["user"].id, self.other_id, message_id)
+            return
         message = data.get("message")
         to_user = data.get("to")
         await database_sync_to_async(self.save_message)(self.scope["user"].username, to_user, message)
@@ -35,9 +54,35 @@ class ChatConsumer(AsyncWebsocketConsumer):
         sender_user = User.objects.get(username=sender)
         receiver_user = User.objects.get(username=receiver)
         Message.objects.create(sender=sender_user, receiver=receiver_user, content=content)
+        bump(chat_key(sender, receiver))
 
     async def chat_message(self, event):
         await self.send(text_data=json.dumps({
             "message": event["message"],
             "sender": event["sender"],
         }))
+
+    async def chat_read(self, event):
+        await self.send(text_data=json.dumps({
+            "type": "read",
+            "reader": event["reader"],
+            "last_read_id": event["last_read_id"],
+        }))
+
+
+class NotificationConsumer(AsyncWebsocketConsumer):
+    async def connect(self):
+        user = self.scope["user"]
+        if user.is_anonymous:
+            await self.close()
+            return
+        self.group_name = group_name(user.id)
+        await self.channel_layer.group_add(self.group_name, self.channel_name)
+        await self.accept()
+
+    async def disconnect(self, close_code):
+        if hasattr(self, "group_name"):
+            await self.channel_layer.group_discard(self.group_name, self.channel_name)
+
+    async def notify(self, event):
+        await self.send(text_data=json.dumps(event["notification"]))
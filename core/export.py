@@ -0,0 +1,168 @@
+import io
+import json
+import time
+import zipfile
+from itertools import islice
+
+from django.core.files.storage import default_storage
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+from .models import Post, Comment, Like, Follow, Message, User
+from .retention import iter_archived
+from .usercache import get_many
+
+
+# ======================================================
+# USER DATA AS NDJSON (STREAMED)
+# ======================================================
+def user_datasets(user):
+    """
+    (name, rows) for everything a user owns. Rows are lazy querysets of
+    dicts (streamed with .iterator(chunk_size=...)) or generators.
+    """
+    return [
+        ("posts", Post.objects.filter(author=user).order_by("id").values(
+            "id", "caption", "image", "created_at", "like_count"
+        )),
+        ("comments", Comment.objects.filter(user=user).order_by("id").values(
+            "id", "post_id", "text", "created_at"
+        )),
+        ("likes", Like.objects.filter(user=user).order_by("id").values(
+            "id", "post_id", "created_at"
+        )),
+        ("following", Follow.objects.filter(follower=user).order_by("id").values(
+            "id", "following__username", "created_at"
+        )),
+        ("followers", Follow.objects.filter(following=user).order_by("id").values(
+            "id", "follower__username", "created_at"
+        )),
+        ("messages", iter_messages(user)),
+        ("archived_messages", iter_archived(user)),
+    ]
+
+
+def iter_messages(user, chunk_size=1000):
+    """
+    The user's visible messages from every database holding messages.
+    Usernames come from the user cache, one lookup per chunk: shards
+    have no user table to join.
+    """
+    for messages in Message.objects.on_shards():
+        rows = messages.filter(
+            Q(sender=user) | Q(receiver=user)
+        ).exclude(deleted_for=user).order_by("id").values(
+            "id", "sender_id", "receiver_id", "content", "image", "audio", "timestamp"
+        ).iterator(chunk_size=chunk_size)
+        while chunk := list(islice(rows, chunk_size)):
+            names = get_many(
+                {row["sender_id"] for row in chunk} | {row["receiver_id"] for row in chunk}
+            )
+            for row in chunk:
+                yield {
+                    "id": row["id"],
+                    "sender__username": names.get(row["sender_id"], {}).get("username", ""),
+                    "receiver__username": names.get(row["receiver_id"], {}).get("username", ""),
+                    **{k: row[k] for k in ("content", "image", "audio", "timestamp")},
+                }
+
+
+def ndjson(rows, chunk_size=1000):
+    """Yield one encoded JSON line per row; memory stays at one chunk."""
+    if hasattr(rows, "iterator"):
+        rows = rows.iterator(chunk_size=chunk_size)
+    for row in rows:
+        yield (json.dumps(row, cls=DjangoJSONEncoder) + "\n").encode("utf-8")
+
+
+# ======================================================
+# ZIP ARCHIVE (STREAMED)
+# ======================================================
+MEDIA_CHUNK = 64 * 1024
+DEFAULT_AVATAR = User._meta.get_field("profile_image").default
+
+
+class _StreamSink(io.RawIOBase):
+    """
+    Write-only file for zipfile that hands bytes straight to the
+    response. It can't seek, so zipfile writes data descriptors
+    instead of rewinding to patch local headers.
+    """
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def writable(self):
+        return True
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def drain(self):
+        chunks, self._chunks = self._chunks, []
+        return chunks
+
+
+def media_files(user):
+    """Storage names of files the user uploaded (not the stock avatar)."""
+    # Not the stock avatar every account starts with
+    if user.profile_image and user.profile_image.name != DEFAULT_AVATAR:
+        yield user.profile_image.name
+    for name in Post.objects.filter(author=user).exclude(image="").exclude(
+        image__isnull=True
+    ).values_list("image", flat=True).iterator(chunk_size=1000):
+        yield name
+    for messages in Message.objects.on_shards():
+        sent = messages.filter(sender=user).exclude(deleted_for=user)
+        for image, audio in sent.values_list("image", "audio").iterator(chunk_size=1000):
+            if image:
+                yield image
+            if audio:
+                yield audio
+
+
+def _read_storage_file(name):
+    with default_storage.open(name, "rb") as fh:
+        while True:
+            chunk = fh.read(MEDIA_CHUNK)
+            if not chunk:
+                break
+            yield chunk
+
+
+def archive_entries(user, chunk_size=1000):
+    for name, queryset in user_datasets(user):
+        yield f"{name}.ndjson", zipfile.ZIP_DEFLATED, ndjson(queryset, chunk_size)
+
+    seen = set()
+    for name in media_files(user):
+        if name in seen or not default_storage.exists(name):
+            continue
+        seen.add(name)
+        # Images and audio are already compressed
+        yield f"media/{name}", zipfile.ZIP_STORED, _read_storage_file(name)
+
+
+def stream_user_archive(user, chunk_size=1000):
+    """
+    Yield a ZIP of the user's data piece by piece. Memory stays at one
+    DB chunk or one 64 KB media read, whatever the account size.
+    """
+    sink = _StreamSink()
+    with zipfile.ZipFile(sink, "w", allowZip64=True) as archive:
+        for arcname, compression, chunks in archive_entries(user, chunk_size):
+            info = zipfile.ZipInfo(arcname, time.localtime()[:6])
+            info.compress_type = compression
+            with archive.open(info, "w", force_zip64=True) as entry:
+                for chunk in chunks:
+                    entry.write(chunk)
+                    yield from sink.drain()
+            yield from sink.drain()
+    # Central directory is written on close
+    yield from sink.drain()
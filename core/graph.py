@@ -0,0 +1,451 @@
+import mmap
+import os
+import struct
+import threading
+import time
+from array import array
+from bisect import bisect_left
+
+from django.conf import settings
+from django.db import connections
+from django.db.models import Max
+from django.db.models.signals import post_delete, post_save
+
+from .models import Follow
+
+
+# ======================================================
+# SORTED-SEQUENCE HELPERS
+# ======================================================
+def contains(seq, value):
+    i = bisect_left(seq, value)
+    return i < len(seq) and seq[i] == value
+
+
+def intersect(a, b):
+    """Sorted intersection of two sorted id sequences."""
+    if len(a) > len(b):
+        a, b = b, a
+    if not a:
+        return []
+    # Very uneven sizes: binary-search the small side into the big one
+    if len(a) * 8 < len(b):
+        out, lo = [], 0
+        for value in a:
+            lo = bisect_left(b, value, lo)
+            if lo == len(b):
+                break
+            if b[lo] == value:
+                out.append(value)
+        return out
+
+    out, i, j = [], 0, 0
+    while i < len(a) and j < len(b):
+        x, y = a[i], b[j]
+        if x == y:
+            out.append(x)
+            i += 1
+            j += 1
+        elif x < y:
+            i += 1
+        else:
+            j += 1
+    return out
+
+
+# ======================================================
+# CSR FOLLOW GRAPH
+# ======================================================
+# Snapshot layout (native byte order): header, then four arrays
+#   magic "FGR2" | n_nodes q | n_edges q
+#   out_indptr q[n+1] | out_indices q[m] | in_indptr q[n+1] | in_indices q[m]
+# Neighbour ids are 64-bit like the BigAutoField keys they hold
+MAGIC = b"FGR2"
+HEADER = struct.Struct("=4sqq")
+
+
+class _CSR:
+    """One direction of the graph: node -> sorted neighbour ids."""
+
+    def __init__(self, indptr, indices):
+        self.indptr = indptr
+        self.indices = indices
+
+    @property
+    def n_nodes(self):
+        return len(self.indptr) - 1
+
+    def neighbours(self, node):
+        if not 0 <= node < self.n_nodes:
+            return self.indices[0:0]
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def degree(self, node):
+        if not 0 <= node < self.n_nodes:
+            return 0
+        return self.indptr[node + 1] - self.indptr[node]
+
+    @classmethod
+    def from_pairs(cls, pairs, n_nodes):
+        """`pairs` sorted by (source, target)."""
+        indptr = array("q", [0]) * (n_nodes + 1)
+        indices = array("q")
+        for source, target in pairs:
+            indices.append(target)
+            indptr[source + 1] += 1
+        for node in range(n_nodes):
+            indptr[node + 1] += indptr[node]
+        return cls(indptr, indices)
+
+
+class _GraphQueries:
+    """Follow queries in terms of sorted following()/followers() lists."""
+
+    def follows(self, a, b):
+        return contains(self.following(a), b)
+
+    def is_mutual(self, a, b):
+        return self.follows(a, b) and self.follows(b, a)
+
+    def mutuals(self, user_id):
+        return intersect(self.following(user_id), self.followers(user_id))
+
+    def follower_overlap(self, a, b):
+        return intersect(self.followers(a), self.followers(b))
+
+    def followed_by_people_you_follow(self, viewer_id, target_id):
+        """Accounts `viewer` follows that also follow `target`."""
+        return intersect(self.following(viewer_id), self.followers(target_id))
+
+    def degree(self, user_id):
+        return len(self.following(user_id)), len(self.followers(user_id))
+
+
+class FollowGraph(_GraphQueries):
+    """
+    Array-backed adjacency for the Follow table, both directions, node
+    ids = user ids. Follows/unfollows since the last build sit in a small
+    per-node overlay that queries merge in; compact() folds it back into
+    the arrays once it grows, in a background thread.
+    """
+
+    def __init__(self, following, followers, source=None):
+        self._out = following
+        self._in = followers
+        self._added = ({}, {})     # (out, in): node -> set of ids
+        self._removed = ({}, {})
+        self._overlay_size = 0
+        self._lock = threading.Lock()
+        # Changes made while compact() builds, replayed onto its result
+        self._since_copy = None
+        self._mmap = source
+        self.loaded_at = time.time()
+
+    # ---------------- building ----------------
+    @classmethod
+    def from_db(cls):
+        started = time.time()
+        edges = Follow.objects.values_list("follower_id", "following_id")
+        bounds = Follow.objects.aggregate(a=Max("follower_id"), b=Max("following_id"))
+        n = max(bounds["a"] or 0, bounds["b"] or 0) + 1
+        following = _CSR.from_pairs(
+            edges.order_by("follower_id", "following_id").iterator(chunk_size=10000), n
+        )
+        followers = _CSR.from_pairs(
+            ((b, a) for a, b in edges.order_by("following_id", "follower_id").iterator(chunk_size=10000)), n
+        )
+        graph = cls(following, followers)
+        # Follows made while it was read may be missing: it is as old as its start
+        graph.loaded_at = started
+        return graph
+
+    def save(self, path):
+        """Write a snapshot atomically (temp file + rename)."""
+        self.compact()
+        tmp = f"{path}.tmp{os.getpid()}"
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(tmp, "wb") as fh:
+            fh.write(HEADER.pack(MAGIC, self._out.n_nodes, len(self._out.indices)))
+            for part in (self._out.indptr, self._out.indices, self._in.indptr, self._in.indices):
+                fh.write(part)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        """
+        Map a snapshot read-only. The arrays are views into the page
+        cache, so every worker that loads the same file shares one copy.
+        """
+        with open(path, "rb") as fh:
+            mm = mmap.mmap(fh.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, m = HEADER.unpack_from(mm, 0)
+        if magic != MAGIC:
+            mm.close()
+            raise ValueError(f"{path} is not a follow-graph snapshot")
+
+        view = memoryview(mm)
+        offset = HEADER.size
+        parts = []
+        for code, count in (("q", n + 1), ("q", m), ("q", n + 1), ("q", m)):
+            size = count * struct.calcsize(code)
+            parts.append(view[offset:offset + size].cast(code))
+            offset += size
+        graph = cls(_CSR(parts[0], parts[1]), _CSR(parts[2], parts[3]), source=mm)
+        graph.loaded_at = os.path.getmtime(path)
+        return graph
+
+    # ---------------- incremental updates ----------------
+    def add_edge(self, follower, following):
+        self._apply(follower, following, add=True)
+
+    def remove_edge(self, follower, following):
+        self._apply(follower, following, add=False)
+
+    def _apply(self, a, b, add):
+        with self._lock:
+            self._record(a, b, add)
+            if self._since_copy is not None:
+                self._since_copy.append((a, b, add))
+            compact = (
+                self._since_copy is None
+                and self._overlay_size > getattr(settings, "FOLLOW_GRAPH_OVERLAY_LIMIT", 50000)
+            )
+        if compact:
+            # An O(nodes + edges) rebuild: not on the request that tipped it over
+            threading.Thread(target=self.compact, daemon=True, name="follow-graph-compact").start()
+
+    def _record(self, a, b, add):
+        for direction, (node, other) in enumerate(((a, b), (b, a))):
+            added = self._added[direction].setdefault(node, set())
+            removed = self._removed[direction].setdefault(node, set())
+            if add:
+                removed.discard(other)
+                added.add(other)
+            else:
+                added.discard(other)
+                removed.add(other)
+        self._overlay_size += 1
+
+    def compact(self):
+        """
+        Rebuild the arrays with the overlay applied (in memory). Queries
+        and follows carry on meanwhile: the build works on a copy of the
+        overlay, and changes made during it are replayed afterwards.
+        """
+        with self._lock:
+            if not self._overlay_size or self._since_copy is not None:
+                return
+            added = tuple({node: set(ids) for node, ids in side.items()} for side in self._added)
+            removed = tuple({node: set(ids) for node, ids in side.items()} for side in self._removed)
+            self._since_copy = []
+
+        try:
+            n = max(
+                [self._out.n_nodes]
+                + [node + 1 for side in added for node in side]
+                + [v + 1 for side in added for ids in side.values() for v in ids]
+            )
+            csrs = []
+            for direction in (0, 1):
+                pairs = (
+                    (node, other)
+                    for node in range(n)
+                    for other in self._merged(direction, node, added, removed)
+                )
+                csrs.append(_CSR.from_pairs(pairs, n))
+        except BaseException:
+            with self._lock:
+                self._since_copy = None
+            raise
+
+        with self._lock:
+            # The old overlay is already in the new arrays, so readers that
+            # see the new arrays with it still get the right answer
+            self._out, self._in = csrs
+            self._mmap = None
+            self._added = ({}, {})
+            self._removed = ({}, {})
+            self._overlay_size = 0
+            for a, b, add in self._since_copy:
+                self._record(a, b, add)
+            self._since_copy = None
+
+    def _merged(self, direction, node, added=None, removed=None):
+        base = (self._out, self._in)[direction].neighbours(node)
+        added = (added or self._added)[direction].get(node)
+        removed = (removed or self._removed)[direction].get(node)
+        if not added and not removed:
+            return base
+        return sorted((set(base) - (removed or set())) | (added or set()))
+
+    # ---------------- queries ----------------
+    # Neighbour lists come back as sorted sequences (array/memoryview
+    # slices when unchanged since the build, lists otherwise).
+    def following(self, user_id):
+        return self._merged(0, user_id)
+
+    def followers(self, user_id):
+        return self._merged(1, user_id)
+
+    def degree_stats(self, top=10):
+        """Summary of follower (in-degree) and following counts."""
+        self.compact()
+        n = self._in.n_nodes
+        indeg = sorted(((self._in.degree(u), u) for u in range(n)), reverse=True)
+        outdeg = [self._out.degree(u) for u in range(n)]
+        nonzero = [d for d, _ in indeg if d]
+
+        def percentile(values, p):
+            if not values:
+                return 0
+            return values[min(len(values) - 1, int(len(values) * p))]
+
+        ascending = nonzero[::-1]
+        return {
+            "edges": len(self._out.indices),
+            "users_with_followers": len(nonzero),
+            "users_following_anyone": sum(1 for d in outdeg if d),
+            "max_followers": indeg[0][0] if indeg else 0,
+            "mean_followers": (sum(nonzero) / len(nonzero)) if nonzero else 0.0,
+            "p50_followers": percentile(ascending, 0.50),
+            "p99_followers": percentile(ascending, 0.99),
+            "max_following": max(outdeg, default=0),
+            "top_followed": [(u, d) for d, u in indeg[:top] if d],
+        }
+
+
+# ======================================================
+# BEFORE THE FIRST BUILD
+# ======================================================
+class DatabaseGraph(_GraphQueries):
+    """
+    The same queries answered from the Follow table's indexes, for a
+    worker whose first graph is still being built.
+    """
+
+    def following(self, user_id):
+        return list(
+            Follow.objects.filter(follower_id=user_id)
+            .order_by("following_id").values_list("following_id", flat=True)
+        )
+
+    def followers(self, user_id):
+        return list(
+            Follow.objects.filter(following_id=user_id)
+            .order_by("follower_id").values_list("follower_id", flat=True)
+        )
+
+    def follows(self, a, b):
+        return Follow.objects.filter(follower_id=a, following_id=b).exists()
+
+
+# ======================================================
+# PROCESS-WIDE INSTANCE
+# ======================================================
+_graph = None
+_graph_lock = threading.Lock()
+# Follow changes seen while a rebuild reads the table, or None
+_missed = None
+_builder = None
+
+
+def snapshot_path():
+    return getattr(settings, "FOLLOW_GRAPH_PATH", os.path.join(settings.BASE_DIR, "var", "follow_graph.bin"))
+
+
+def _max_age():
+    return getattr(settings, "FOLLOW_GRAPH_MAX_AGE", 600)
+
+
+def get_graph():
+    """
+    The worker's graph: the shared snapshot if there is a fresh one,
+    else one built from the database. Re-maps a newer snapshot when one
+    appears (written by `manage.py build_follow_graph`), and rebuilds
+    from the database once the graph is older than FOLLOW_GRAPH_MAX_AGE,
+    so follows made on other workers show up. Builds run in a background
+    thread; until the first one is ready, queries go to the database.
+    """
+    global _graph
+    path = snapshot_path()
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+
+    now = time.time()
+    with _graph_lock:
+        if (
+            mtime is not None and now - mtime <= _max_age()
+            and (_graph is None or mtime > _graph.loaded_at)
+        ):
+            try:
+                _graph = FollowGraph.load(path)
+            except ValueError:
+                # Not a snapshot this version reads: rebuild as if missing
+                pass
+        if _graph is None or now - _graph.loaded_at > _max_age():
+            _start_rebuild()
+        return _graph if _graph is not None else DatabaseGraph()
+
+
+def _start_rebuild():
+    # Called with _graph_lock held
+    global _missed, _builder
+    if _missed is not None:
+        return
+    _missed = []
+    _builder = threading.Thread(target=_rebuild, daemon=True, name="follow-graph-build")
+    _builder.start()
+
+
+def _rebuild():
+    global _graph, _missed
+    graph = None
+    try:
+        graph = FollowGraph.from_db()
+    except Exception:
+        # Keep serving what we have; the next request tries again
+        pass
+    finally:
+        connections.close_all()
+        with _graph_lock:
+            if graph is not None:
+                for follower, following, add in _missed:
+                    graph._apply(follower, following, add)
+                _graph = graph
+            _missed = None
+
+
+def reset_graph():
+    """Drop the worker's graph, once a build in flight has finished."""
+    global _graph
+    builder = _builder
+    if builder is not None:
+        builder.join()
+    with _graph_lock:
+        _graph = None
+
+
+def _changed(follower, following, add):
+    with _graph_lock:
+        graph = _graph
+        if _missed is not None:
+            _missed.append((follower, following, add))
+    if graph is not None:
+        graph._apply(follower, following, add)
+
+
+def _on_follow_saved(sender, instance, created, **kwargs):
+    if created:
+        _changed(instance.follower_id, instance.following_id, True)
+
+
+def _on_follow_deleted(sender, instance, **kwargs):
+    _changed(instance.follower_id, instance.following_id, False)
+
+
+post_save.connect(_on_follow_saved, sender=Follow, dispatch_uid="graph_follow_save")
+post_delete.connect(_on_follow_deleted, sender=Follow, dispatch_uid="graph_follow_delete")
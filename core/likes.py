@@ -0,0 +1,144 @@
+import atexit
+import threading
+from collections import defaultdict
+from functools import partial
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .models import Post, Like, Notification
+from .notifications import notify
+from .ranking import LIKE_WEIGHT, score_bump
+from .versions import bump, post_likes_key
+
+
+# ======================================================
+# LIKE COUNTER BUFFER
+# ======================================================
+# A post's Like rows, counted inside the UPDATE that stores the total
+_like_total = (
+    Like.objects.filter(post=OuterRef("pk")).order_by()
+    .values("post").annotate(n=Count("pk")).values("n")
+)
+
+
+class LikeCounterBuffer:
+    """
+    Collects like/unlike deltas per post and refreshes Post.like_count
+    for the posts that changed in one UPDATE each per flush window,
+    instead of one counter write (or COUNT) per request.
+    """
+
+    def __init__(self, window=None):
+        self._window = window
+        self._deltas = defaultdict(int)
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, "LIKE_FLUSH_INTERVAL", 2.0)
+
+    def add(self, post_id, delta):
+        if not delta:
+            return
+        with self._lock:
+            self._deltas[post_id] += delta
+            # Trailing edge: a quiet worker still writes within a window,
+            # not on its next like or at exit
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self, post_id):
+        with self._lock:
+            return self._deltas.get(post_id, 0)
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            # The deltas are back in the buffer; the next window retries
+            pass
+        finally:
+            connections.close_all()
+
+    def _restore(self, deltas):
+        with self._lock:
+            for post_id, delta in deltas.items():
+                self._deltas[post_id] += delta
+
+    def flush(self):
+        with self._lock:
+            deltas = {pk: d for pk, d in self._deltas.items() if d}
+            self._deltas.clear()
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not deltas:
+            return 0
+
+        try:
+            now = timezone.now()
+            created = dict(
+                Post.objects.filter(pk__in=deltas).values_list("pk", "created_at")
+            )
+            with transaction.atomic():
+                for post_id, delta in deltas.items():
+                    if post_id not in created:
+                        continue
+                    # New ETags only once the count they describe is stored:
+                    # bumped earlier, other workers would tag the old count
+                    # with the new version and answer 304 for it from then on
+                    transaction.on_commit(partial(bump, post_likes_key(post_id)))
+                    # Recounted from the Like rows, not += delta: workers'
+                    # deltas land in any order (an unlike's -1 before its
+                    # like's +1), and a clamped one would skew it for good
+                    Post.objects.filter(pk=post_id).update(
+                        like_count=Coalesce(Subquery(_like_total), 0),
+                        score=F("score") + score_bump(created[post_id], LIKE_WEIGHT * delta, now),
+                    )
+        except Exception:
+            self._restore(deltas)
+            raise
+        return len(deltas)
+
+
+like_buffer = LikeCounterBuffer()
+atexit.register(like_buffer.flush)
+
+
+# ======================================================
+# IDEMPOTENT LIKE / UNLIKE
+# ======================================================
+def set_like(user, post, liked):
+    """
+    Put (user, post) into an explicit liked/unliked state.
+    Repeating the same request is a no-op, so retries and
+    double-clicks never skew the counter.
+    """
+    if liked:
+        _, created = Like.objects.get_or_create(user=user, post=post)
+        delta = 1 if created else 0
+        if created:
+            notify(post.author, Notification.LIKE, user, post)
+    else:
+        deleted, _ = Like.objects.filter(user=user, post=post).delete()
+        delta = -deleted
+
+    # Count against the row we loaded, before add() may flush the buffer.
+    count = like_count(post) + delta
+    like_buffer.add(post.id, delta)
+    return liked, max(count, 0)
+
+
+def like_count(post):
+    """Stored counter plus deltas still waiting in this process's buffer."""
+    return max(post.like_count + like_buffer.pending(post.id), 0)
@@ -0,0 +1,327 @@
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import random
+import struct
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+from channels.testing import WebsocketCommunicator
+
+
+class ConnectionClosed(Exception):
+    pass
+
+
+# ======================================================
+# CLIENTS
+# ======================================================
+# Both transports expose connect() / send(text) / recv() / close(), so
+# the load run doesn't care whether the server is in-process or daphne.
+class CommunicatorClient:
+    """In-process client: talks to the ASGI app directly, no sockets."""
+
+    def __init__(self, application, path, headers):
+        self._comm = WebsocketCommunicator(application, path, headers=headers)
+
+    async def connect(self, timeout=10):
+        connected, _ = await self._comm.connect(timeout=timeout)
+        if not connected:
+            raise ConnectionClosed("handshake refused")
+
+    async def send(self, text):
+        await self._comm.send_to(text_data=text)
+
+    async def recv(self):
+        # No real timeout: on timeout the communicator cancels the app.
+        # Readers are cancelled from outside instead.
+        try:
+            return await self._comm.receive_from(timeout=10 ** 9)
+        except AssertionError:
+            raise ConnectionClosed("server closed the socket")
+
+    async def close(self):
+        await self._comm.disconnect()
+
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+OP_TEXT, OP_CLOSE, OP_PING, OP_PONG = 0x1, 0x8, 0x9, 0xA
+
+
+class RawClient:
+    """
+    Minimal RFC 6455 client over asyncio streams, for a real server
+    (e.g. a local daphne). Text frames only; enough for chat.
+    """
+
+    def __init__(self, url, headers):
+        self._url = urlsplit(url)
+        self._headers = headers
+        self._reader = self._writer = None
+
+    async def connect(self, timeout=10):
+        host = self._url.hostname
+        port = self._url.port or (443 if self._url.scheme == "wss" else 80)
+        self._reader, self._writer = await asyncio.wait_for(
+            asyncio.open_connection(host, port, ssl=self._url.scheme == "wss"), timeout
+        )
+        key = base64.b64encode(os.urandom(16)).decode()
+        lines = [
+            f"GET {self._url.path or '/'} HTTP/1.1",
+            f"Host: {self._url.netloc}",
+            "Upgrade: websocket",
+            "Connection: Upgrade",
+            f"Sec-WebSocket-Key: {key}",
+            "Sec-WebSocket-Version: 13",
+        ]
+        lines += [f"{name.decode()}: {value.decode()}" for name, value in self._headers]
+        self._writer.write(("\r\n".join(lines) + "\r\n\r\n").encode())
+
+        status = await asyncio.wait_for(self._reader.readline(), timeout)
+        response = {}
+        while True:
+            line = (await asyncio.wait_for(self._reader.readline(), timeout)).decode().strip()
+            if not line:
+                break
+            name, _, value = line.partition(":")
+            response[name.strip().lower()] = value.strip()
+
+        expected = base64.b64encode(hashlib.sha1((key + WS_GUID).encode()).digest()).decode()
+        if b" 101 " not in status or response.get("sec-websocket-accept") != expected:
+            self._writer.close()
+            raise ConnectionClosed(f"handshake refused: {status.decode().strip()}")
+
+    def _frame(self, opcode, payload):
+        # Client frames must be masked
+        mask = os.urandom(4)
+        length = len(payload)
+        if length < 126:
+            header = struct.pack("!BB", 0x80 | opcode, 0x80 | length)
+        elif length < 1 << 16:
+            header = struct.pack("!BBH", 0x80 | opcode, 0x80 | 126, length)
+        else:
+            header = struct.pack("!BBQ", 0x80 | opcode, 0x80 | 127, length)
+        masked = bytes(b ^ mask[i % 4] for i, b in enumerate(payload))
+        return header + mask + masked
+
+    async def send(self, text):
+        self._writer.write(self._frame(OP_TEXT, text.encode()))
+        await self._writer.drain()
+
+    async def recv(self):
+        message = b""
+        while True:
+            try:
+                first, second = await self._reader.readexactly(2)
+                length = second & 0x7F
+                if length == 126:
+                    (length,) = struct.unpack("!H", await self._reader.readexactly(2))
+                elif length == 127:
+                    (length,) = struct.unpack("!Q", await self._reader.readexactly(8))
+                payload = await self._reader.readexactly(length)
+            except (asyncio.IncompleteReadError, ConnectionError):
+                raise ConnectionClosed("connection lost")
+
+            opcode = first & 0x0F
+            if opcode == OP_CLOSE:
+                raise ConnectionClosed("server closed the socket")
+            if opcode == OP_PING:
+                self._writer.write(self._frame(OP_PONG, payload))
+                continue
+            if opcode == OP_PONG:
+                continue
+            message += payload
+            if first & 0x80:  # FIN
+                return message.decode()
+
+    async def close(self):
+        if self._writer is None:
+            return
+        try:
+            self._writer.write(self._frame(OP_CLOSE, struct.pack("!H", 1000)))
+            await self._writer.drain()
+        except ConnectionError:
+            pass
+        self._writer.close()
+
+
+# ======================================================
+# MEASUREMENT
+# ======================================================
+def percentile(values, p):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * p))]
+
+
+def rss_bytes(pid=None):
+    """Resident set size of a process (Linux /proc), or None."""
+    try:
+        with open(f"/proc/{pid or 'self'}/status") as fh:
+            for line in fh:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return None
+
+
+class Report:
+    def __init__(self):
+        self.connect_ms = []
+        self.connect_failures = 0
+        self.delivery_ms = []
+        self.sent = 0
+        self.expected = 0
+        self.received = 0
+        self.disconnects = 0
+        self.send_errors = 0
+        self.connected = 0
+        self.rooms = 0
+        self.memory_per_connection = None
+        self.elapsed = 0.0
+
+    @property
+    def dropped(self):
+        return max(0, self.expected - self.received)
+
+    def summary(self):
+        def ms(values, p):
+            value = percentile(values, p)
+            return None if value is None else round(value, 2)
+
+        return {
+            "connected": self.connected,
+            "connect_failures": self.connect_failures,
+            "rooms": self.rooms,
+            "connect_ms": {p: ms(self.connect_ms, q) for p, q in (("p50", .5), ("p99", .99), ("max", 1.0))},
+            "sent": self.sent,
+            "send_errors": self.send_errors,
+            "expected_deliveries": self.expected,
+            "delivered": self.received,
+            "dropped": self.dropped,
+            "delivery_ms": {
+                p: ms(self.delivery_ms, q)
+                for p, q in (("p50", .5), ("p90", .9), ("p99", .99), ("p999", .999), ("max", 1.0))
+            },
+            "throughput_per_s": round(self.received / self.elapsed, 1) if self.elapsed else 0.0,
+            "disconnects": self.disconnects,
+            "memory_per_connection": self.memory_per_connection,
+        }
+
+
+# ======================================================
+# LOAD RUN
+# ======================================================
+def assign(clients, conversations):
+    """
+    Client i -> (conversation, side). Sides alternate, so with
+    clients >= 2 * conversations every room has both participants and
+    extra clients act as further devices of the same users.
+    """
+    return [(i % conversations, (i // conversations) % 2) for i in range(clients)]
+
+
+async def run(open_client, pairs, clients, rate, duration, drain=5.0,
+              connect_concurrency=100, memory=None):
+    """
+    Connect `clients` sockets across the conversations in `pairs`
+    ([(username_a, username_b), ...]), have each send `rate` messages a
+    second for `duration` seconds, and measure what arrives where.
+
+    `open_client(me, other)` returns a connected client. `memory()`
+    returns a byte count to diff around the connect phase (RSS).
+    """
+    report = Report()
+    plan = assign(clients, len(pairs))
+    sockets = [None] * clients
+    gate = asyncio.Semaphore(connect_concurrency)
+
+    memory_before = memory() if memory else None
+
+    async def connect(i):
+        conversation, side = plan[i]
+        pair = pairs[conversation]
+        async with gate:
+            start = time.perf_counter()
+            try:
+                sockets[i] = await open_client(pair[side], pair[1 - side])
+            except Exception:
+                report.connect_failures += 1
+                return
+            report.connect_ms.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(connect(i) for i in range(clients)))
+    live = [i for i in range(clients) if sockets[i] is not None]
+    report.connected = len(live)
+    members = Counter(plan[i][0] for i in live)
+    report.rooms = len(members)
+
+    if memory and report.connected:
+        memory_after = memory()
+        if memory_before is not None and memory_after is not None:
+            report.memory_per_connection = (memory_after - memory_before) // report.connected
+
+    in_flight = {}  # token -> send time
+
+    async def read(i):
+        sock = sockets[i]
+        while True:
+            try:
+                text = await sock.recv()
+            except ConnectionClosed:
+                report.disconnects += 1
+                return
+            arrived = time.perf_counter()
+            body = json.loads(text).get("message") or ""
+            if body.startswith("lt "):
+                sent_at = in_flight.get(body[3:])
+                if sent_at is not None:
+                    report.received += 1
+                    report.delivery_ms.append((arrived - sent_at) * 1000)
+
+    async def write(i, deadline):
+        sock = sockets[i]
+        conversation, side = plan[i]
+        other = pairs[conversation][1 - side]
+        interval = 1 / rate
+        # Spread the first sends so clients don't fire in lockstep
+        due = time.perf_counter() + random.uniform(0, interval)
+        seq = 0
+        while due < deadline:
+            await asyncio.sleep(max(0.0, due - time.perf_counter()))
+            token = f"{i}:{seq}"
+            in_flight[token] = time.perf_counter()
+            report.expected += members[conversation]
+            try:
+                await sock.send(json.dumps({"message": f"lt {token}", "to": other}))
+            except (ConnectionClosed, ConnectionError):
+                report.send_errors += 1
+                return
+            report.sent += 1
+            seq += 1
+            due += interval
+
+    readers = [asyncio.ensure_future(read(i)) for i in live]
+    start = time.perf_counter()
+    if rate > 0:
+        deadline = start + duration
+        await asyncio.gather(*(write(i, deadline) for i in live))
+    else:
+        await asyncio.sleep(duration)
+
+    # Let stragglers arrive; whatever hasn't by then counts as dropped
+    drain_until = time.perf_counter() + drain
+    while report.received < report.expected and time.perf_counter() < drain_until:
+        await asyncio.sleep(0.05)
+    report.elapsed = time.perf_counter() - start
+
+    for reader in readers:
+        reader.cancel()
+    await asyncio.gather(*readers, return_exceptions=True)
+    await asyncio.gather(*(sockets[i].close() for i in live), return_exceptions=True)
+    return report
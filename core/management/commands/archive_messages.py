@@ -0,0 +1,28 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core.retention import archive_old_messages
+
+
+class Command(BaseCommand):
+    help = (
+        "Move messages older than the retention window into compressed "
+        "per-conversation archive segments (run periodically)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-days",
+            type=int,
+            default=None,
+            help=f"Defaults to MESSAGE_RETENTION_DAYS ({settings.MESSAGE_RETENTION_DAYS}).",
+        )
+
+    def handle(self, *args, **options):
+        def progress(low, high, archived, dropped):
+            self.stdout.write(f"  users {low}/{high}: {archived} archived, {dropped} dropped")
+
+        archived, dropped = archive_old_messages(options["older_than_days"], progress)
+        self.stdout.write(self.style.SUCCESS(
+            f"Archived {archived} messages, dropped {dropped} deleted by both users"
+        ))
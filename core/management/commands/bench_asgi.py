@@ -0,0 +1,186 @@
+import asyncio
+import statistics
+import threading
+import time
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand, CommandError
+from django.test import Client
+from django.test.utils import override_settings
+from django.shortcuts import get_object_or_404
+from django.urls import include, path
+
+from core import receipts, versions
+from core.models import Message, User
+
+
+# The chat poll as it was before it went async: sync ORM, and a held
+# long-poll sleeps in its thread. Under ASGI Django runs sync views in
+# one shared thread, so held polls queue behind each other.
+def sync_chat_room(request, username):
+    try:
+        last_id = int(request.GET.get("last_id", 0))
+    except ValueError:
+        last_id = 0
+
+    key = versions.chat_key(request.user.username, username)
+    version = versions.get_version(key)
+    etag = versions.make_etag("chat", version, request.user.id, last_id)
+
+    if versions.etag_matches(request, etag):
+        wait = versions.longpoll_seconds(request)
+        if wait:
+            version = versions.wait_for_change(key, version, wait)
+        new_etag = versions.make_etag("chat", version, request.user.id, last_id)
+        if new_etag == etag:
+            return versions.not_modified(etag)
+        etag = new_etag
+
+    other_user = get_object_or_404(User, username=username)
+    messages = list(
+        Message.objects.conversation(request.user, other_user)
+        .exclude(deleted_for=request.user).filter(id__gt=last_id).order_by("timestamp")
+    )
+    if messages:
+        receipts.mark_read(request.user.id, other_user.id, max(m.id for m in messages))
+    return versions.json_with_etag({
+        "read_up_to": receipts.last_read(other_user.id, request.user.id),
+        "messages": [{"message_id": m.id, "content": m.content} for m in messages],
+    }, etag)
+
+
+urlpatterns = [
+    path("chat/<str:username>/", sync_chat_room),
+    path("", include("social.urls")),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Hold N concurrent chat long-polls against the in-process ASGI app "
+        "and compare the async view with the sync one it replaced: wall "
+        "time, latency and peak worker threads. Expect no difference in "
+        "threads: Django gives each ASGI request a thread for its sync "
+        "calls, and the cache and session lookups of the async view are "
+        "sync underneath."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User to poll as.")
+        parser.add_argument("other", help="Chat partner.")
+        parser.add_argument("--concurrency", type=int, default=20)
+        parser.add_argument("--wait", type=float, default=1.0,
+                            help="Long-poll ?wait= seconds held per request.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}")
+
+        client = Client()
+        client.force_login(user)
+        cookie = f"{settings.SESSION_COOKIE_NAME}={client.cookies[settings.SESSION_COOKIE_NAME].value}"
+        chat_path = f"/chat/{options['other']}/"
+
+        # Poll past the newest message so every held request ends in a 304
+        last_id = urlencode({"last_id": 10 ** 12})
+        app = get_asgi_application()
+        with override_settings(VERSIONS_SHARED=True):
+            first = asyncio.run(self._request(app, chat_path, last_id, cookie))
+        if first[0] != 200:
+            raise CommandError(f"{chat_path} answered HTTP {first[0]}")
+        etag = first[1]
+
+        self.stdout.write(
+            f"{'mode':<8}{'requests':>10}{'wall s':>9}{'p50 ms':>9}"
+            f"{'max ms':>9}{'threads':>9}{'statuses':>16}"
+        )
+        for mode, urlconf in (("sync", __name__), ("async", settings.ROOT_URLCONF)):
+            # One process: its local cache is what every request sees
+            with override_settings(ROOT_URLCONF=urlconf, VERSIONS_SHARED=True):
+                self._run(mode, app, chat_path, f"{last_id}&wait={options['wait']}", cookie, etag, options)
+
+    def _run(self, mode, app, chat_path, query, cookie, etag, options):
+        peak = threading.active_count()
+        done = threading.Event()
+
+        def sample():
+            nonlocal peak
+            while not done.is_set():
+                peak = max(peak, threading.active_count())
+                time.sleep(0.01)
+
+        sampler = threading.Thread(target=sample, daemon=True)
+        baseline = threading.active_count()
+        sampler.start()
+
+        async def burst():
+            return await asyncio.gather(*(
+                self._request(app, chat_path, query, cookie, etag)
+                for _ in range(options["concurrency"])
+            ))
+
+        start = time.perf_counter()
+        results = asyncio.run(burst())
+        wall = time.perf_counter() - start
+        done.set()
+        sampler.join()
+
+        latencies = [r[2] for r in results]
+        statuses = sorted({r[0] for r in results})
+        self.stdout.write(
+            f"{mode:<8}{len(results):>10}{wall:>9.2f}"
+            f"{statistics.median(latencies):>9.0f}{max(latencies):>9.0f}"
+            f"{peak - baseline - 1:>9}{','.join(map(str, statuses)):>16}"
+        )
+
+    async def _request(self, app, chat_path, query, cookie, etag=None):
+        headers = [
+            (b"host", b"localhost"),
+            (b"cookie", cookie.encode()),
+            (b"x-requested-with", b"XMLHttpRequest"),
+        ]
+        if etag:
+            headers.append((b"if-none-match", etag.encode()))
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": "GET",
+            "scheme": "http",
+            "path": chat_path,
+            "raw_path": chat_path.encode(),
+            "query_string": query.encode(),
+            "root_path": "",
+            "headers": headers,
+            "client": ("127.0.0.1", 0),
+            "server": ("localhost", 80),
+        }
+        disconnected = asyncio.Event()
+        sent_body = False
+
+        async def receive():
+            nonlocal sent_body
+            if not sent_body:
+                sent_body = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            await disconnected.wait()
+            return {"type": "http.disconnect"}
+
+        status, response_etag = None, None
+
+        async def send(message):
+            nonlocal status, response_etag
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                for name, value in message["headers"]:
+                    if name.lower() == b"etag":
+                        response_etag = value.decode()
+
+        start = time.perf_counter()
+        await app(scope, receive, send)
+        disconnected.set()
+        return status, response_etag, (time.perf_counter() - start) * 1000
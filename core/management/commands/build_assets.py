@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from core.assets import BUNDLES, build, static_dir
+
+
+class Command(BaseCommand):
+    help = "Bundle and minify static/src CSS/JS into static/dist (run before collectstatic)."
+
+    def handle(self, *args, **options):
+        root = static_dir()
+        for name, size in build().items():
+            source_size = sum((root / src).stat().st_size for src in BUNDLES[name])
+            self.stdout.write(f"{name}: {source_size} -> {size} bytes")
@@ -0,0 +1,32 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core.graph import FollowGraph, snapshot_path
+
+
+class Command(BaseCommand):
+    help = (
+        "Build the follow graph from the database and write the snapshot "
+        "that web workers mmap (run from cron more often than FOLLOW_GRAPH_MAX_AGE)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--path", help="Defaults to FOLLOW_GRAPH_PATH.")
+        parser.add_argument("--stats", action="store_true", help="Print degree statistics.")
+
+    def handle(self, *args, **options):
+        path = options["path"] or snapshot_path()
+
+        start = time.perf_counter()
+        graph = FollowGraph.from_db()
+        built = time.perf_counter() - start
+        graph.save(path)
+
+        stats = graph.degree_stats()
+        self.stdout.write(self.style.SUCCESS(
+            f"{stats['edges']} follows -> {path} (built in {built:.2f}s)"
+        ))
+        if options["stats"]:
+            for key, value in stats.items():
+                self.stdout.write(f"  {key}: {value}")
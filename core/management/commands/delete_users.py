@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from core.bulk import delete_user_data
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete users and all their content in small batched transactions "
+        "instead of one long cascading delete."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="+")
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(username__in=options["usernames"]))
+        missing = set(options["usernames"]) - {u.username for u in users}
+        if missing:
+            raise CommandError(f"Unknown users: {', '.join(sorted(missing))}")
+
+        for user in users:
+            if options["dry_run"]:
+                self.stdout.write(f"Would delete {user.username}")
+                continue
+
+            self.stdout.write(f"Deleting {user.username}...")
+            totals = delete_user_data(
+                user,
+                batch_size=options["batch_size"],
+                progress=lambda label, done: self.stdout.write(f"  {label}: {done}"),
+            )
+            summary = ", ".join(f"{n} {label}" for label, n in totals.items() if n)
+            self.stdout.write(self.style.SUCCESS(
+                f"Deleted {user.username} ({summary or 'no content'})"
+            ))
@@ -0,0 +1,46 @@
+import sys
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.export import ndjson, stream_user_archive, user_datasets
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream a user's posts, comments, likes, follows and messages as NDJSON, "
+        "or as a ZIP archive including their uploaded media."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--output", "-o", help="File to write (default: stdout).")
+        parser.add_argument("--format", choices=["ndjson", "zip"], default="ndjson")
+        parser.add_argument("--chunk-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}")
+
+        out = open(options["output"], "wb") if options["output"] else sys.stdout.buffer
+        try:
+            if options["format"] == "zip":
+                written = 0
+                for chunk in stream_user_archive(user, options["chunk_size"]):
+                    out.write(chunk)
+                    written += len(chunk)
+                self.stderr.write(f"  archive: {written} bytes")
+                return
+
+            for name, queryset in user_datasets(user):
+                out.write(f'{{"dataset": "{name}"}}\n'.encode())
+                rows = 0
+                for line in ndjson(queryset, options["chunk_size"]):
+                    out.write(line)
+                    rows += 1
+                self.stderr.write(f"  {name}: {rows}")
+        finally:
+            if options["output"]:
+                out.close()
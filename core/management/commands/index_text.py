@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+
+from core.models import Comment, Post
+from core.textindex import comment_source, index_sources, post_source
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the hashtag/mention index from existing captions and "
+        "comments, in primary-key batches. Sends no mention notifications."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, **options):
+        size = options["batch_size"]
+
+        for label, queryset, fields, source in (
+            ("posts", Post.objects.exclude(caption=""), ("id", "author_id", "caption", "created_at"), post_source),
+            ("comments", Comment.objects.all(), ("id", "post_id", "user_id", "text", "created_at"), comment_source),
+        ):
+            done = 0
+            last_pk = 0
+            while True:
+                batch = list(
+                    queryset.filter(pk__gt=last_pk).order_by("pk").only(*fields)[:size]
+                )
+                if not batch:
+                    break
+                sources = {}
+                for obj in batch:
+                    sources.update(source(obj))
+                index_sources(sources, notify_mentions=False)
+                done += len(batch)
+                last_pk = batch[-1].pk
+                self.stdout.write(f"  {label}: {done}")
+            self.stdout.write(self.style.SUCCESS(f"Indexed {done} {label}"))
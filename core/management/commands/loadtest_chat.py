@@ -0,0 +1,185 @@
+import asyncio
+import json
+from importlib import import_module
+
+from django.conf import settings
+from django.contrib.auth import BACKEND_SESSION_KEY, HASH_SESSION_KEY, SESSION_KEY
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import override_settings
+from django.urls import re_path
+
+from core import loadtest
+from core.consumers import ChatConsumer
+from core.models import User
+
+
+PREFIX = "loadtest_"
+
+
+class LayerOnlyChatConsumer(ChatConsumer):
+    """ChatConsumer without the database write: measures the channel layer alone."""
+
+    def save_message(self, sender, receiver, content):
+        pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Open N chat WebSockets across M conversations, send at a fixed rate "
+        "and report connect latency, delivery latency percentiles, dropped "
+        "messages and memory per connection. In-process (WebsocketCommunicator "
+        "+ in-memory channel layer) by default; --url drives a running server."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--clients", type=int, default=1000)
+        parser.add_argument("--conversations", type=int, default=250)
+        parser.add_argument("--rate", type=float, default=0.2,
+                            help="Messages per second per client (0 = connect only).")
+        parser.add_argument("--duration", type=float, default=10.0)
+        parser.add_argument("--drain", type=float, default=5.0,
+                            help="Seconds to wait for deliveries after sending stops.")
+        parser.add_argument("--connect-concurrency", type=int, default=100)
+        parser.add_argument("--url",
+                            help="Base ws:// URL of a running server, e.g. ws://127.0.0.1:8000. "
+                                 "Start it with CHANNEL_LAYER=memory to stay offline.")
+        parser.add_argument("--server-pid", type=int,
+                            help="With --url: measure this process's RSS per connection.")
+        parser.add_argument("--capacity", type=int, default=100,
+                            help="In-process: per-channel capacity of the in-memory layer.")
+        parser.add_argument("--save", action="store_true",
+                            help="In-process: also write each message to the database.")
+        parser.add_argument("--json", action="store_true")
+        parser.add_argument("--keep-users", action="store_true")
+
+    def handle(self, *args, **options):
+        if options["clients"] < 1 or options["conversations"] < 1:
+            raise CommandError("--clients and --conversations must be positive")
+        if options["rate"] < 0:
+            raise CommandError("--rate must be >= 0")
+
+        pairs = [(f"{PREFIX}{k}a", f"{PREFIX}{k}b") for k in range(options["conversations"])]
+        cookies = self._login([name for pair in pairs for name in pair])
+        try:
+            if options["url"]:
+                report = self._run_remote(pairs, cookies, options)
+            else:
+                report = self._run_in_process(pairs, cookies, options)
+        finally:
+            if not options["keep_users"]:
+                self._cleanup(cookies)
+
+        summary = report.summary()
+        if options["json"]:
+            self.stdout.write(json.dumps(summary, indent=2))
+        else:
+            self._print(summary, options)
+
+    # ---------------- setup ----------------
+    def _login(self, usernames):
+        """Create the load-test users and a session for each: {username: session key}."""
+        password = make_password(None)
+        User.objects.bulk_create(
+            [User(username=name, password=password) for name in usernames],
+            ignore_conflicts=True, batch_size=500,
+        )
+        engine = import_module(settings.SESSION_ENGINE)
+        backend = settings.AUTHENTICATION_BACKENDS[0]
+        sessions = {}
+        for user in User.objects.filter(username__in=usernames).iterator():
+            store = engine.SessionStore()
+            store[SESSION_KEY] = user._meta.pk.value_to_string(user)
+            store[BACKEND_SESSION_KEY] = backend
+            store[HASH_SESSION_KEY] = user.get_session_auth_hash()
+            store.create()
+            sessions[user.username] = store.session_key
+        return sessions
+
+    def _cleanup(self, sessions):
+        engine = import_module(settings.SESSION_ENGINE)
+        for key in sessions.values():
+            engine.SessionStore(key).delete()
+        # Messages go with the users (CASCADE)
+        User.objects.filter(username__in=list(sessions)).delete()
+
+    def _headers(self, sessions, username):
+        return [(b"cookie", f"{settings.SESSION_COOKIE_NAME}={sessions[username]}".encode())]
+
+    # ---------------- runs ----------------
+    def _run_in_process(self, pairs, sessions, options):
+        from channels.routing import URLRouter
+        from core.wsauth import CachedAuthMiddlewareStack
+
+        consumer = ChatConsumer if options["save"] else LayerOnlyChatConsumer
+        application = CachedAuthMiddlewareStack(URLRouter([
+            re_path(r"ws/chat/(?P<username>\w+)/$", consumer.as_asgi()),
+        ]))
+
+        async def open_client(me, other):
+            client = loadtest.CommunicatorClient(
+                application, f"/ws/chat/{other}/", self._headers(sessions, me)
+            )
+            await client.connect()
+            return client
+
+        layer = {
+            "BACKEND": "channels.layers.InMemoryChannelLayer",
+            "CONFIG": {"capacity": options["capacity"]},
+        }
+        with override_settings(CHANNEL_LAYERS={"default": layer}):
+            return asyncio.run(self._run(open_client, pairs, options, loadtest.rss_bytes))
+
+    def _run_remote(self, pairs, sessions, options):
+        base = options["url"].rstrip("/")
+        if not base.startswith(("ws://", "wss://")):
+            raise CommandError("--url must start with ws:// or wss://")
+
+        async def open_client(me, other):
+            client = loadtest.RawClient(f"{base}/ws/chat/{other}/", self._headers(sessions, me))
+            await client.connect()
+            return client
+
+        memory = None
+        if options["server_pid"]:
+            memory = lambda: loadtest.rss_bytes(options["server_pid"])  # noqa: E731
+        return asyncio.run(self._run(open_client, pairs, options, memory))
+
+    async def _run(self, open_client, pairs, options, memory):
+        return await loadtest.run(
+            open_client,
+            pairs,
+            clients=options["clients"],
+            rate=options["rate"],
+            duration=options["duration"],
+            drain=options["drain"],
+            connect_concurrency=options["connect_concurrency"],
+            memory=memory,
+        )
+
+    # ---------------- output ----------------
+    def _print(self, summary, options):
+        def row(label, values):
+            cells = "".join(f"{k} {'-' if v is None else v:>9}   " for k, v in values.items())
+            self.stdout.write(f"{label:<16}{cells}")
+
+        mode = options["url"] or f"in-process (capacity {options['capacity']}" + (
+            ", saving)" if options["save"] else ", layer only)"
+        )
+        self.stdout.write(f"mode            {mode}")
+        self.stdout.write(
+            f"clients         {summary['connected']} connected, "
+            f"{summary['connect_failures']} failed, {summary['rooms']} rooms"
+        )
+        row("connect ms", summary["connect_ms"])
+        self.stdout.write(
+            f"messages        {summary['sent']} sent, {summary['delivered']}/"
+            f"{summary['expected_deliveries']} delivered, {summary['dropped']} dropped, "
+            f"{summary['send_errors']} send errors, {summary['disconnects']} disconnects"
+        )
+        row("delivery ms", summary["delivery_ms"])
+        self.stdout.write(f"throughput      {summary['throughput_per_s']} deliveries/s")
+        per_conn = summary["memory_per_connection"]
+        self.stdout.write(
+            "memory/conn     " + ("n/a" if per_conn is None else f"{per_conn / 1024:.1f} KiB")
+        )
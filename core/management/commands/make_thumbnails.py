@@ -0,0 +1,43 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from core.models import Post
+from core.thumbnails import make_thumbnail
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill grid thumbnails for posts that have an image but no "
+        "thumbnail yet, in primary-key batches. Images that failed to "
+        "decode before are skipped unless --retry-failed."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=200)
+        parser.add_argument("--retry-failed", action="store_true")
+
+    def handle(self, *args, **options):
+        size = options["batch_size"]
+        queryset = Post.objects.exclude(Q(image="") | Q(image__isnull=True)).filter(
+            Q(thumbnail="") | Q(thumbnail__isnull=True)
+        )
+        if not options["retry_failed"]:
+            queryset = queryset.filter(thumbnail_failed=False)
+
+        made = failed = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                queryset.filter(pk__gt=last_pk).order_by("pk")
+                .only("id", "image", "thumbnail", "thumbnail_failed")[:size]
+            )
+            if not batch:
+                break
+            for post in batch:
+                if make_thumbnail(post):
+                    made += 1
+                else:
+                    failed += 1
+            last_pk = batch[-1].pk
+            self.stdout.write(f"  posts: {made + failed}")
+        self.stdout.write(self.style.SUCCESS(f"Made {made} thumbnails ({failed} unreadable images skipped)"))
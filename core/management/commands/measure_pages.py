@@ -0,0 +1,85 @@
+import gzip
+import re
+import statistics
+import time
+from urllib.parse import urlparse
+
+from django.conf import settings
+from django.contrib.staticfiles import finders
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from core.models import User
+
+
+INLINE_BLOCK = re.compile(r"<(style|script)(?![^>]*\bsrc=)[^>]*>(.*?)</\1>", re.S | re.I)
+EXTERNAL_REF = re.compile(r"""(?:href|src)=["'](https?://[^"']+)["']""", re.I)
+STATIC_REF = re.compile(r"""(?:href|src)=["'](%s[^"']+)["']""" % re.escape(settings.STATIC_URL))
+
+
+class Command(BaseCommand):
+    help = (
+        "Render the main pages as a user and report HTML size, inline CSS/JS "
+        "bytes, third-party hosts, static bytes, SQL queries and render time."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("username", help="User to render the pages as.")
+        parser.add_argument("--other", help="Chat partner / profile to open.")
+        parser.add_argument("--runs", type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"No user {options['username']!r}")
+        other = options["other"] or user.username
+
+        client = Client(SERVER_NAME="localhost", raise_request_exception=False)
+        client.force_login(user)
+
+        xhr = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+        pages = [
+            ("/feed/", {}),
+            (f"/chat/{other}/", {}),
+            (f"/chat/{other}/?last_id=0", xhr),  # one chat poll
+            (f"/profile/{other}/", {}),
+            ("/search/?q=a", {}),
+        ]
+        header = (
+            f"{'page':<28}{'html':>9}{'gzip':>9}{'inline':>9}"
+            f"{'static':>10}{'3rd-party':>11}{'queries':>9}{'ms p50':>9}"
+        )
+        self.stdout.write(header)
+
+        for page, headers in pages:
+            timings = []
+            for _ in range(options["runs"]):
+                start = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    response = client.get(page, **headers)
+                timings.append((time.perf_counter() - start) * 1000)
+            if response.status_code != 200:
+                self.stdout.write(f"{page:<28}HTTP {response.status_code}")
+                continue
+
+            html = response.content
+            text = html.decode("utf-8", "replace")
+            inline = sum(len(m.group(2).encode()) for m in INLINE_BLOCK.finditer(text))
+            hosts = {urlparse(u).netloc for u in EXTERNAL_REF.findall(text)}
+            static_bytes = sum(self._static_size(u) for u in set(STATIC_REF.findall(text)))
+
+            self.stdout.write(
+                f"{page:<28}{len(html):>9}{len(gzip.compress(html)):>9}{inline:>9}"
+                f"{static_bytes:>10}{len(hosts):>11}{len(queries):>9}"
+                f"{statistics.median(timings):>9.2f}"
+            )
+
+    def _static_size(self, url):
+        path = finders.find(url[len(settings.STATIC_URL):].split("?")[0])
+        if not path:
+            return 0
+        with open(path, "rb") as fh:
+            return len(gzip.compress(fh.read()))
@@ -0,0 +1,134 @@
+import json
+import os
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+
+# Runs in a fresh interpreter so nothing is already imported or cached
+PROBE = r"""
+import json, os, time
+os.environ["WARM_UP_ON_START"] = "False"
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", {settings_module!r})
+timings = {{}}
+
+t = time.perf_counter()
+import django
+from django.apps.config import AppConfig
+timings["import django"] = time.perf_counter() - t
+
+# Time each ready() inside the one django.setup() call, not a second run
+create = AppConfig.create.__func__
+
+def timed_create(cls, entry):
+    config = create(cls, entry)
+    ready = config.ready
+
+    def timed_ready():
+        t = time.perf_counter()
+        ready()
+        timings["  ready:" + config.label] = time.perf_counter() - t
+
+    config.ready = timed_ready
+    return config
+
+AppConfig.create = classmethod(timed_create)
+
+t = time.perf_counter()
+django.setup(set_prefix=False)
+timings["django.setup"] = time.perf_counter() - t
+
+t = time.perf_counter()
+import {entrypoint}
+timings["import {entrypoint}"] = time.perf_counter() - t
+
+from core.warmup import warm_up
+for step, seconds in warm_up(websocket={websocket}).items():
+    timings["warm_up:" + step] = seconds
+
+print("STARTUP-TIMINGS " + json.dumps(timings))
+"""
+
+
+class Command(BaseCommand):
+    help = (
+        "Profile worker cold start: per-module import time (python -X importtime) "
+        "and time spent in django.setup() (with each AppConfig.ready() it ran) "
+        "and warm-up steps."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--entrypoint",
+            choices=["asgi", "wsgi"],
+            default="asgi",
+            help="Which server entrypoint to import.",
+        )
+        parser.add_argument("--top", type=int, default=25, help="Modules to list.")
+        parser.add_argument(
+            "--group",
+            action="store_true",
+            help="Group import time by top-level package instead of module.",
+        )
+
+    def handle(self, *args, **options):
+        entrypoint = f"social.{options['entrypoint']}"
+        code = PROBE.format(
+            settings_module=os.environ.get("DJANGO_SETTINGS_MODULE", "social.settings"),
+            entrypoint=entrypoint,
+            websocket=options["entrypoint"] == "asgi",
+        )
+        proc = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", code],
+            cwd=settings.BASE_DIR,
+            capture_output=True,
+            text=True,
+        )
+        if proc.returncode != 0:
+            self.stderr.write(proc.stderr[-4000:])
+            return
+
+        self._report_imports(proc.stderr, options["top"], options["group"])
+        self._report_timings(proc.stdout)
+
+    def _report_imports(self, stderr, top, group):
+        # "import time: self [us] | cumulative | imported package"
+        self_us = defaultdict(int)
+        cumulative = {}
+        for line in stderr.splitlines():
+            if not line.startswith("import time:") or "self [us]" in line:
+                continue
+            own, cum, name = line[len("import time:"):].split("|")
+            module = name.strip()
+            key = module.split(".")[0] if group else module
+            self_us[key] += int(own)
+            if not group:
+                cumulative[key] = int(cum)
+
+        total = sum(self_us.values())
+        ranked = sorted(self_us.items(), key=lambda kv: kv[1], reverse=True)[:top]
+
+        self.stdout.write(f"Imports: {len(self_us)} {'packages' if group else 'modules'}, "
+                          f"{total / 1000:.1f} ms total self time")
+        header = f"{'self ms':>9}  {'cum ms':>9}  module"
+        self.stdout.write(header)
+        for name, own in ranked:
+            cum = cumulative.get(name)
+            cum_text = f"{cum / 1000:9.1f}" if cum is not None else " " * 9
+            self.stdout.write(f"{own / 1000:9.1f}  {cum_text}  {name}")
+
+    def _report_timings(self, stdout):
+        for line in stdout.splitlines():
+            if line.startswith("STARTUP-TIMINGS "):
+                timings = json.loads(line[len("STARTUP-TIMINGS "):])
+                break
+        else:
+            return
+
+        self.stdout.write("")
+        self.stdout.write(f"{'ms':>9}  phase")
+        for phase, seconds in timings.items():
+            self.stdout.write(f"{seconds * 1000:9.1f}  {phase}")
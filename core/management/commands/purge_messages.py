@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.bulk import batched_delete
+from core.models import Message
+
+
+class Command(BaseCommand):
+    help = "Permanently delete messages older than N days, in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--older-than-days", type=int, required=True)
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options["older_than_days"])
+        # Every database holding messages, shards included
+        olds = [messages.filter(timestamp__lt=cutoff) for messages in Message.objects.on_shards()]
+
+        if options["dry_run"]:
+            total = sum(old.count() for old in olds)
+            self.stdout.write(f"Would delete {total} messages older than {cutoff:%Y-%m-%d}")
+            return
+
+        done = 0
+        for old in olds:
+            done += batched_delete(
+                old,
+                batch_size=options["batch_size"],
+                progress=lambda n, db=old.db: self.stdout.write(f"  {db}: deleted {n}"),
+            )
+        self.stdout.write(self.style.SUCCESS(f"Purged {done} messages"))
@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from core.uploads import purge_stale
+
+
+class Command(BaseCommand):
+    help = "Delete expired chunked uploads and their partial files."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--older-than-hours", type=int,
+            help="Defaults to CHUNKED_UPLOAD_EXPIRY_HOURS.",
+        )
+
+    def handle(self, *args, **options):
+        removed = purge_stale(options["older_than_hours"])
+        self.stdout.write(self.style.SUCCESS(f"Removed {removed} uploads"))
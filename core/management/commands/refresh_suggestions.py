@@ -0,0 +1,35 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from core.models import User
+from core.suggestions import refresh_suggestions
+
+
+class Command(BaseCommand):
+    help = "Precompute and cache \"who to follow\" suggestions for users."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--active-days",
+            type=int,
+            default=30,
+            help="Only refresh users who logged in within this many days (0 = all).",
+        )
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        users = User.objects.filter(is_active=True)
+        if options["active_days"]:
+            since = timezone.now() - timedelta(days=options["active_days"])
+            users = users.filter(last_login__gte=since)
+
+        done = 0
+        for user_id in users.values_list("id", flat=True).iterator(
+            chunk_size=options["chunk_size"]
+        ):
+            refresh_suggestions(user_id)
+            done += 1
+
+        self.stdout.write(self.style.SUCCESS(f"Refreshed suggestions for {done} users"))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from core.ranking import rescore
+
+
+class Command(BaseCommand):
+    help = "Re-decay feed ranking scores for recent posts (run periodically)."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=2000)
+
+    def handle(self, *args, **options):
+        done = rescore(chunk_size=options["chunk_size"])
+        self.stdout.write(self.style.SUCCESS(f"Rescored {done} posts"))
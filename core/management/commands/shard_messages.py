@@ -0,0 +1,65 @@
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+
+from core.models import Message
+from core.shards import (
+    ShardConflict, message_databases, misplaced_conversations, move_conversation,
+    prepare_shard, shard_aliases,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Create the message tables on every MESSAGE_SHARDS database, then "
+        "move each conversation to the shard it hashes to: from the primary "
+        "when sharding is first enabled, between shards after one is added. "
+        "Stop chat writes while it runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=500)
+        parser.add_argument("--dry-run", action="store_true")
+
+    def handle(self, *args, **options):
+        aliases = shard_aliases()
+        if not aliases:
+            raise CommandError("MESSAGE_SHARDS is empty: messages are not sharded")
+
+        if not options["dry_run"]:
+            for alias in aliases:
+                call_command("migrate", "core", database=alias, verbosity=0)
+                prepare_shard(alias)
+                self.stdout.write(f"  {alias}: ready")
+
+        moved = conversations = 0
+        conflicts = []
+        for source in message_databases():
+            if Message._meta.db_table not in connections[source].introspection.table_names():
+                continue  # a new shard, on a dry run
+            for low, high, target in misplaced_conversations(source):
+                conversations += 1
+                if options["dry_run"]:
+                    self.stdout.write(f"  {low}/{high}: {source} -> {target}")
+                    continue
+                try:
+                    n = move_conversation(low, high, source, target, options["batch_size"])
+                except ShardConflict as e:
+                    # Left where it is for someone to look at; the rest still move
+                    conflicts.append(str(e))
+                    self.stderr.write(f"  {e}")
+                    continue
+                moved += n
+                self.stdout.write(f"  {low}/{high}: {n} messages {source} -> {target}")
+
+        if options["dry_run"]:
+            self.stdout.write(f"Would move {conversations} conversations")
+            return
+        if conflicts:
+            raise CommandError(
+                f"Moved {moved} messages; {len(conflicts)} of {conversations} "
+                f"conversations conflict with their target and were not moved"
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f"Moved {moved} messages in {conversations} conversations"
+        ))
@@ -0,0 +1,25 @@
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_like_count(apps, schema_editor):
+    Post = apps.get_model("core", "Post")
+    posts = Post.objects.annotate(n=Count("likes")).filter(n__gt=0)
+    for post in posts.iterator(chunk_size=500):
+        Post.objects.filter(pk=post.pk).update(like_count=post.n)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_remove_message_deleted_for_everyone_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='like_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+    ]
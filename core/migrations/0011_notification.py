@@ -0,0 +1,35 @@
+# Generated by Django 5.2.5 on 2026-10-19 06:54
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_post_like_count'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Notification',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('verb', models.CharField(choices=[('like', 'liked your post'), ('comment', 'commented on your post'), ('follow', 'started following you')], max_length=16)),
+                ('target_key', models.CharField(max_length=32)),
+                ('bucket', models.DateTimeField()),
+                ('actor_count', models.PositiveIntegerField(default=0)),
+                ('actors', models.JSONField(default=list)),
+                ('read', models.BooleanField(default=False)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('post', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to='core.post')),
+                ('recipient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='notifications', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['-id'],
+                'indexes': [models.Index(fields=['recipient', 'read'], name='core_notifi_recipie_10fe77_idx')],
+                'unique_together': {('recipient', 'verb', 'target_key', 'bucket')},
+            },
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail',
+            field=models.ImageField(blank=True, null=True, upload_to='posts/thumbs/'),
+        ),
+    ]
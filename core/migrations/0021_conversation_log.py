@@ -0,0 +1,83 @@
+# Generated by Django 5.2.5 on 2026-10-19 07:46
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def backfill_sequences(apps, schema_editor):
+    """Number existing messages per conversation in id order, one "new" event each."""
+    db = schema_editor.connection.alias
+    Message = apps.get_model("core", "Message")
+    Conversation = apps.get_model("core", "Conversation")
+    ConversationEvent = apps.get_model("core", "ConversationEvent")
+
+    messages = Message.objects.using(db)
+    pairs = {
+        tuple(sorted(pair))
+        for pair in messages.values_list("sender_id", "receiver_id").distinct().iterator()
+    }
+    for low, high in sorted(pairs):
+        ids = list(messages.filter(
+            Q(sender_id=low, receiver_id=high) | Q(sender_id=high, receiver_id=low)
+        ).order_by("id").values_list("id", flat=True))
+        conversation = Conversation.objects.using(db).create(
+            user_low_id=low, user_high_id=high, last_seq=len(ids)
+        )
+        messages.bulk_update(
+            [Message(id=i, seq=seq) for seq, i in enumerate(ids, 1)], ["seq"], batch_size=500
+        )
+        ConversationEvent.objects.using(db).bulk_create([
+            ConversationEvent(conversation=conversation, seq=seq, kind="new", message_id=i)
+            for seq, i in enumerate(ids, 1)
+        ], batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_message_shards'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='message',
+            name='seq',
+            field=models.PositiveBigIntegerField(blank=True, null=True),
+        ),
+        migrations.CreateModel(
+            name='Conversation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('last_seq', models.PositiveBigIntegerField(default=0)),
+                ('user_high', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('user_low', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ConversationEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('seq', models.PositiveBigIntegerField()),
+                ('kind', models.CharField(choices=[('new', 'new message'), ('deleted_for_me', 'deleted for me'), ('deleted_for_everyone', 'deleted for everyone'), ('read', 'read up to')], max_length=24)),
+                ('message_seq', models.PositiveBigIntegerField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('actor', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('conversation', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='events', to='core.conversation')),
+                ('message', models.ForeignKey(db_constraint=False, null=True, on_delete=django.db.models.deletion.DO_NOTHING, related_name='+', to='core.message')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='conversation',
+            constraint=models.UniqueConstraint(fields=('user_low', 'user_high'), name='core_conversation_pair'),
+        ),
+        migrations.AddConstraint(
+            model_name='conversationevent',
+            constraint=models.UniqueConstraint(fields=('conversation', 'seq'), name='core_convevent_seq'),
+        ),
+        # Hinted as a message migration so it also runs on message shards
+        migrations.RunPython(
+            backfill_sequences, migrations.RunPython.noop, hints={"model_name": "message"}
+        ),
+    ]
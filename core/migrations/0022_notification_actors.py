@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:11
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def seed_actors(apps, schema_editor):
+    """The actors existing rows still list: the best record of who was counted."""
+    db = schema_editor.connection.alias
+    Notification = apps.get_model("core", "Notification")
+    NotificationActor = apps.get_model("core", "NotificationActor")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+
+    users = set(User.objects.using(db).values_list("id", flat=True))
+    rows = (
+        NotificationActor(notification_id=pk, actor_id=actor)
+        for pk, actors in Notification.objects.using(db).values_list("id", "actors").iterator()
+        for actor in set(actors) & users
+    )
+    NotificationActor.objects.using(db).bulk_create(rows, batch_size=500, ignore_conflicts=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_conversation_log'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationActor',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('actor', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+                ('notification', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.notification')),
+            ],
+            options={
+                'unique_together': {('notification', 'actor')},
+            },
+        ),
+        migrations.RunPython(seed_actors, migrations.RunPython.noop),
+    ]
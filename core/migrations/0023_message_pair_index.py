@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:21
+
+import django.db.models.functions.comparison
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_notification_actors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(django.db.models.functions.comparison.Least('sender', 'receiver'), django.db.models.functions.comparison.Greatest('sender', 'receiver'), models.F('id'), name='core_message_pair_id_idx'),
+        ),
+    ]
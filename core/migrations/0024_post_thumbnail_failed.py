@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_message_pair_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='thumbnail_failed',
+            field=models.BooleanField(default=False),
+        ),
+    ]
@@ -0,0 +1,16 @@
+# Generated by Django 5.2.5 on 2026-10-19 08:51
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_post_thumbnail_failed'),
+    ]
+
+    operations = [
+        migrations.DeleteModel(
+            name='NotificationActor',
+        ),
+    ]
@@ -1,7 +1,13 @@
-from django.db import models
+import uuid
+
+from django.db import models, router, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest, Least
 from django.contrib.auth.models import AbstractUser
 from django.conf import settings
 
+from . import shards
+
 # ======================================================
 # USER
 # ======================================================
@@ -49,11 +55,36 @@ class Post(models.Model):
         null=True
     )
 
+    # Square grid preview, generated from `image` by core.thumbnails
+    thumbnail = models.ImageField(
+        upload_to="posts/thumbs/",
+        blank=True,
+        null=True
+    )
+    # Set when `image` couldn't be decoded, so nothing keeps retrying it
+    thumbnail_failed = models.BooleanField(default=False)
+
     caption = models.TextField(blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Denormalized, written in batches by core.likes.like_buffer
+    like_count = models.PositiveIntegerField(default=0)
+
+    # Time-decayed engagement score, maintained by core.ranking
+    score = models.FloatField(default=0)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["-score", "-id"], name="core_post_score_idx"),
+            # search / newest-first listings
+            models.Index(fields=["-created_at"], name="core_post_created_idx"),
+            # profile grid: one author's posts, newest first
+            models.Index(fields=["author", "-created_at"], name="core_post_author_created_idx"),
+        ]
+
     def total_likes(self):
-        return self.likes.count()
+        from .likes import like_count
+        return like_count(self)
 
     def total_comments(self):
         return self.comments.count()
@@ -93,6 +124,10 @@ class Comment(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            # a post's comments in time order, either direction
+            models.Index(fields=["post", "created_at"], name="core_comment_post_created_idx"),
+        ]
 
 
 class Follow(models.Model):
@@ -110,21 +145,63 @@ class Follow(models.Model):
 
     class Meta:
         unique_together = ("follower", "following")
+        indexes = [
+            # reverse lookups (followers of X) covered without touching the table
+            models.Index(fields=["following", "follower"], name="core_follow_following_idx"),
+        ]
 
 
 # ======================================================
 # MESSAGES (PERMANENT DELETE, PRODUCTION SAFE)
 # ======================================================
+class MessageManager(models.Manager):
+    """
+    Shard-aware entry points (core.shards). Anything scoped to one
+    conversation goes through conversation()/for_pair() so it lands on
+    the database holding it; unsharded, they are plain querysets.
+    """
+
+    def for_pair(self, user_a, user_b):
+        alias = shards.shard_for(user_a, user_b)
+        return self.using(alias) if alias else self.get_queryset()
+
+    def conversation(self, user_a, user_b):
+        # Matches core_message_pair_id_idx, so both directions come out
+        # of one index range already in id order
+        low, high = shards.ordered_pair(user_a, user_b)
+        return self.for_pair(user_a, user_b).alias(
+            user_low=Least("sender", "receiver"), user_high=Greatest("sender", "receiver")
+        ).filter(user_low=low, user_high=high)
+
+    def for_id(self, message_id):
+        alias = shards.shard_for_id(message_id)
+        return self.using(alias) if alias else self.get_queryset()
+
+    def on_shards(self):
+        """One queryset per database holding messages, for cross-conversation work."""
+        return [self.using(alias) for alias in shards.message_databases()]
+
+    def create(self, **kwargs):
+        return self.for_pair(*shards.pair_of(kwargs)).create(**kwargs)
+
+    async def acreate(self, **kwargs):
+        return await self.for_pair(*shards.pair_of(kwargs)).acreate(**kwargs)
+
+
 class Message(models.Model):
+    # No database-level FKs: on a shard the user rows live elsewhere.
+    # Deletes still cascade through Django (and core.shards for shards).
     sender = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         related_name="sent_messages",
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
     receiver = models.ForeignKey(
         settings.AUTH_USER_MODEL,
         related_name="received_messages",
-        on_delete=models.CASCADE
+        on_delete=models.CASCADE,
+        db_constraint=False
     )
 
     content = models.TextField(blank=True, null=True)
@@ -141,26 +218,459 @@ class Message(models.Model):
 
     timestamp = models.DateTimeField(auto_now_add=True)
     read = models.BooleanField(default=False)
+    # Position in the conversation's change log (ConversationEvent)
+    seq = models.PositiveBigIntegerField(null=True, blank=True)
 
     # 🔥 Permanent delete-for-me support
     deleted_for = models.ManyToManyField(
         settings.AUTH_USER_MODEL,
         blank=True,
-        related_name="deleted_messages"
+        related_name="deleted_messages",
+        through="MessageDeletion"
     )
 
+    objects = MessageManager()
+
     class Meta:
         ordering = ["timestamp"]
         indexes = [
             models.Index(fields=["sender", "receiver", "timestamp"]),
+            # each side of the two-direction conversation OR, by id range
+            # (chat polls: id > last_id; history: id < before_id)
+            models.Index(fields=["sender", "receiver", "id"], name="core_message_conv_id_idx"),
+            # the conversation as one ordered pair (conversation()): pages
+            # and polls by id without merging the two directions
+            models.Index(
+                Least("sender", "receiver"), Greatest("sender", "receiver"), F("id"),
+                name="core_message_pair_id_idx",
+            ),
         ]
 
     def __str__(self):
         return f"Message {self.id} ({self.sender} → {self.receiver})"
 
+    def save(self, *args, **kwargs):
+        if not self._state.adding or self.seq is not None:
+            return super().save(*args, **kwargs)
+        # A new message takes the conversation's next sequence number and
+        # logs a "new" event in the insert's own transaction, so numbers
+        # become visible in order
+        using = kwargs.pop("using", None) or router.db_for_write(Message, instance=self)
+        with transaction.atomic(using=using):
+            conversation, self.seq = Conversation.objects.advance(
+                self.sender_id, self.receiver_id, using
+            )
+            super().save(*args, using=using, **kwargs)
+            ConversationEvent.objects.using(using).create(
+                conversation=conversation, seq=self.seq,
+                kind=ConversationEvent.NEW, message=self,
+            )
+
     def is_visible_to(self, user):
         """
         Safety helper — optional.
         Queries should already exclude deleted messages.
         """
-        return user not in self.deleted_for.all()
+        return not MessageDeletion.objects.using(self._state.db).filter(
+            message=self, user=user
+        ).exists()
+
+
+class MessageDeletion(models.Model):
+    """Delete-for-me: lives next to its message, on the same shard."""
+    message = models.ForeignKey(Message, on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+
+    class Meta:
+        db_table = "core_message_deleted_for"
+        unique_together = ("message", "user")
+
+
+class ReadWatermark(models.Model):
+    """
+    How far `user` has read their conversation with `other`: every
+    message with id <= last_read_id counts as read. One row per
+    participant per conversation, advanced by core.receipts, instead of
+    a `read` flag flipped on every message.
+    """
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    other = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    last_read_id = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user", "other"], name="core_readwatermark_unique"),
+        ]
+
+    def __str__(self):
+        return f"{self.user_id} read {self.other_id} up to {self.last_read_id}"
+
+
+# ======================================================
+# CONVERSATION LOG (SEQUENCE NUMBERS + CHANGE EVENTS)
+# ======================================================
+class ConversationManager(models.Manager):
+    def advance(self, user_a_id, user_b_id, using):
+        """
+        Take the conversation's next sequence number: (conversation, seq).
+        Call inside a transaction on `using`; the counter row stays
+        locked until it commits.
+        """
+        low, high = sorted((user_a_id, user_b_id))
+        rows = self.using(using).filter(user_low_id=low, user_high_id=high)
+        if not rows.update(last_seq=F("last_seq") + 1):
+            self.using(using).bulk_create(
+                [Conversation(user_low_id=low, user_high_id=high)], ignore_conflicts=True
+            )
+            rows.update(last_seq=F("last_seq") + 1)
+        conversation = rows.get()
+        return conversation, conversation.last_seq
+
+
+class Conversation(models.Model):
+    """
+    Sequence counter of one conversation (ordered pair, user_low <
+    user_high). Lives on the conversation's message shard.
+    """
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    last_seq = models.PositiveBigIntegerField(default=0)
+
+    objects = ConversationManager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["user_low", "user_high"], name="core_conversation_pair"),
+        ]
+
+    def __str__(self):
+        return f"Conversation {self.user_low_id}/{self.user_high_id} @ {self.last_seq}"
+
+
+class ConversationEvent(models.Model):
+    """
+    One change to a conversation, numbered from the conversation's
+    sequence: a new message, a tombstone, or a read. Clients catch up
+    from their last seq with one range scan (core.sync).
+    """
+    NEW = "new"
+    DELETED_FOR_ME = "deleted_for_me"
+    DELETED_FOR_EVERYONE = "deleted_for_everyone"
+    READ = "read"
+    KIND_CHOICES = [
+        (NEW, "new message"),
+        (DELETED_FOR_ME, "deleted for me"),
+        (DELETED_FOR_EVERYONE, "deleted for everyone"),
+        (READ, "read up to"),
+    ]
+
+    conversation = models.ForeignKey(Conversation, related_name="events", on_delete=models.CASCADE)
+    seq = models.PositiveBigIntegerField()
+    kind = models.CharField(max_length=24, choices=KIND_CHOICES)
+
+    # The message the event is about (for a read: the newest one read).
+    # No constraint: tombstones outlive their message.
+    message = models.ForeignKey(
+        Message,
+        null=True,
+        related_name="+",
+        on_delete=models.DO_NOTHING,
+        db_constraint=False
+    )
+    message_seq = models.PositiveBigIntegerField(null=True, blank=True)
+    # Who deleted or read; deleted_for_me events are only theirs to see
+    actor = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        null=True,
+        related_name="+",
+        on_delete=models.CASCADE,
+        db_constraint=False
+    )
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            # The sync range scan: conversation = ? AND seq > ? ORDER BY seq
+            models.UniqueConstraint(fields=["conversation", "seq"], name="core_convevent_seq"),
+        ]
+
+    def __str__(self):
+        return f"{self.conversation_id}#{self.seq} {self.kind}"
+
+
+# ======================================================
+# NOTIFICATIONS (AGGREGATED PER TARGET + TIME BUCKET)
+# ======================================================
+class Notification(models.Model):
+    LIKE = "like"
+    COMMENT = "comment"
+    FOLLOW = "follow"
+    MENTION = "mention"
+    VERB_CHOICES = [
+        (LIKE, "liked your post"),
+        (COMMENT, "commented on your post"),
+        (FOLLOW, "started following you"),
+        (MENTION, "mentioned you"),
+    ]
+
+    recipient = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="notifications",
+        on_delete=models.CASCADE
+    )
+    verb = models.CharField(max_length=16, choices=VERB_CHOICES)
+    post = models.ForeignKey(
+        Post,
+        related_name="notifications",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True
+    )
+    # "post:<id>" / "user:<id>" — keeps the unique key free of NULLs
+    target_key = models.CharField(max_length=32)
+    bucket = models.DateTimeField()
+
+    actor_count = models.PositiveIntegerField(default=0)
+    # Most recent distinct actor ids (newest first), capped at
+    # core.notifications.MAX_ACTORS; the summary names the first
+    actors = models.JSONField(default=list)
+
+    read = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["-id"]
+        unique_together = ("recipient", "verb", "target_key", "bucket")
+        indexes = [
+            models.Index(fields=["recipient", "read"]),
+        ]
+
+    def __str__(self):
+        return f"Notification {self.id} ({self.verb} → {self.recipient})"
+
+    def summary(self, names):
+        """
+        "alice and 41 others liked your post".
+        `names` maps actor id -> username.
+        """
+        first = names.get(self.actors[0], "Someone") if self.actors else "Someone"
+        others = self.actor_count - 1
+        text = self.get_verb_display()
+        if others <= 0:
+            return f"{first} {text}"
+        return f"{first} and {others} other{'s' if others > 1 else ''} {text}"
+
+
+# ======================================================
+# HASHTAGS & MENTIONS (INVERTED INDEX, SEE core.textindex)
+# ======================================================
+class Hashtag(models.Model):
+    # Normalized: NFKC + casefold, without the leading "#"
+    name = models.CharField(max_length=100, unique=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"#{self.name}"
+
+
+class PostTag(models.Model):
+    """
+    One hashtag occurrence on a post, from its caption (comment=None)
+    or from one of its comments. `created_at` is the source's time, so
+    trending windows are a range scan on (hashtag, created_at).
+    """
+    hashtag = models.ForeignKey(
+        Hashtag,
+        related_name="post_tags",
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name="tags",
+        on_delete=models.CASCADE
+    )
+    comment = models.ForeignKey(
+        Comment,
+        related_name="tags",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["hashtag", "post"],
+                condition=Q(comment__isnull=True),
+                name="core_posttag_caption_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["hashtag", "comment"],
+                condition=Q(comment__isnull=False),
+                name="core_posttag_comment_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["hashtag", "-post"], name="core_posttag_page_idx"),
+            models.Index(fields=["created_at", "hashtag"], name="core_posttag_window_idx"),
+        ]
+
+
+class Mention(models.Model):
+    """An @username in a caption (comment=None) or comment."""
+    user = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="mentions",
+        on_delete=models.CASCADE
+    )
+    author = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    post = models.ForeignKey(
+        Post,
+        related_name="mentions",
+        on_delete=models.CASCADE
+    )
+    comment = models.ForeignKey(
+        Comment,
+        related_name="mentions",
+        on_delete=models.CASCADE,
+        blank=True,
+        null=True
+    )
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["user", "post"],
+                condition=Q(comment__isnull=True),
+                name="core_mention_caption_uniq",
+            ),
+            models.UniqueConstraint(
+                fields=["user", "comment"],
+                condition=Q(comment__isnull=False),
+                name="core_mention_comment_uniq",
+            ),
+        ]
+        indexes = [
+            models.Index(fields=["user", "-created_at"]),
+        ]
+
+
+# ======================================================
+# MESSAGE ARCHIVE (COMPRESSED PER-CONVERSATION SEGMENTS)
+# ======================================================
+class MessageArchive(models.Model):
+    """
+    A run of old messages from one conversation, packed with msgpack and
+    zlib-compressed by core.retention. Keeps the hot Message table small.
+    The pair is stored ordered (user_low.id < user_high.id).
+    """
+    user_low = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+    user_high = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="+",
+        on_delete=models.CASCADE
+    )
+
+    first_id = models.BigIntegerField()
+    last_id = models.BigIntegerField()
+    first_timestamp = models.DateTimeField()
+    last_timestamp = models.DateTimeField()
+    count = models.PositiveIntegerField()
+
+    data = models.BinaryField()
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user_low", "user_high", "last_id"]),
+        ]
+
+    def __str__(self):
+        return f"Archive {self.first_id}-{self.last_id} ({self.user_low_id}/{self.user_high_id})"
+
+
+# ======================================================
+# CHUNKED UPLOADS (RESUMABLE, SEE core.uploads)
+# ======================================================
+class ChunkedUpload(models.Model):
+    """
+    An upload in progress. Parts are written straight into a temp file
+    at `offset`; on completion the file is hash-checked and moved into
+    media storage for a Message or Post.
+    """
+    IMAGE = "image"
+    AUDIO = "audio"
+    KIND_CHOICES = [
+        (IMAGE, "Image"),
+        (AUDIO, "Audio"),
+    ]
+
+    id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False)
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        related_name="uploads",
+        on_delete=models.CASCADE
+    )
+    kind = models.CharField(max_length=8, choices=KIND_CHOICES)
+    filename = models.CharField(max_length=255)
+    size = models.PositiveBigIntegerField()
+    sha256 = models.CharField(max_length=64)
+
+    # Bytes received so far; parts must arrive at exactly this offset
+    offset = models.PositiveBigIntegerField(default=0)
+    created_at = models.DateTimeField(auto_now_add=True)
+    completed_at = models.DateTimeField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Upload {self.id} ({self.offset}/{self.size})"
+
+    @property
+    def is_complete(self):
+        return self.completed_at is not None
+
+
+# ======================================================
+# REPLICATION
+# ======================================================
+class ReplicationHeartbeat(models.Model):
+    """
+    One row, rewritten on the primary by core.replicas every lag check.
+    How far a replica's copy trails the primary's is its replication lag.
+    """
+    beat_at = models.DateTimeField()
+
+    def __str__(self):
+        return f"Heartbeat {self.beat_at:%Y-%m-%d %H:%M:%S}"
@@ -0,0 +1,219 @@
+import atexit
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import IntegrityError, connections, transaction
+from django.db.models import F
+
+from .models import Notification, Post
+from .usercache import get_many
+
+
+# Distinct actors kept per notification, newest first. Someone acting
+# again while still on the list isn't counted twice; past the cap an
+# old actor who returns is (rare, and it keeps each flush one row write)
+MAX_ACTORS = 50
+
+
+def bucket_for(ts=None):
+    """Start of the aggregation bucket a timestamp falls into."""
+    size = getattr(settings, "NOTIFICATION_BUCKET_SECONDS", 3600)
+    ts = time.time() if ts is None else ts
+    return datetime.fromtimestamp(ts - ts % size, tz=dt_timezone.utc)
+
+
+def group_name(user_id):
+    return f"notifications_{user_id}"
+
+
+# ======================================================
+# DEFERRED, BATCHED WRITER
+# ======================================================
+class NotificationBuffer:
+    """
+    Collects notification events in memory and writes them as one
+    aggregated row per (recipient, verb, target, bucket) every flush
+    window, so a burst of 40 likes costs one upsert instead of 40 rows.
+    """
+
+    def __init__(self, window=None):
+        self._window = window
+        # key -> {"post_id", "actors": [distinct, newest first]}
+        self._events = OrderedDict()
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, "NOTIFICATION_FLUSH_INTERVAL", 5.0)
+
+    def add(self, recipient_id, verb, actor_id, post_id=None, target_key=None):
+        if recipient_id == actor_id:
+            return
+        if target_key is None:
+            target_key = f"post:{post_id}" if post_id else f"user:{recipient_id}"
+        key = (recipient_id, verb, target_key, bucket_for())
+
+        with self._lock:
+            event = self._events.setdefault(key, {"post_id": post_id, "actors": []})
+            if actor_id in event["actors"]:
+                event["actors"].remove(actor_id)
+            event["actors"].insert(0, actor_id)
+            # Trailing edge: a quiet worker still writes within a window,
+            # not on its next event or at exit
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            # The events are back in the buffer; the next flush retries
+            pass
+        finally:
+            connections.close_all()
+
+    def _restore(self, events):
+        with self._lock:
+            for key, event in events.items():
+                current = self._events.setdefault(
+                    key, {"post_id": event["post_id"], "actors": []}
+                )
+                # Whoever acted since the flush took them stays newest
+                current["actors"] += [a for a in event["actors"] if a not in current["actors"]]
+
+    def flush(self, recipient_id=None):
+        """
+        Write the buffered events (only `recipient_id`'s, if given). A
+        group whose post or user was deleted meanwhile is dropped on its
+        own instead of failing the batch.
+        """
+        with self._lock:
+            if recipient_id is None:
+                events = self._events
+                self._events = OrderedDict()
+                if self._timer is not None:
+                    self._timer.cancel()
+                    self._timer = None
+            else:
+                events = OrderedDict(
+                    (key, self._events.pop(key)) for key in list(self._events)
+                    if key[0] == recipient_id
+                )
+
+        if not events:
+            return 0
+
+        try:
+            live = set(Post.objects.filter(
+                pk__in={e["post_id"] for e in events.values() if e["post_id"]}
+            ).values_list("pk", flat=True))
+            events = OrderedDict(
+                (key, e) for key, e in events.items()
+                if not e["post_id"] or e["post_id"] in live
+            )
+            try:
+                touched = _write(events)
+            except IntegrityError:
+                # Deleted between the check and the commit: isolate the culprit
+                touched = []
+                for key, event in events.items():
+                    try:
+                        touched += _write({key: event})
+                    except IntegrityError:
+                        pass
+        except Exception:
+            # Rewriting a group that did commit only repeats actors it
+            # already lists, which aren't counted again
+            self._restore(events)
+            raise
+
+        if touched and getattr(settings, "NOTIFICATIONS_PUSH", False):
+            transaction.on_commit(lambda: push(touched))
+        return len(touched)
+
+
+def _write(events):
+    touched = []
+    with transaction.atomic():
+        for (recipient_id, verb, target_key, bucket), event in events.items():
+            obj, created = Notification.objects.get_or_create(
+                recipient_id=recipient_id,
+                verb=verb,
+                target_key=target_key,
+                bucket=bucket,
+                defaults={"post_id": event["post_id"]},
+            )
+            # Count each actor once per row while they're on its list
+            new = [a for a in event["actors"] if a not in obj.actors]
+            obj.actors = (
+                event["actors"] + [a for a in obj.actors if a not in event["actors"]]
+            )[:MAX_ACTORS]
+            obj.actor_count = F("actor_count") + len(new)
+            if new:
+                obj.read = False
+            obj.save(update_fields=["actors", "actor_count", "read", "updated_at"])
+            touched.append(obj.pk)
+    return touched
+
+
+notification_buffer = NotificationBuffer()
+atexit.register(notification_buffer.flush)
+
+
+def notify(recipient, verb, actor, post=None):
+    notification_buffer.add(
+        recipient.id, verb, actor.id, post_id=post.id if post else None
+    )
+
+
+# ======================================================
+# READ SIDE
+# ======================================================
+def serialize(notifications):
+    summaries = get_many(a for n in notifications for a in n.actors[:1])
+    names = {i: u["username"] for i, u in summaries.items()}
+    return [
+        {
+            "id": n.id,
+            "verb": n.verb,
+            "post_id": n.post_id,
+            "text": n.summary(names),
+            "actor_count": n.actor_count,
+            "read": n.read,
+            "updated_at": n.updated_at.isoformat(),
+        }
+        for n in notifications
+    ]
+
+
+def unread_count(user):
+    return Notification.objects.filter(recipient=user, read=False).count()
+
+
+def push(notification_ids):
+    """Send freshly written notifications to recipients' sockets."""
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+
+    layer = get_channel_layer()
+    if layer is None:
+        return
+
+    rows = list(Notification.objects.filter(id__in=notification_ids))
+    for data, n in zip(serialize(rows), rows):
+        try:
+            async_to_sync(layer.group_send)(group_name(n.recipient_id), {
+                "type": "notify",
+                "notification": data,
+            })
+        except Exception:
+            # Live push is best effort; the row is already stored
+            pass
@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+from .models import Follow, Post
+
+
+def _ttl():
+    return getattr(settings, "PROFILE_STATS_TTL", 600)
+
+
+def stats_key(user_id):
+    return f"profilestats:{user_id}"
+
+
+# ======================================================
+# HEADER STATS
+# ======================================================
+def header_stats(user_id):
+    """
+    {"posts", "followers", "following"} for a profile header. Cached and
+    dropped by the signals below, so a profile view doesn't count a
+    prolific user's rows every time; the TTL covers bulk deletes that
+    skip signals.
+    """
+    key = stats_key(user_id)
+    stats = cache.get(key)
+    if stats is None:
+        stats = {
+            "posts": Post.objects.filter(author_id=user_id).count(),
+            "followers": Follow.objects.filter(following_id=user_id).count(),
+            "following": Follow.objects.filter(follower_id=user_id).count(),
+        }
+        cache.set(key, stats, _ttl())
+    return stats
+
+
+def invalidate(*user_ids):
+    cache.delete_many([stats_key(u) for u in user_ids])
+
+
+def _on_post_change(sender, instance, created=True, **kwargs):
+    # Only creates and deletes change the count, not edits or score updates
+    if created:
+        invalidate(instance.author_id)
+
+
+def _on_follow_change(sender, instance, **kwargs):
+    invalidate(instance.follower_id, instance.following_id)
+
+
+post_save.connect(_on_post_change, sender=Post, dispatch_uid="profiles_post_save")
+post_delete.connect(_on_post_change, sender=Post, dispatch_uid="profiles_post_delete")
+post_save.connect(_on_follow_change, sender=Follow, dispatch_uid="profiles_follow_save")
+post_delete.connect(_on_follow_change, sender=Follow, dispatch_uid="profiles_follow_delete")
@@ -0,0 +1,172 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from .models import Post, Follow
+
+
+LIKE_WEIGHT = 1.0
+COMMENT_WEIGHT = 3.0
+AUTHOR_WEIGHT = 0.5
+
+
+def _half_life_hours():
+    return getattr(settings, "FEED_RANKING_HALF_LIFE_HOURS", 12.0)
+
+
+def _window_days():
+    return getattr(settings, "FEED_RANKING_WINDOW_DAYS", 7)
+
+
+# ======================================================
+# SCORING
+# ======================================================
+def decay(created_at, now=None):
+    now = now or timezone.now()
+    age_hours = max((now - created_at).total_seconds(), 0) / 3600
+    return 0.5 ** (age_hours / _half_life_hours())
+
+
+def base_score(likes, comments, author_followers):
+    return (
+        1.0
+        + LIKE_WEIGHT * likes
+        + COMMENT_WEIGHT * comments
+        + AUTHOR_WEIGHT * math.log1p(author_followers)
+    )
+
+
+def initial_score(author):
+    followers = Follow.objects.filter(following=author).count()
+    return base_score(0, 0, followers)
+
+
+# ======================================================
+# INCREMENTAL UPDATES
+# ======================================================
+def score_bump(created_at, weight, now=None):
+    """Score added by one engagement event of `weight`, decayed to now."""
+    return weight * decay(created_at, now)
+
+
+def record_comment(post):
+    Post.objects.filter(pk=post.pk).update(
+        score=F("score") + score_bump(post.created_at, COMMENT_WEIGHT)
+    )
+
+
+# ======================================================
+# BULK RE-DECAY
+# ======================================================
+def rescore(chunk_size=2000):
+    """
+    Recompute every recent post's score from its counters, in chunks.
+    Posts older than the ranking window
+    drop to 0 so stale engagement can't pin them to the top.
+    Returns the number of posts rescored.
+    """
+    now = timezone.now()
+    cutoff = now - timedelta(days=_window_days())
+    half_life = _half_life_hours()
+
+    qs = (
+        Post.objects.filter(created_at__gte=cutoff)
+        .annotate(n_comments=Count("comments"))
+        .values_list("id", "like_count", "n_comments", "author_id", "created_at")
+        .order_by("id")
+    )
+
+    followers = dict(
+        Follow.objects.values("following_id")
+        .annotate(n=Count("id"))
+        .values_list("following_id", "n")
+    )
+
+    done = 0
+    chunk = []
+    for row in qs.iterator(chunk_size=chunk_size):
+        chunk.append(row)
+        if len(chunk) >= chunk_size:
+            done += _rescore_chunk(chunk, followers, now, half_life)
+            chunk = []
+    if chunk:
+        done += _rescore_chunk(chunk, followers, now, half_life)
+
+    Post.objects.filter(created_at__lt=cutoff).filter(~Q(score=0)).update(score=0)
+    return done
+
+
+def _rescore_chunk(rows, followers, now, half_life):
+    ids = [r[0] for r in rows]
+    likes = [r[1] for r in rows]
+    comments = [r[2] for r in rows]
+    author_followers = [followers.get(r[3], 0) for r in rows]
+    ages = [max((now - r[4]).total_seconds(), 0) / 3600 for r in rows]
+
+    scores = [
+        base_score(l, c, f) * 0.5 ** (a / half_life)
+        for l, c, f, a in zip(likes, comments, author_followers, ages)
+    ]
+
+    Post.objects.bulk_update(
+        [Post(id=i, score=s) for i, s in zip(ids, scores)], ["score"]
+    )
+    return len(ids)
+
+
+# ======================================================
+# FEED PAGES (KEYSET)
+# ======================================================
+class InvalidCursor(ValueError):
+    """A ?cursor= that feed_page didn't hand out."""
+
+
+def parse_cursor(cursor, ordering):
+    """(score, id) of a ranked cursor, (None, id) of a chronological one."""
+    try:
+        if ordering == "ranked":
+            score, sep, last_id = cursor.partition(":")
+            score = float(score)
+            if not sep or not math.isfinite(score):
+                raise ValueError(cursor)
+        else:
+            score, last_id = None, cursor
+        last_id = int(last_id)
+    except ValueError:
+        raise InvalidCursor(cursor) from None
+    if last_id < 0:
+        raise InvalidCursor(cursor)
+    return score, last_id
+
+
+def feed_page(qs, cursor=None, page_size=20, ordering=None):
+    """
+    Return (posts, next_cursor) for one feed page.
+    Chronological cursors are "<id>", ranked ones "<score>:<id>";
+    both are plain index range scans, never OFFSET. Raises
+    InvalidCursor for anything else.
+    """
+    ordering = ordering or getattr(settings, "FEED_ORDERING", "chronological")
+
+    if ordering == "ranked":
+        qs = qs.order_by("-score", "-id")
+        if cursor:
+            score, last_id = parse_cursor(cursor, ordering)
+            qs = qs.filter(Q(score__lt=score) | Q(score=score, id__lt=last_id))
+    else:
+        qs = qs.order_by("-id")
+        if cursor:
+            _, last_id = parse_cursor(cursor, ordering)
+            qs = qs.filter(id__lt=last_id)
+
+    posts = list(qs[:page_size + 1])
+    next_cursor = None
+    if len(posts) > page_size:
+        posts = posts[:page_size]
+        last = posts[-1]
+        next_cursor = f"{last.score!r}:{last.id}" if ordering == "ranked" else str(last.id)
+
+    return posts, next_cursor
@@ -0,0 +1,221 @@
+import atexit
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from .models import Message, ReadWatermark
+from .sync import record_reads
+from .usercache import LRUCache, get_many
+from .versions import bump, chat_key
+
+
+# ======================================================
+# DEBOUNCED WATERMARK WRITER
+# ======================================================
+class ReadWatermarkBuffer:
+    """
+    Collects read positions per (reader, other) and writes only each
+    pair's highest one, at most once per flush window. A chat page
+    polling every 2s or a socket acking every message costs one UPDATE
+    per window and one read-receipt event to the other participant.
+    """
+
+    def __init__(self, window=None):
+        self._window = window
+        self._pending = {}
+        # Last position written per pair, so repeated polls with the
+        # same last_id don't even reach the buffer
+        self._written = LRUCache(maxsize=50000, ttl=600)
+        self._lock = threading.Lock()
+        self._timer = None
+
+    @property
+    def window(self):
+        if self._window is not None:
+            return self._window
+        return getattr(settings, "READ_RECEIPT_FLUSH_INTERVAL", 1.0)
+
+    def advance(self, user_id, other_id, message_id):
+        if not message_id or user_id == other_id:
+            return
+        key = (user_id, other_id)
+        written = self._written.get(key)
+        if written is not None and message_id <= written:
+            return
+        with self._lock:
+            if message_id <= self._pending.get(key, 0):
+                return
+            self._pending[key] = message_id
+            # Trailing edge: the last advance of a burst still goes out
+            if self._timer is None:
+                self._timer = threading.Timer(self.window, self._flush_in_thread)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def pending(self, user_id, other_id):
+        with self._lock:
+            return self._pending.get((user_id, other_id), 0)
+
+    def _flush_in_thread(self):
+        try:
+            self.flush()
+        except Exception:
+            # The marks are back in the buffer; the next window retries
+            pass
+        finally:
+            connections.close_all()
+
+    def _restore(self, marks):
+        with self._lock:
+            for key, message_id in marks.items():
+                # An advance made since the flush took them may be higher
+                if message_id > self._pending.get(key, 0):
+                    self._pending[key] = message_id
+
+    def flush(self):
+        with self._lock:
+            marks = self._pending
+            self._pending = {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+
+        if not marks:
+            return 0
+
+        try:
+            ReadWatermark.objects.bulk_create(
+                [ReadWatermark(user_id=u, other_id=o) for u, o in marks],
+                ignore_conflicts=True,
+            )
+            now = timezone.now()
+            moved = []
+            with transaction.atomic():
+                for (user_id, other_id), message_id in marks.items():
+                    # Only forward: a stale tab can't move the watermark back
+                    if ReadWatermark.objects.filter(
+                        user_id=user_id, other_id=other_id, last_read_id__lt=message_id
+                    ).update(last_read_id=message_id, updated_at=now):
+                        moved.append((user_id, other_id, message_id))
+        except Exception:
+            self._restore(marks)
+            raise
+
+        # Only once committed: a rolled-back mark must not look written
+        for key, message_id in marks.items():
+            self._written.set(key, message_id)
+
+        if moved:
+            record_reads(moved)
+            broadcast(moved)
+        return len(moved)
+
+
+read_buffer = ReadWatermarkBuffer()
+atexit.register(read_buffer.flush)
+
+
+def mark_read(user_id, other_id, message_id):
+    """
+    `user` has seen their conversation with `other` up to `message_id`.
+    The watermark never moves back, so pass only ids actually delivered;
+    a position a client reports goes through newest_message_id() first.
+    """
+    read_buffer.advance(user_id, other_id, message_id)
+
+
+def newest_message_id(user_id, other_id, at_most):
+    """The conversation's newest message id <= `at_most`, 0 if none."""
+    return Message.objects.conversation(user_id, other_id).filter(
+        id__lte=at_most
+    ).order_by("-id").values_list("id", flat=True).first() or 0
+
+
+def broadcast(marks):
+    """Tell the other side: one event per advanced watermark."""
+    from asgiref.sync import async_to_sync
+    from channels.layers import get_channel_layer
+    from .consumers import room_name
+
+    names = get_many({i for u, o, _ in marks for i in (u, o)})
+    layer = get_channel_layer()
+    for user_id, other_id, message_id in marks:
+        if user_id not in names or other_id not in names:
+            continue
+        reader = names[user_id]["username"]
+        other = names[other_id]["username"]
+        # Pollers see it as a conversation change
+        bump(chat_key(reader, other))
+        if layer is None:
+            continue
+        try:
+            async_to_sync(layer.group_send)(f"chat_{room_name(reader, other)}", {
+                "type": "chat_read",
+                "reader": reader,
+                "last_read_id": message_id,
+            })
+        except Exception:
+            # Live push is best effort; the watermark is already stored
+            pass
+
+
+# ======================================================
+# READ SIDE
+# ======================================================
+# Bounds the OR of (sender, id > watermark) terms in one statement
+WATERMARKS_PER_QUERY = 200
+
+
+def last_read(user_id, other_id):
+    stored = ReadWatermark.objects.filter(
+        user_id=user_id, other_id=other_id
+    ).values_list("last_read_id", flat=True).first()
+    return max(stored or 0, read_buffer.pending(user_id, other_id))
+
+
+def unread_count(user_id, other_id, watermark=None):
+    """Messages from `other` past the watermark: a range count on (sender, receiver, id)."""
+    if watermark is None:
+        watermark = last_read(user_id, other_id)
+    return Message.objects.for_pair(user_id, other_id).filter(
+        sender_id=other_id, receiver_id=user_id, id__gt=watermark
+    ).count()
+
+
+def unread_counts(user_id):
+    """
+    {other_id: unread} for every conversation with unread messages: a
+    grouped count per message database (and per chunk of watermarks),
+    not one COUNT per conversation.
+    """
+    marks = {
+        other_id: max(mark, read_buffer.pending(user_id, other_id))
+        for other_id, mark in ReadWatermark.objects.filter(
+            user_id=user_id
+        ).values_list("other_id", "last_read_id")
+    }
+    by_db = {}
+    for other_id, mark in marks.items():
+        alias = Message.objects.for_pair(user_id, other_id).db
+        by_db.setdefault(alias, []).append((other_id, mark))
+
+    counts = {}
+    for messages in Message.objects.on_shards():
+        incoming = messages.filter(receiver_id=user_id).exclude(sender_id=user_id)
+        # Conversations never opened have no watermark yet: all of it is unread
+        queries = [incoming.exclude(sender_id__in=marks)]
+        pairs = by_db.get(messages.db, [])
+        for i in range(0, len(pairs), WATERMARKS_PER_QUERY):
+            past = Q()
+            for other_id, mark in pairs[i:i + WATERMARKS_PER_QUERY]:
+                past |= Q(sender_id=other_id, id__gt=mark)
+            queries.append(incoming.filter(past))
+        for query in queries:
+            for sender_id, n in (
+                query.values("sender_id").annotate(n=Count("id")).values_list("sender_id", "n")
+            ):
+                counts[sender_id] = counts.get(sender_id, 0) + n
+    return counts
@@ -0,0 +1,263 @@
+import random
+import threading
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.utils import timezone
+
+from .models import ReplicationHeartbeat
+
+
+PIN_COOKIE = "db_pin"
+
+
+def replica_aliases():
+    return list(getattr(settings, "DATABASE_REPLICAS", []))
+
+
+def _pin_seconds():
+    return getattr(settings, "READ_YOUR_WRITES_SECONDS", 10)
+
+
+# ======================================================
+# PER-REQUEST STATE
+# ======================================================
+class _RequestState:
+    """
+    Mutable, so signal handlers running in a sync_to_async thread update
+    the same object the view and router see.
+    """
+
+    __slots__ = ("use_replica", "pinned", "wrote", "alias")
+
+    def __init__(self, pinned=False):
+        self.use_replica = False
+        self.pinned = pinned
+        self.wrote = False
+        self.alias = None
+
+
+_state = ContextVar("replica_state", default=None)
+
+
+def _on_write(sender, **kwargs):
+    state = _state.get()
+    if state is not None:
+        # Read-your-writes inside the request, and for the next few after it
+        state.wrote = True
+        state.pinned = True
+
+
+post_save.connect(_on_write, dispatch_uid="replicas_post_save")
+post_delete.connect(_on_write, dispatch_uid="replicas_post_delete")
+m2m_changed.connect(_on_write, dispatch_uid="replicas_m2m_changed")
+
+
+# ======================================================
+# REPLICA HEALTH (LAG)
+# ======================================================
+_health = {"checked": float("-inf"), "available": []}
+_health_lock = threading.Lock()
+
+
+def _check_interval():
+    return getattr(settings, "DATABASE_REPLICA_LAG_CHECK", 2.0)
+
+
+def measure_lag():
+    """
+    {alias: seconds behind the primary, or None if unreachable}. Reads
+    the primary's heartbeat, writes a fresh one, and compares each
+    replica's copy with the one it should have by now.
+    """
+    beats = ReplicationHeartbeat.objects.using(DEFAULT_DB_ALIAS)
+    previous = beats.filter(pk=1).values_list("beat_at", flat=True).first()
+    now = timezone.now()
+    # update()/bulk_create(): no signals, so this never pins a request
+    if not beats.filter(pk=1).update(beat_at=now):
+        beats.bulk_create([ReplicationHeartbeat(pk=1, beat_at=now)], ignore_conflicts=True)
+
+    lag = {}
+    for alias in replica_aliases():
+        try:
+            seen = ReplicationHeartbeat.objects.using(alias).filter(
+                pk=1
+            ).values_list("beat_at", flat=True).first()
+        except DatabaseError:
+            lag[alias] = None
+            continue
+        if previous is None or seen is None:
+            # No baseline yet: trust nothing until the next check
+            lag[alias] = float("inf")
+        else:
+            lag[alias] = max(0.0, (previous - seen).total_seconds())
+    return lag
+
+
+def available_replicas():
+    """Replicas within DATABASE_REPLICA_MAX_LAG, re-checked every few seconds."""
+    if not replica_aliases():
+        return []
+    if time.monotonic() - _health["checked"] < _check_interval():
+        return _health["available"]
+
+    with _health_lock:
+        if time.monotonic() - _health["checked"] >= _check_interval():
+            max_lag = getattr(settings, "DATABASE_REPLICA_MAX_LAG", 5.0)
+            try:
+                lag = measure_lag()
+            except DatabaseError:
+                lag = {}
+            _health["available"] = [
+                alias for alias, seconds in lag.items()
+                if seconds is not None and seconds <= max_lag
+            ]
+            _health["checked"] = time.monotonic()
+    return _health["available"]
+
+
+def reset_health():
+    with _health_lock:
+        _health["checked"] = float("-inf")
+        _health["available"] = []
+
+
+# ======================================================
+# ROUTER
+# ======================================================
+class PrimaryReplicaRouter:
+    """
+    Writes and ordinary reads go to the primary. Reads inside a
+    @read_replica view go to one healthy replica (the same one for the
+    whole request), unless the user wrote something recently.
+    """
+
+    def db_for_read(self, model, **hints):
+        state = _state.get()
+        if state is None or not state.use_replica or state.pinned:
+            return DEFAULT_DB_ALIAS
+        if state.alias is None:
+            replicas = available_replicas()
+            state.alias = random.choice(replicas) if replicas else DEFAULT_DB_ALIAS
+        return state.alias
+
+    def db_for_write(self, model, **hints):
+        # Also for instances that were loaded from a replica
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {DEFAULT_DB_ALIAS, *replica_aliases()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # Replicas get the schema through replication
+        if db in replica_aliases():
+            return False
+        return None
+
+
+# ======================================================
+# VIEW OPT-IN
+# ======================================================
+def read_replica(view):
+    """
+    Let this view's reads go to a replica. Sync and async views. Not
+    for views answering 304 from a cache version (chat poll/sync): the
+    version moves with the primary, so stale replica rows would be
+    cached under it.
+    """
+
+    def enter():
+        state = _state.get()
+        token = None
+        if state is None:
+            # Called outside ReplicaPinningMiddleware (tests, other stacks)
+            state = _RequestState()
+            token = _state.set(state)
+        previous = state.use_replica
+        state.use_replica = True
+        return state, previous, token
+
+    def leave(state, previous, token):
+        state.use_replica = previous
+        if token is not None:
+            _state.reset(token)
+
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            context = enter()
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                leave(*context)
+    else:
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            context = enter()
+            try:
+                return view(request, *args, **kwargs)
+            finally:
+                leave(*context)
+    return wrapper
+
+
+# ======================================================
+# STICKINESS MIDDLEWARE
+# ======================================================
+class ReplicaPinningMiddleware:
+    """
+    Read-your-writes across requests. After a request that wrote (or any
+    POST/PUT/PATCH/DELETE) the client gets a short-lived cookie; while it
+    is present, that client's reads stay on the primary.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        state, token = self._enter(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._leave(request, response, state)
+
+    async def __acall__(self, request):
+        state, token = self._enter(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        return self._leave(request, response, state)
+
+    def _enter(self, request):
+        try:
+            pinned_until = float(request.COOKIES.get(PIN_COOKIE, 0))
+        except ValueError:
+            pinned_until = 0
+        state = _RequestState(pinned=pinned_until > time.time())
+        return state, _state.set(state)
+
+    def _leave(self, request, response, state):
+        if replica_aliases() and (state.wrote or request.method not in ("GET", "HEAD", "OPTIONS")):
+            seconds = _pin_seconds()
+            response.set_cookie(
+                PIN_COOKIE, str(int(time.time() + seconds)),
+                max_age=seconds, httponly=True, samesite="Lax",
+            )
+        return response
@@ -0,0 +1,277 @@
+import zlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import msgpack
+from django.conf import settings
+from django.core.exceptions import PermissionDenied
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ConversationEvent, Message, MessageArchive, MessageDeletion
+
+
+def _segment_size():
+    return getattr(settings, "MESSAGE_ARCHIVE_SEGMENT_SIZE", 500)
+
+
+def ordered_pair(a_id, b_id):
+    return (a_id, b_id) if a_id < b_id else (b_id, a_id)
+
+
+# ======================================================
+# PACKING
+# ======================================================
+# One record per message, positional to keep segments small:
+# [id, sender_id, content, image, audio, epoch_seconds, read, deleted_for_ids]
+def pack(records):
+    return zlib.compress(msgpack.packb(records, use_bin_type=True), 6)
+
+
+def unpack(blob):
+    return msgpack.unpackb(zlib.decompress(bytes(blob)), raw=False)
+
+
+# ======================================================
+# ARCHIVING
+# ======================================================
+def _delete_files(names):
+    for name in names:
+        if name:
+            try:
+                default_storage.delete(name)
+            except Exception:
+                pass
+
+
+def _deleted_for(messages, using):
+    """{message_id: [user ids]} read from the messages' own database."""
+    found = {}
+    for message_id, user_id in MessageDeletion.objects.using(using).filter(
+        message__in=messages
+    ).values_list("message_id", "user_id"):
+        found.setdefault(message_id, []).append(user_id)
+    return found
+
+
+def archive_conversation(user_a_id, user_b_id, cutoff, using=None):
+    """
+    Move one conversation's messages older than `cutoff` into compressed
+    segments. Messages both participants deleted are dropped instead,
+    and their attachments removed from storage. Returns (archived, dropped).
+    `using` picks the database to archive from (default: the
+    conversation's shard).
+    """
+    low, high = ordered_pair(user_a_id, user_b_id)
+    messages = Message.objects.using(using) if using else Message.objects.for_pair(low, high)
+    old = messages.filter(
+        Q(sender_id=low, receiver_id=high) | Q(sender_id=high, receiver_id=low),
+        timestamp__lt=cutoff,
+    ).order_by("id")
+
+    archived = dropped = 0
+    while True:
+        batch = list(old[:_segment_size()])
+        if not batch:
+            break
+
+        deletions = _deleted_for(batch, old.db)
+        records, files_to_delete = [], []
+        for m in batch:
+            deleted_for = sorted(deletions.get(m.id, []))
+            if low in deleted_for and high in deleted_for:
+                files_to_delete += [m.image.name, m.audio.name]
+                continue
+            records.append([
+                m.id, m.sender_id, m.content or "", m.image.name or "",
+                m.audio.name or "", m.timestamp.timestamp(), m.read, deleted_for,
+            ])
+
+        with transaction.atomic(), transaction.atomic(using=old.db):
+            if records:
+                MessageArchive.objects.create(
+                    user_low_id=low,
+                    user_high_id=high,
+                    first_id=records[0][0],
+                    last_id=records[-1][0],
+                    first_timestamp=_to_datetime(records[0][5]),
+                    last_timestamp=_to_datetime(records[-1][5]),
+                    count=len(records),
+                    data=pack(records),
+                )
+            messages.filter(id__in=[m.id for m in batch]).delete()
+            transaction.on_commit(lambda names=files_to_delete: _delete_files(names))
+
+        archived += len(records)
+        dropped += len(batch) - len(records)
+    return archived, dropped
+
+
+def archive_old_messages(older_than_days=None, progress=None):
+    days = older_than_days
+    if days is None:
+        days = getattr(settings, "MESSAGE_RETENTION_DAYS", 365)
+    cutoff = timezone.now() - timedelta(days=days)
+
+    totals = [0, 0]
+    for messages in Message.objects.on_shards():
+        pairs = {
+            ordered_pair(s, r)
+            for s, r in messages.filter(timestamp__lt=cutoff)
+            .values_list("sender_id", "receiver_id").distinct().iterator()
+        }
+        for low, high in sorted(pairs):
+            archived, dropped = archive_conversation(low, high, cutoff, using=messages.db)
+            totals[0] += archived
+            totals[1] += dropped
+            if progress:
+                progress(low, high, archived, dropped)
+    return tuple(totals)
+
+
+def _to_datetime(epoch):
+    return datetime.fromtimestamp(epoch, tz=dt_timezone.utc)
+
+
+# ======================================================
+# DELETING ARCHIVED MESSAGES
+# ======================================================
+def delete_archived(user, message_id, for_everyone=False):
+    """
+    Delete-for-me (or, by its sender, delete-for-everyone) of a message
+    that has been archived: its segment is rewritten without it, or
+    with `user` added to its deleted_for, and the conversation's change
+    log gets the tombstone. A message both participants deleted is
+    dropped with its attachments, as archiving would. Returns the
+    conversation's (low, high) ids, or None if `user` has no archived
+    message `message_id`; PermissionDenied if it isn't theirs to delete
+    for everyone.
+    """
+    from .sync import record_archived
+
+    with transaction.atomic():
+        segments = MessageArchive.objects.select_for_update().filter(
+            Q(user_low=user) | Q(user_high=user),
+            first_id__lte=message_id, last_id__gte=message_id,
+        )
+        for segment in segments:
+            records = unpack(segment.data)
+            index = next((i for i, rec in enumerate(records) if rec[0] == message_id), None)
+            if index is not None:
+                break
+        else:
+            return None
+
+        rec = records[index]
+        if user.id in rec[7] and not for_everyone:
+            return segment.user_low_id, segment.user_high_id
+        if for_everyone and rec[1] != user.id:
+            raise PermissionDenied
+        if for_everyone or len(set(rec[7]) | {user.id}) == 2:
+            del records[index]
+            transaction.on_commit(lambda names=(rec[3], rec[4]): _delete_files(names))
+        else:
+            rec[7] = sorted(rec[7] + [user.id])
+
+        if not records:
+            segment.delete()
+        else:
+            segment.first_id, segment.last_id = records[0][0], records[-1][0]
+            segment.first_timestamp = _to_datetime(records[0][5])
+            segment.last_timestamp = _to_datetime(records[-1][5])
+            segment.count = len(records)
+            segment.data = pack(records)
+            segment.save(update_fields=[
+                "first_id", "last_id", "first_timestamp", "last_timestamp", "count", "data",
+            ])
+
+    kind = ConversationEvent.DELETED_FOR_EVERYONE if for_everyone else ConversationEvent.DELETED_FOR_ME
+    record_archived(segment.user_low_id, segment.user_high_id, message_id, kind, user.id)
+    return segment.user_low_id, segment.user_high_id
+
+
+# ======================================================
+# READING (TRANSPARENT "LOAD OLDER")
+# ======================================================
+def _serialize_record(rec, usernames):
+    msg_id, sender_id, content, image, audio, epoch, _read, _deleted = rec
+    return {
+        "message_id": msg_id,
+        "sender": usernames.get(sender_id, ""),
+        "content": content,
+        "image": default_storage.url(image) if image else None,
+        "audio": default_storage.url(audio) if audio else None,
+        "timestamp": _to_datetime(epoch).isoformat(),
+    }
+
+
+def has_archive(user, other):
+    low, high = ordered_pair(user.id, other.id)
+    return MessageArchive.objects.filter(user_low_id=low, user_high_id=high).exists()
+
+
+def archived_before(user, other, before_id, limit):
+    """Newest-first archived messages with id < before_id visible to `user`."""
+    low, high = ordered_pair(user.id, other.id)
+    usernames = {user.id: user.username, other.id: other.username}
+    segments = MessageArchive.objects.filter(
+        user_low_id=low, user_high_id=high, first_id__lt=before_id
+    ).order_by("-last_id").only("data")
+
+    out = []
+    for segment in segments.iterator(chunk_size=4):
+        for rec in reversed(unpack(segment.data)):
+            if rec[0] >= before_id or user.id in rec[7]:
+                continue
+            out.append(_serialize_record(rec, usernames))
+            if len(out) >= limit:
+                return out
+    return out
+
+
+def older_messages(user, other, before_id, limit):
+    """
+    One "load older" page, oldest first: hot rows below `before_id`,
+    topped up from archive segments once the hot table runs out.
+    """
+    hot = list(
+        Message.objects.conversation(user, other).filter(id__lt=before_id)
+        .exclude(deleted_for=user)
+        .order_by("-id")[:limit]
+    )
+    usernames = {user.id: user.username, other.id: other.username}
+    page = [
+        {
+            "message_id": m.id,
+            "sender": usernames[m.sender_id],
+            "content": m.content,
+            "image": m.image.url if m.image else None,
+            "audio": m.audio.url if m.audio else None,
+            "timestamp": m.timestamp.isoformat(),
+        }
+        for m in hot
+    ]
+    if len(page) < limit:
+        oldest = hot[-1].id if hot else before_id
+        page += archived_before(user, other, oldest, limit - len(page))
+    page.reverse()
+    return page
+
+
+def iter_archived(user):
+    """Every archived message involving `user`, for data export."""
+    segments = MessageArchive.objects.filter(
+        Q(user_low=user) | Q(user_high=user)
+    ).select_related("user_low", "user_high").order_by("id")
+    for segment in segments.iterator(chunk_size=4):
+        usernames = {
+            segment.user_low_id: segment.user_low.username,
+            segment.user_high_id: segment.user_high.username,
+        }
+        for rec in unpack(segment.data):
+            if user.id in rec[7]:
+                continue
+            row = _serialize_record(rec, usernames)
+            row["image"], row["audio"] = rec[3] or None, rec[4] or None
+            yield row
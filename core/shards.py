@@ -0,0 +1,371 @@
+import bisect
+import hashlib
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.models import Q, Value
+from django.db.models.functions import Greatest
+from django.db.models.signals import pre_delete
+
+
+# Models stored on the message shards (app_label.model_name)
+SHARDED_MODELS = {
+    "core.message", "core.messagedeletion", "core.conversation", "core.conversationevent",
+}
+
+
+def shard_aliases():
+    return list(getattr(settings, "MESSAGE_SHARDS", []))
+
+
+def message_databases():
+    """Every database that can hold messages: the primary keeps pre-sharding rows."""
+    return [DEFAULT_DB_ALIAS, *shard_aliases()]
+
+
+def _id_span():
+    return getattr(settings, "MESSAGE_SHARD_ID_SPAN", 2 ** 40)
+
+
+def _pk(user):
+    return int(getattr(user, "pk", user))
+
+
+def ordered_pair(user_a, user_b):
+    """(low, high) ids of a conversation's users, instances or ids, either way round."""
+    return tuple(sorted((_pk(user_a), _pk(user_b))))
+
+
+def pair_of(fields):
+    """(sender, receiver) from Message field kwargs, instances or ids."""
+    return (
+        fields["sender"] if "sender" in fields else fields["sender_id"],
+        fields["receiver"] if "receiver" in fields else fields["receiver_id"],
+    )
+
+
+# ======================================================
+# PLACEMENT
+# ======================================================
+def _weight(low, high, alias):
+    digest = hashlib.blake2b(f"{low}:{high}:{alias}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+def shard_for(user_a, user_b):
+    """
+    The alias holding the conversation between two users (instances or
+    ids), or None when messages aren't sharded. Rendezvous hashing on
+    the ordered pair: both directions land together, and adding a shard
+    only moves the conversations the new one wins.
+    """
+    aliases = shard_aliases()
+    if not aliases:
+        return None
+    low, high = ordered_pair(user_a, user_b)
+    return max(aliases, key=lambda alias: _weight(low, high, alias))
+
+
+def id_range(alias):
+    """
+    [first, end) of the message ids `alias` hands out. Ranges follow the
+    position in MESSAGE_SHARDS (append new shards, never reorder); range
+    0 is the primary's, so ids stay unique across databases.
+    """
+    span = _id_span()
+    index = 0 if alias == DEFAULT_DB_ALIAS else shard_aliases().index(alias) + 1
+    return index * span, (index + 1) * span
+
+
+def shard_for_id(message_id):
+    """The alias a message id was issued by, or None for the primary."""
+    index = int(message_id) // _id_span()
+    aliases = shard_aliases()
+    if 1 <= index <= len(aliases):
+        return aliases[index - 1]
+    return None
+
+
+def prepare_shard(alias):
+    """Start the shard's message id sequence at its range. Idempotent."""
+    from .models import Message
+
+    table = Message._meta.db_table
+    first, _ = id_range(alias)
+    connection = connections[alias]
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("SELECT seq FROM sqlite_sequence WHERE name = %s", [table])
+            row = cursor.fetchone()
+            if row is None:
+                cursor.execute(
+                    "INSERT INTO sqlite_sequence (name, seq) VALUES (%s, %s)", [table, first - 1]
+                )
+            elif row[0] < first - 1:
+                cursor.execute(
+                    "UPDATE sqlite_sequence SET seq = %s WHERE name = %s", [first - 1, table]
+                )
+        elif connection.vendor == "postgresql":
+            quoted = connection.ops.quote_name(table)
+            cursor.execute(
+                f"SELECT setval(pg_get_serial_sequence(%s, 'id'), "
+                f"GREATEST(%s, (SELECT COALESCE(MAX(id), 0) FROM {quoted})))",
+                [table, first - 1],
+            )
+        else:
+            raise NotImplementedError(f"No id ranges for {connection.vendor} shards")
+
+
+# ======================================================
+# ROUTER
+# ======================================================
+def _sharded(model):
+    return model._meta.label_lower in SHARDED_MODELS
+
+
+class MessageShardRouter:
+    """
+    Messages (and their delete-for-me rows) go where the instance is:
+    the database it was loaded from, or for a new one the shard of its
+    conversation. Queries without an instance fall through to the next
+    router (the primary), so anything conversation-scoped must use
+    Message.objects.conversation()/for_pair()/for_id().
+    """
+
+    def _db_for(self, model, instance):
+        if not shard_aliases() or not _sharded(model):
+            return None
+        if instance is None or not _sharded(instance.__class__):
+            return None
+        if not instance._state.adding:
+            return instance._state.db
+        name = instance._meta.model_name
+        if name == "message" and None not in (instance.sender_id, instance.receiver_id):
+            return shard_for(instance.sender_id, instance.receiver_id)
+        if name == "conversation" and None not in (instance.user_low_id, instance.user_high_id):
+            return shard_for(instance.user_low_id, instance.user_high_id)
+        if name == "messagedeletion" and instance.message_id is not None:
+            return shard_for_id(instance.message_id) or DEFAULT_DB_ALIAS
+        return None
+
+    def db_for_read(self, model, **hints):
+        return self._db_for(model, hints.get("instance"))
+
+    def db_for_write(self, model, **hints):
+        return self._db_for(model, hints.get("instance"))
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Users stay on the primary; messages point at them across databases
+        if _sharded(obj1.__class__) or _sharded(obj2.__class__):
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in shard_aliases():
+            return f"{app_label}.{model_name}" in SHARDED_MODELS
+        return None
+
+
+# ======================================================
+# REBALANCING
+# ======================================================
+def misplaced_conversations(source):
+    """[(low, high, target)] for conversations on `source` that hash elsewhere."""
+    from .models import Conversation, Message
+
+    pairs = {
+        tuple(sorted(pair))
+        for pair in Message.objects.using(source)
+        .values_list("sender_id", "receiver_id").distinct().iterator()
+    }
+    # Including ones whose messages are all gone: their sequence must not restart
+    pairs.update(Conversation.objects.using(source).values_list("user_low_id", "user_high_id"))
+    placed = ((low, high, shard_for(low, high)) for low, high in pairs)
+    return sorted(entry for entry in placed if entry[2] != source)
+
+
+class ShardConflict(Exception):
+    """The target database already has a different history for a conversation."""
+
+
+def _pair(low, high):
+    return Q(sender_id=low, receiver_id=high) | Q(sender_id=high, receiver_id=low)
+
+
+def _check_target(low, high, source, target):
+    """
+    Raise ShardConflict unless every numbered message and event the
+    target already has for the conversation is a copy of the source's
+    (left by an interrupted move, and skipped when it runs again).
+    """
+    from .models import ConversationEvent, Message
+
+    kinds = [
+        (Message, ("sender_id", "content"),
+         lambda db: Message.objects.using(db).filter(_pair(low, high), seq__isnull=False)),
+        (ConversationEvent, ("kind", "message_seq", "actor_id"),
+         lambda db: ConversationEvent.objects.using(db).filter(
+             conversation__user_low_id=low, conversation__user_high_id=high
+         )),
+    ]
+    for model, fields, rows in kinds:
+        copied = {row[0]: row[1:] for row in rows(target).values_list("seq", *fields)}
+        if not copied:
+            continue
+        originals = {
+            row[0]: row[1:]
+            for row in rows(source).filter(seq__in=list(copied)).values_list("seq", *fields)
+        }
+        clashes = sorted(seq for seq, row in copied.items() if originals.get(seq) != row)
+        if clashes:
+            raise ShardConflict(
+                f"{low}/{high}: {target} has its own {model._meta.model_name} "
+                f"seq {clashes[0]} (of {len(clashes)}); not moving it from {source}"
+            )
+
+
+def move_conversation(user_a, user_b, source, target, batch_size=500):
+    """
+    Copy one conversation from `source` to `target` oldest first, so the
+    new ids (from the target's range) keep its order, then delete it
+    from `source`. Sequence numbers stay as they are; read watermarks
+    and the change log follow the messages onto their new ids.
+    Not atomic across the two databases: run with chat writes stopped.
+    Running it again after an interruption reuses what was copied; a
+    target with messages or events of its own raises ShardConflict
+    before anything moves. Returns the number of messages moved.
+    """
+    from .bulk import batched_delete
+    from .models import Conversation, Message, MessageDeletion, ReadWatermark
+
+    low, high = ordered_pair(user_a, user_b)
+    _check_target(low, high, source, target)
+    rows = Message.objects.using(source).filter(_pair(low, high)).order_by("id")
+
+    old_ids, new_ids = [], []
+    while True:
+        batch = list(rows.filter(id__gt=old_ids[-1] if old_ids else 0)[:batch_size])
+        if not batch:
+            break
+        # Copies an interrupted run already made, by sequence number
+        copied = dict(
+            Message.objects.using(target).filter(
+                _pair(low, high), seq__in=[m.seq for m in batch if m.seq is not None]
+            ).values_list("seq", "id")
+        )
+        todo = [m for m in batch if m.seq not in copied]
+        deletions = MessageDeletion.objects.using(source).filter(
+            message__in=todo
+        ).values_list("message_id", "user_id")
+        copies = [
+            Message(
+                sender_id=m.sender_id, receiver_id=m.receiver_id, content=m.content,
+                image=m.image.name, audio=m.audio.name, read=m.read, seq=m.seq,
+            )
+            for m in todo
+        ]
+        with transaction.atomic(using=target):
+            Message.objects.using(target).bulk_create(copies)
+            # auto_now_add stamped the copies with now(): restore the originals
+            for copy, m in zip(copies, todo):
+                copy.timestamp = m.timestamp
+            Message.objects.using(target).bulk_update(copies, ["timestamp"])
+            new_id = {m.id: copy.id for m, copy in zip(todo, copies)}
+            MessageDeletion.objects.using(target).bulk_create([
+                MessageDeletion(message_id=new_id[message_id], user_id=user_id)
+                for message_id, user_id in deletions
+            ])
+        old_ids += [m.id for m in batch]
+        new_ids += [copied[m.seq] if m.seq in copied else new_id[m.id] for m in batch]
+
+    first, end = id_range(source)
+
+    def remap(message_id, at_or_below=False):
+        # Exact copies, or (for read positions) the newest copy of a
+        # message <= message_id. Ids of deleted messages stay as they
+        # were, and so do ids already outside the source's range.
+        if not first <= message_id < end:
+            return message_id
+        seen = bisect.bisect_right(old_ids, message_id)
+        if seen and (at_or_below or old_ids[seen - 1] == message_id):
+            return new_ids[seen - 1]
+        return 0 if at_or_below else message_id
+
+    # The log first and the source's rows last: a run cut short anywhere
+    # leaves the source's conversation for the next one to finish
+    _move_log(low, high, source, target, remap, batch_size)
+    if old_ids:
+        marks = ReadWatermark.objects.filter(
+            Q(user_id=low, other_id=high) | Q(user_id=high, other_id=low)
+        )
+        for mark in marks:
+            marks.filter(pk=mark.pk).update(last_read_id=remap(mark.last_read_id, True))
+        batched_delete(rows.filter(id__lte=old_ids[-1]), batch_size)
+    # Its events go with it
+    Conversation.objects.using(source).filter(user_low_id=low, user_high_id=high).delete()
+    return len(old_ids)
+
+
+def _move_log(low, high, source, target, remap, batch_size):
+    """
+    The conversation's sequence counter and events, after its messages.
+    The target's counter ends at the larger of the two; events it
+    already has (see _check_target) are skipped.
+    """
+    from .models import Conversation, ConversationEvent
+
+    conversation = Conversation.objects.using(source).filter(
+        user_low_id=low, user_high_id=high
+    ).first()
+    if conversation is None:
+        return
+    moved, created = Conversation.objects.using(target).get_or_create(
+        user_low_id=low, user_high_id=high, defaults={"last_seq": conversation.last_seq}
+    )
+    if not created:
+        Conversation.objects.using(target).filter(pk=moved.pk).update(
+            last_seq=Greatest("last_seq", Value(conversation.last_seq))
+        )
+    events = ConversationEvent.objects.using(source).filter(
+        conversation=conversation
+    ).order_by("seq")
+    last_seq = 0
+    while True:
+        batch = list(events.filter(seq__gt=last_seq)[:batch_size])
+        if not batch:
+            break
+        copied = set(
+            ConversationEvent.objects.using(target).filter(
+                conversation=moved, seq__in=[e.seq for e in batch]
+            ).values_list("seq", flat=True)
+        )
+        ConversationEvent.objects.using(target).bulk_create([
+            ConversationEvent(
+                conversation=moved, seq=e.seq, kind=e.kind,
+                message_id=e.message_id and remap(e.message_id, e.kind == ConversationEvent.READ),
+                message_seq=e.message_seq, actor_id=e.actor_id,
+            )
+            for e in batch if e.seq not in copied
+        ])
+        last_seq = batch[-1].seq
+
+
+# ======================================================
+# CASCADES THE DATABASE CAN'T DO
+# ======================================================
+def _delete_user_messages(sender, instance, **kwargs):
+    # The collector only cascades on the primary
+    from .models import Conversation, Message
+
+    for alias in shard_aliases():
+        Message.objects.using(alias).filter(
+            Q(sender_id=instance.pk) | Q(receiver_id=instance.pk)
+        ).delete()
+        Conversation.objects.using(alias).filter(
+            Q(user_low_id=instance.pk) | Q(user_high_id=instance.pk)
+        ).delete()
+
+
+pre_delete.connect(
+    _delete_user_messages, sender=settings.AUTH_USER_MODEL, dispatch_uid="shards_user_delete"
+)
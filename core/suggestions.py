@@ -0,0 +1,113 @@
+import math
+from collections import Counter
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count
+
+from .models import Follow, User
+from .usercache import get_many
+
+
+def _limit():
+    return getattr(settings, "SUGGESTIONS_LIMIT", 15)
+
+
+def _ttl():
+    return getattr(settings, "SUGGESTIONS_TTL", 60 * 30)
+
+
+def cache_key(user_id):
+    return f"suggestions:{user_id}"
+
+
+# ======================================================
+# RANKING
+# ======================================================
+def popular_user_ids(limit=100):
+    """Most-followed users, shared by everyone's cold-start list."""
+    key = "suggestions:popular"
+    ranked = cache.get(key)
+    if ranked is None:
+        ranked = list(
+            Follow.objects.values("following_id")
+            .annotate(n=Count("id"))
+            .order_by("-n")
+            .values_list("following_id", "n")[:limit]
+        )
+        cache.set(key, ranked, _ttl())
+    return ranked
+
+
+def compute_suggestions(user_id, limit=None):
+    """
+    Rank "who to follow" candidates for one user from the Follow graph:
+    friends-of-friends weighted by how many of your follows follow them,
+    plus a log-scaled popularity bonus. Already-followed users and the
+    user themself are excluded. Returns compact dicts, not User rows.
+    """
+    limit = limit or _limit()
+
+    # A subquery, not a Python set: someone following thousands of
+    # accounts would otherwise ship every id back in each IN (...)
+    followed = Follow.objects.filter(follower_id=user_id).values("following_id")
+
+    scores = Counter()
+    fof = (
+        Follow.objects.filter(follower_id__in=followed)
+        .exclude(following_id__in=followed)
+        .exclude(following_id=user_id)
+        .values("following_id")
+        .annotate(n=Count("id"))
+        .order_by("-n")
+        .values_list("following_id", "n")[: limit * 10]
+    )
+    for candidate, n in fof:
+        scores[candidate] += 2.0 * n
+
+    popular = popular_user_ids()
+    excluded = {user_id} | set(
+        Follow.objects.filter(
+            follower_id=user_id, following_id__in=[uid for uid, _ in popular]
+        ).values_list("following_id", flat=True)
+    )
+    for candidate, n in popular:
+        if candidate not in excluded:
+            scores[candidate] += math.log1p(n)
+
+    ranked = [uid for uid, _ in scores.most_common(limit)]
+
+    # Not enough graph signal yet (new users, tiny sites): pad with newest users
+    if len(ranked) < limit:
+        ranked += list(
+            User.objects.exclude(id__in=followed)
+            .exclude(id__in=[user_id, *ranked])
+            .order_by("-date_joined")
+            .values_list("id", flat=True)[: limit - len(ranked)]
+        )
+
+    summaries = get_many(ranked)
+    return [summaries[uid] for uid in ranked if uid in summaries]
+
+
+# ======================================================
+# CACHE
+# ======================================================
+def get_suggestions(user):
+    """One cache read on the hot path; computed on miss."""
+    key = cache_key(user.id)
+    suggestions = cache.get(key)
+    if suggestions is None:
+        suggestions = refresh_suggestions(user.id)
+    return suggestions
+
+
+def refresh_suggestions(user_id):
+    suggestions = compute_suggestions(user_id)
+    cache.set(cache_key(user_id), suggestions, _ttl())
+    return suggestions
+
+
+def invalidate_suggestions(user_id):
+    """Called when a user's follow set changes."""
+    cache.delete(cache_key(user_id))
@@ -0,0 +1,148 @@
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef, Q
+
+from .models import Conversation, ConversationEvent, Message, MessageDeletion
+from .usercache import get_many
+
+
+def _page_size():
+    return getattr(settings, "CHAT_SYNC_PAGE_SIZE", 200)
+
+
+# ======================================================
+# WRITING EVENTS
+# ======================================================
+def record(message, kind, actor_id):
+    """
+    Append an event about `message` to its conversation's log, on the
+    message's database. Run it in the same transaction as the change.
+    """
+    return _append(
+        message.sender_id, message.receiver_id, message._state.db,
+        kind, message.id, message.seq, actor_id,
+    )
+
+
+def record_archived(user_a_id, user_b_id, message_id, kind, actor_id):
+    """record() for a message that now lives in an archive segment."""
+    using = Message.objects.for_pair(user_a_id, user_b_id).db
+    with transaction.atomic(using=using):
+        return _append(user_a_id, user_b_id, using, kind, message_id, None, actor_id)
+
+
+def _append(user_a_id, user_b_id, using, kind, message_id, message_seq, actor_id):
+    conversation, seq = Conversation.objects.advance(user_a_id, user_b_id, using)
+    ConversationEvent.objects.using(using).create(
+        conversation=conversation, seq=seq, kind=kind,
+        message_id=message_id, message_seq=message_seq, actor_id=actor_id,
+    )
+    return seq
+
+
+def delete_for_me(message, user):
+    with transaction.atomic(using=message._state.db):
+        if not message.is_visible_to(user):
+            return
+        message.deleted_for.add(user)
+        record(message, ConversationEvent.DELETED_FOR_ME, user.id)
+
+
+def delete_for_everyone(message):
+    with transaction.atomic(using=message._state.db):
+        # The tombstone keeps the id; the message row goes
+        record(message, ConversationEvent.DELETED_FOR_EVERYONE, message.sender_id)
+        message.delete()
+
+
+def record_reads(marks):
+    """A read event per advanced watermark [(reader_id, other_id, message_id)]."""
+    for reader_id, other_id, message_id in marks:
+        message = Message.objects.for_id(message_id).filter(
+            Q(sender_id=reader_id, receiver_id=other_id) |
+            Q(sender_id=other_id, receiver_id=reader_id),
+            id=message_id,
+        ).only("id", "seq", "sender_id", "receiver_id").first()
+        if message is None:
+            # Not a message of this conversation (or already gone)
+            continue
+        with transaction.atomic(using=message._state.db):
+            record(message, ConversationEvent.READ, reader_id)
+
+
+# ======================================================
+# READING CHANGES
+# ======================================================
+def current_seq(user, other):
+    """The conversation's latest sequence number, 0 before its first message."""
+    low, high = sorted((user.id, other.id))
+    using = Message.objects.for_pair(user, other).db
+    return Conversation.objects.using(using).filter(
+        user_low_id=low, user_high_id=high
+    ).values_list("last_seq", flat=True).first() or 0
+
+
+def events_since(conversation_id, user_id, since, using=None):
+    """The log after `since` as `user_id` may see it, oldest first."""
+    return (
+        ConversationEvent.objects.using(using)
+        .filter(conversation_id=conversation_id, seq__gt=since)
+        .filter(~Q(kind=ConversationEvent.DELETED_FOR_ME) | Q(actor_id=user_id))
+        .annotate(hidden=Exists(MessageDeletion.objects.using(using).filter(
+            message_id=OuterRef("message_id"), user_id=user_id
+        )))
+        .select_related("message")
+        .order_by("seq")
+    )
+
+
+def changes_since(user, other, since, limit=None):
+    """
+    (events, seq, has_more): what changed in the conversation after
+    `since`, oldest first, as `user` sees it. One range scan of the
+    (conversation, seq) index; deleted-for-me checks ride along as a
+    correlated lookup on the same statement. `seq` is where to resume.
+    """
+    limit = limit or _page_size()
+    low, high = sorted((user.id, other.id))
+    using = Message.objects.for_pair(user, other).db
+    conversation_id = Conversation.objects.using(using).filter(
+        user_low_id=low, user_high_id=high
+    ).values_list("id", flat=True).first()
+    if conversation_id is None:
+        return [], since, False
+
+    rows = list(events_since(conversation_id, user.id, since, using)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    names = get_many([user.id, other.id])
+    events = []
+    for row in rows:
+        if row.kind == ConversationEvent.NEW:
+            # Gone (deleted for everyone, archived, purged) or hidden for this user
+            if row.message is None or row.hidden:
+                continue
+            m = row.message
+            events.append({
+                "seq": row.seq,
+                "type": row.kind,
+                "message_id": m.id,
+                "sender": names.get(m.sender_id, {}).get("username", ""),
+                "content": m.content,
+                "image": m.image.url if m.image else None,
+                "audio": m.audio.url if m.audio else None,
+                "timestamp": m.timestamp.isoformat(),
+            })
+            continue
+        event = {
+            "seq": row.seq,
+            "type": row.kind,
+            "message_id": row.message_id,
+            "message_seq": row.message_seq,
+        }
+        if row.kind == ConversationEvent.READ:
+            event["reader"] = names.get(row.actor_id, {}).get("username", "")
+        events.append(event)
+
+    return events, (rows[-1].seq if rows else since), has_more
@@ -0,0 +1,40 @@
+from django import template
+from django.urls import reverse
+from django.utils.html import escape, format_html
+from django.utils.safestring import mark_safe
+
+from core.textindex import TOKEN_RE, clean_url, clean_username, normalize_tag
+
+register = template.Library()
+
+
+@register.filter
+def richtext(text):
+    """Escape `text` and link its URLs, #hashtags and @mentions."""
+    text = text or ""
+    out = []
+    pos = 0
+    for m in TOKEN_RE.finditer(text):
+        url, tag, username = m.groups()
+        raw = m.group(0)
+        if url:
+            link = clean_url(url)
+            html = format_html('<a href="{}" rel="nofollow noopener" target="_blank">{}</a>', link, link)
+            tail = raw[len(link):]
+        elif tag:
+            if tag.isdigit():
+                continue
+            html = format_html('<a href="{}">#{}</a>', reverse("hashtag", args=[normalize_tag(tag)]), tag)
+            tail = ""
+        else:
+            name = clean_username(username)
+            if not name:
+                continue
+            html = format_html('<a href="{}">@{}</a>', reverse("profile", args=[name]), name)
+            tail = raw[len(name) + 1:]
+        out.append(escape(text[pos:m.start()]))
+        out.append(html)
+        out.append(escape(tail))
+        pos = m.end()
+    out.append(escape(text[pos:]))
+    return mark_safe("".join(out))
@@ -1,3 +1,1716 @@
-from django.test import TestCase
+import asyncio
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import tempfile
+import threading
+from datetime import timedelta
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import (
+    DEFAULT_DB_ALIAS, DatabaseError, IntegrityError, connection, connections, router,
+)
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+
+from . import (
+    assets, auth, bulk, export, graph, notifications, profiles, ranking, receipts, replicas, retention,
+    shards, suggestions, sync, textindex, thumbnails, uploads, versions,
+)
+from .models import (
+    Comment, Conversation, Follow, Hashtag, Like, Mention, Message, MessageArchive, MessageDeletion,
+    Notification, Post, PostTag, ReadWatermark, ReplicationHeartbeat, User,
+)
+from .likes import LikeCounterBuffer, like_buffer, set_like
+from .notifications import NotificationBuffer, notification_buffer
+
+
+# Pages render without a collectstatic manifest
+PLAIN_STATIC = {
+    "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+
+
+# ======================================================
+# QUERY PLANS OF THE HOT PATHS
+# ======================================================
+SQLITE_SCAN = re.compile(r"\bSCAN (\S+)")
+SQL_LIMIT = re.compile(r"\bLIMIT\b", re.IGNORECASE)
+
+
+def _postgres_nodes(plan):
+    """[(node line, [detail lines])] from text-format EXPLAIN output."""
+    nodes = []
+    for line in plan.splitlines():
+        text = line.strip()
+        if not nodes or text.startswith("->"):
+            nodes.append((text.removeprefix("->").strip(), []))
+        else:
+            nodes[-1][1].append(text)
+    return nodes
+
+
+def plan_problems(plan, vendor, limited=False):
+    """
+    What in an EXPLAIN plan reads more than a request needs: a sort the
+    database does itself instead of reading an index in order, and a
+    scan of a whole table or index. A scan only passes when the query
+    is `limited` and nothing is sorted, i.e. an ordered walk that stops
+    after the page.
+    """
+    sorts, scans = [], []
+    if vendor == "sqlite":
+        for line in plan.splitlines():
+            if "USE TEMP B-TREE" in line and "ORDER BY" in line:
+                sorts.append(line.strip())
+            m = SQLITE_SCAN.search(line)
+            if m and m.group(1) != "CONSTANT":
+                scans.append(line.strip())
+    else:
+        parent = ""
+        for node, details in _postgres_nodes(plan):
+            if node.startswith("Sort") and not parent.startswith(("GroupAggregate", "Unique")):
+                sorts.append(node)
+            elif node.startswith("Seq Scan"):
+                scans.append(node)
+            elif node.startswith(("Index Scan", "Index Only Scan")) and not any(
+                d.startswith("Index Cond") for d in details
+            ):
+                scans.append(node)
+            parent = node
+    if limited and not sorts:
+        return []
+    return sorts + scans
+
+
+@override_settings(STORAGES=PLAIN_STATIC)
+class QueryPlanTests(TestCase):
+    """
+    Request the pages and XHR endpoints a logged-in user hits all the
+    time and EXPLAIN every SELECT they run, failing on a full scan or a
+    sort the indexes should have answered. Catches a dropped index, or a
+    view rewritten so its query can no longer use one. Search is left
+    out: substring matching scans by nature.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.alice = User.objects.create_user("alice", password="pw")
+        cls.bob = User.objects.create_user("bob", password="pw")
+        Follow.objects.create(follower=cls.alice, following=cls.bob)
+        cls.post = Post.objects.create(author=cls.bob, caption="#plans first")
+        Post.objects.create(author=cls.bob, caption="#plans second")
+        Comment.objects.create(user=cls.alice, post=cls.post, text="nice")
+        Like.objects.create(user=cls.alice, post=cls.post)
+        cls.messages = [
+            Message.objects.create(sender=sender, receiver=receiver, content=str(i))
+            for i, (sender, receiver) in enumerate([(cls.alice, cls.bob), (cls.bob, cls.alice)] * 2)
+        ]
+
+    def setUp(self):
+        if connection.vendor not in ("sqlite", "postgresql"):
+            self.skipTest(f"no plan parser for {connection.vendor}")
+        cache.clear()
+        buffer = mock.patch.object(receipts, "read_buffer", receipts.ReadWatermarkBuffer())
+        buffer.start()
+        self.addCleanup(buffer.stop)
+        self.addCleanup(receipts.read_buffer.flush)
+        self.client.force_login(self.alice)
+
+    def explain(self, sql, params=()):
+        with connection.cursor() as cursor:
+            if connection.vendor == "sqlite":
+                cursor.execute("EXPLAIN QUERY PLAN " + sql, params)
+                return "\n".join(row[-1] for row in cursor.fetchall())
+            # Tiny test tables make a seq scan "cheapest"; ask what
+            # the planner would do when it has a choice
+            cursor.execute("SET enable_seqscan = off")
+            try:
+                cursor.execute("EXPLAIN " + sql, params)
+                return "\n".join(row[0] for row in cursor.fetchall())
+            finally:
+                cursor.execute("SET enable_seqscan = on")
+
+    def assertIndexed(self, **requests):
+        for name, (url, params, *xhr) in requests.items():
+            with self.subTest(view=name):
+                headers = {"x-requested-with": "XMLHttpRequest"} if xhr else {}
+                # The first request fills the cached aggregates (trending,
+                # suggestions): check the ones every request after it runs
+                self.client.get(url, params, headers=headers)
+                with CaptureQueriesContext(connection) as queries:
+                    response = self.client.get(url, params, headers=headers)
+                self.assertLess(response.status_code, 400)
+                for sql in (q["sql"] for q in queries.captured_queries):
+                    if not sql.lstrip().upper().startswith("SELECT"):
+                        continue
+                    plan = self.explain(sql)
+                    limited = bool(SQL_LIMIT.search(sql))
+                    self.assertEqual(
+                        plan_problems(plan, connection.vendor, limited), [],
+                        f"{name} reads too much:\n{sql}\n{plan}",
+                    )
+
+    def test_posts_and_profiles(self):
+        self.assertIndexed(
+            feed=("/feed/", {}),
+            profile=("/profile/bob/", {}),
+            follow_counts=("/profile/bob/counts/", {}),
+            post_comments=(f"/post/{self.post.id}/comments/", {}),
+            post_likes=(f"/post/{self.post.id}/likes/", {}),
+            hashtag=("/tags/plans/", {}),
+            notifications=("/notifications/", {}),
+        )
+
+    def test_chat(self):
+        first, last = self.messages[0].id, self.messages[-1].id
+        self.assertIndexed(
+            chat_page=("/chat/bob/", {}),
+            chat_poll=("/chat/bob/", {"last_id": first}, "xhr"),
+            chat_history=("/chat/bob/", {"before_id": last}, "xhr"),
+            chat_sync=("/sync/bob/", {"since": 1}),
+            chat_unread=("/chat-unread/", {}),
+        )
+
+    def test_detects_full_scan(self):
+        # Guard the parser itself: an unindexed filter must be reported
+        plan = self.explain(*Post.objects.filter(caption__icontains="x").query.sql_with_params())
+        self.assertNotEqual(plan_problems(plan, connection.vendor), [])
+
+    def test_detects_sort(self):
+        # ... and so must an ORDER BY no index answers, even under a LIMIT
+        plan = self.explain(*Post.objects.order_by("caption")[:10].query.sql_with_params())
+        self.assertNotEqual(plan_problems(plan, connection.vendor, True), [])
+
+    def test_limit_excuses_an_ordered_walk(self):
+        plan = self.explain(*Post.objects.order_by("-id")[:10].query.sql_with_params())
+        self.assertNotEqual(plan_problems(plan, connection.vendor), [])
+        self.assertEqual(plan_problems(plan, connection.vendor, True), [])
+
+
+# ======================================================
+# VERSION COUNTERS AND ETAGS
+# ======================================================
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class VersionTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.post = Post.objects.create(author=self.alice, caption="versioned")
+        self.client.force_login(self.alice)
+        self.url = f"/post/{self.post.id}/likes/"
+
+    def test_bump_moves_the_version(self):
+        key = versions.post_likes_key(self.post.id)
+        before = versions.get_version(key)
+        self.assertEqual(versions.get_version(key), before)
+        versions.bump(key)
+        self.assertNotEqual(versions.get_version(key), before)
+
+    def test_etags_need_a_shared_cache(self):
+        # Per-process counters: another worker may have changed the data
+        self.assertFalse(versions.shared())
+        response = self.client.get(self.url)
+        self.assertNotIn("ETag", response)
+        again = self.client.get(self.url, HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(again.status_code, 200)
+
+    def test_conditional_get_with_shared_cache(self):
+        with mock.patch("core.versions.shared", return_value=True):
+            etag = self.client.get(self.url)["ETag"]
+            self.assertEqual(self.client.get(self.url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+            versions.bump(versions.post_likes_key(self.post.id))
+            changed = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed["ETag"], etag)
+
+
+# ======================================================
+# CACHED REQUEST USER
+# ======================================================
+@override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.locmem.LocMemCache"}})
+class CachedAuthTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.client.force_login(self.alice)
+        self.addCleanup(auth.invalidate, self.alice.id)
+
+    def whoami(self):
+        # 302 to the login page once the session no longer resolves
+        return self.client.get("/chat-unread/").status_code
+
+    def test_local_cache_reads_the_row(self):
+        self.whoami()
+        self.assertIsNone(cache.get(auth.user_key(self.alice.id)))
+
+    def test_cached_user_is_rechecked(self):
+        with mock.patch("core.auth.shared", return_value=True):
+            self.assertEqual(self.whoami(), 200)
+            cached = cache.get(auth.user_key(self.alice.id))
+            # The row minus its password hash
+            self.assertNotIn(self.alice.password, repr(cached))
+            request = self.client_request()
+            request.session.items()  # the session row, read up front
+            with self.assertNumQueries(0):
+                user = auth.get_user(request)
+                self.assertEqual((user, user.username), (self.alice, "alice"))
+
+            # Deactivated without a signal (another worker, a bulk update):
+            # the cached copy says so and must not be let in
+            cached["values"][auth._cached_fields().index("is_active")] = False
+            cache.set(auth.user_key(self.alice.id), cached)
+            User.objects.filter(pk=self.alice.pk).update(is_active=False)
+            self.assertEqual(self.whoami(), 302)
+
+    def test_password_change_ends_cached_sessions(self):
+        with mock.patch("core.auth.shared", return_value=True):
+            self.assertEqual(self.whoami(), 200)
+            self.assertIsNotNone(cache.get(auth.user_key(self.alice.id)))
+            # Another session changes the password: the save drops the
+            # shared entry and the old session's hash no longer matches
+            self.alice.set_password("new")
+            self.alice.save()
+            self.assertEqual(self.whoami(), 302)
+
+    def client_request(self):
+        request = RequestFactory().get("/")
+        request.session = self.client.session
+        return request
+
+
+# ======================================================
+# FEED PAGES
+# ======================================================
+class FeedPageTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.posts = [Post.objects.create(author=self.alice, caption=f"p{i}") for i in range(5)]
+        for i, post in enumerate(self.posts):
+            # Two posts share a score: the id breaks the tie
+            Post.objects.filter(pk=post.pk).update(score=[3.0, 1.5, 1.5, 4.0, 0.25][i])
+
+    def walk(self, ordering, page_size=2):
+        pages, cursor = [], None
+        while True:
+            posts, cursor = ranking.feed_page(Post.objects.all(), cursor, page_size, ordering)
+            pages.append([p.caption for p in posts])
+            if cursor is None:
+                return pages
+
+    def test_chronological_pages(self):
+        self.assertEqual(self.walk("chronological"), [["p4", "p3"], ["p2", "p1"], ["p0"]])
+
+    def test_ranked_pages(self):
+        self.assertEqual(self.walk("ranked"), [["p3", "p0"], ["p2", "p1"], ["p4"]])
+
+    def test_malformed_cursors(self):
+        for ordering, cursor in [
+            ("chronological", "abc"), ("chronological", "1.0"), ("chronological", "-5"),
+            ("ranked", "x:1"), ("ranked", "1.5"), ("ranked", "nan:3"), ("ranked", "1.5:x"),
+        ]:
+            with self.subTest(ordering=ordering, cursor=cursor):
+                with self.assertRaises(ranking.InvalidCursor):
+                    ranking.feed_page(Post.objects.all(), cursor, 2, ordering)
+
+    @override_settings(STORAGES=PLAIN_STATIC)
+    def test_views_answer_400(self):
+        self.client.force_login(self.alice)
+        Hashtag.objects.create(name="tag")
+        for url in ["/feed/", "/profile/alice/", "/tags/tag/"]:
+            with self.subTest(url=url):
+                self.assertEqual(self.client.get(url, {"cursor": "abc"}).status_code, 400)
+                self.assertEqual(self.client.get(url, {"cursor": "1"}).status_code, 200)
+
+
+# ======================================================
+# PROFILE GRID, THUMBNAILS AND HEADER STATS
+# ======================================================
+def png(size=(64, 48)):
+    out = BytesIO()
+    Image.new("RGB", size, "red").save(out, "PNG")
+    return SimpleUploadedFile("photo.png", out.getvalue(), content_type="image/png")
+
+
+class ProfileTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(
+            STORAGES=PLAIN_STATIC, MEDIA_ROOT=media.name, PROFILE_PAGE_SIZE=2
+        )
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        # Counts cached by an earlier test, under the same reused user ids
+        cache.clear()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.client.force_login(self.alice)
+
+    def test_grid_pages_by_cursor(self):
+        posts = [Post.objects.create(author=self.bob, caption=f"p{i}") for i in range(5)]
+        Post.objects.create(author=self.alice, caption="not bob's")
+        pages, params = [], {}
+        while True:
+            response = self.client.get("/profile/bob/", params)
+            pages.append([p.caption for p in response.context["posts"]])
+            if not response.context["next_cursor"]:
+                break
+            params = {"cursor": response.context["next_cursor"]}
+        self.assertEqual(pages, [["p4", "p3"], ["p2", "p1"], ["p0"]])
+        self.assertEqual(response.context["stats"]["posts"], len(posts))
+
+    def test_post_page_without_an_author_summary(self):
+        post = Post.objects.create(author=self.bob, caption="orphan")
+        with mock.patch("core.usercache.get", return_value=None):
+            response = self.client.get(f"/post/{post.id}/")
+        self.assertContains(response, "deleted user")
+
+    def test_header_stats_follow_changes(self):
+        stats = profiles.header_stats
+        self.assertEqual(stats(self.bob.id), {"posts": 0, "followers": 0, "following": 0})
+
+        post = Post.objects.create(author=self.bob, caption="one")
+        follow = Follow.objects.create(follower=self.alice, following=self.bob)
+        self.assertEqual(stats(self.bob.id), {"posts": 1, "followers": 1, "following": 0})
+        self.assertEqual(stats(self.alice.id)["following"], 1)
+
+        # Edits and score updates keep the cached counts
+        post.caption = "edited"
+        post.save()
+        with self.assertNumQueries(0):
+            stats(self.bob.id)
+
+        post.delete()
+        follow.delete()
+        self.assertEqual(stats(self.bob.id), {"posts": 0, "followers": 0, "following": 0})
+        self.assertEqual(stats(self.alice.id)["following"], 0)
+
+    def test_thumbnail_is_made_after_the_request(self):
+        with mock.patch("core.thumbnails.threading.Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                post = Post.objects.create(author=self.bob, image=png())
+                self.assertFalse(thread.called)
+        # Not decoded on the way in; a thread does it once committed
+        self.assertFalse(Post.objects.get(pk=post.pk).thumbnail)
+        self.assertEqual(thread.call_args.kwargs["args"], (post.pk,))
+        thread.return_value.start.assert_called_once_with()
+
+        self.assertTrue(thumbnails.make_thumbnail(post))
+        post.refresh_from_db()
+        with post.thumbnail.open("rb") as fh:
+            self.assertEqual(Image.open(fh).size, (settings.THUMBNAIL_SIZE,) * 2)
+
+    def test_undecodable_image_is_not_retried(self):
+        with mock.patch("core.thumbnails.threading.Thread"):
+            post = Post.objects.create(
+                author=self.bob, image=SimpleUploadedFile("broken.png", b"not a png")
+            )
+        self.assertIsNone(thumbnails.make_thumbnail(post))
+        post.refresh_from_db()
+        self.assertTrue(post.thumbnail_failed)
+
+        with mock.patch("core.thumbnails.threading.Thread") as thread:
+            with self.captureOnCommitCallbacks(execute=True):
+                post.save()
+        self.assertFalse(thread.called)
+        out = StringIO()
+        call_command("make_thumbnails", stdout=out)
+        self.assertIn("Made 0 thumbnails (0 unreadable", out.getvalue())
+
+    def test_deleting_a_post_deletes_its_thumbnail(self):
+        with mock.patch("core.thumbnails.threading.Thread"):
+            post = Post.objects.create(author=self.bob, image=png())
+        thumbnails.make_thumbnail(post)
+        storage, name = post.thumbnail.storage, post.thumbnail.name
+        self.assertTrue(storage.exists(name))
+
+        with self.captureOnCommitCallbacks(execute=True):
+            post.delete()
+        self.assertFalse(storage.exists(name))
+
+
+# ======================================================
+# HASHTAGS
+# ======================================================
+class HashtagTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.client.force_login(self.alice)
+
+    def test_extract_tags(self):
+        tags, mentions, links = textindex.extract(
+            "Hello #World and #world, #2024 (#paren) a#b ##double "
+            "https://x.com/page#frag @bob."
+        )
+        # In first-seen order, once each; not inside words, URLs or after another #
+        self.assertEqual(tags, ["world", "paren"])
+        self.assertEqual(mentions, ["bob"])
+        self.assertEqual(links, ["https://x.com/page#frag"])
+
+    def test_normalize_tag(self):
+        for raw, name in [("Django", "django"), ("ＣＡＴ", "cat"), ("Straße", "strasse")]:
+            with self.subTest(raw=raw):
+                self.assertEqual(textindex.normalize_tag(raw), name)
+
+    @override_settings(STORAGES=PLAIN_STATIC)
+    def test_search_opens_the_tag_page(self):
+        Post.objects.create(author=self.alice, caption="first #Django post")
+        response = self.client.get("/search/", {"q": "#DJANGO"}, follow=True)
+        self.assertEqual(response.redirect_chain, [("/tags/django/", 302)])
+        self.assertEqual([p.caption for p in response.context["posts"]], ["first #Django post"])
+
+    @override_settings(STORAGES=PLAIN_STATIC)
+    def test_unused_tag_shows_the_empty_page(self):
+        response = self.client.get("/search/", {"q": "#NewTag"}, follow=True)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "No posts with #newtag yet.")
+        self.assertFalse(Hashtag.objects.exists())
+
+
+# ======================================================
+# DATA EXPORT
+# ======================================================
+class ExportTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.carol = User.objects.create_user("carol", password="pw")
+
+    def test_message_names_resolve_once_per_chunk(self):
+        for other in (self.bob, self.carol, self.bob):
+            Message.objects.create(sender=self.alice, receiver=other, content="hi")
+            Message.objects.create(sender=other, receiver=self.alice, content="hey")
+        with mock.patch("core.export.get_many", wraps=export.get_many) as get_many:
+            rows = list(export.iter_messages(self.alice, chunk_size=4))
+        self.assertEqual(get_many.call_count, 2)
+        self.assertEqual(
+            [(r["sender__username"], r["receiver__username"]) for r in rows[:2]],
+            [("alice", "bob"), ("bob", "alice")],
+        )
+        self.assertEqual(len(rows), 6)
+
+    def test_stock_avatar_is_not_exported(self):
+        self.assertEqual(self.alice.profile_image.name, export.DEFAULT_AVATAR)
+        self.assertEqual(list(export.media_files(self.alice)), [])
+        self.alice.profile_image.name = "profiles/alice.png"
+        self.assertEqual(list(export.media_files(self.alice)), ["profiles/alice.png"])
+
+
+# ======================================================
+# BULK DELETES AND COUNTS
+# ======================================================
+class BulkTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.addCleanup(notification_buffer.flush)
+
+    def test_batched_delete_reports_each_batch(self):
+        for i in range(5):
+            Post.objects.create(author=self.alice, caption=f"p{i}")
+        seen, progress = [], []
+        done = bulk.batched_delete(
+            Post.objects.all(), batch_size=2,
+            progress=progress.append, before_batch=lambda ids: seen.append(len(ids)),
+        )
+        self.assertEqual((done, seen, progress), (5, [2, 2, 1], [2, 4, 5]))
+        self.assertFalse(Post.objects.exists())
+
+    def test_deleting_a_user_releases_their_likes(self):
+        counted = Post.objects.create(author=self.alice, caption="counted")
+        drifted = Post.objects.create(author=self.alice, caption="drifted")
+        for post in (counted, drifted):
+            Like.objects.create(user=self.bob, post=post)
+        Post.objects.filter(pk=counted.pk).update(like_count=3)
+        # A counter that lags its likes must not go negative
+        Post.objects.filter(pk=drifted.pk).update(like_count=0)
+
+        totals = bulk.delete_user_data(self.bob)
+        self.assertEqual(totals["likes given"], 2)
+        self.assertEqual(
+            dict(Post.objects.values_list("caption", "like_count")), {"counted": 2, "drifted": 0}
+        )
+        self.assertFalse(User.objects.filter(pk=self.bob.pk).exists())
+
+    def test_estimated_count_after_deletes(self):
+        posts = [Post.objects.create(author=self.alice, caption=f"p{i}") for i in range(4)]
+        posts[1].delete()
+        posts[3].delete()
+        self.assertEqual(bulk.estimated_count(Post.objects.all()), 2)
+        self.assertEqual(bulk.estimated_count(Post.objects.filter(caption="p0")), 1)
+
+    def test_estimated_count_uses_statistics(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("sqlite_stat1 is SQLite's")
+        for i in range(3):
+            Post.objects.create(author=self.alice, caption=f"p{i}")
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE core_post")
+        Post.objects.create(author=self.alice, caption="after the stats")
+        # As of the last ANALYZE: an estimate, not a COUNT
+        self.assertEqual(bulk.estimated_count(Post.objects.all()), 3)
+
+
+# ======================================================
+# CHUNKED UPLOADS
+# ======================================================
+class ChunkedUploadTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        overrides = override_settings(STORAGES=PLAIN_STATIC, MEDIA_ROOT=media.name)
+        overrides.enable()
+        self.addCleanup(overrides.disable)
+        self.media = media.name
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.client.force_login(self.alice)
+        self.data = png().read()
+
+    def start(self, data, kind="image", filename="photo.png"):
+        response = self.client.post("/uploads/", {
+            "kind": kind, "filename": filename, "size": len(data),
+            "sha256": hashlib.sha256(data).hexdigest(),
+        }, content_type="application/json")
+        self.assertEqual(response.status_code, 201)
+        return response.json()["upload_id"]
+
+    def send(self, upload_id, data, offset):
+        return self.client.post(
+            f"/uploads/{upload_id}/", data, content_type="application/octet-stream",
+            headers={"Upload-Offset": str(offset)},
+        )
+
+    def upload(self, data, received=None, filename="photo.png"):
+        upload_id = self.start(data, filename=filename)
+        received = received or data
+        half = len(received) // 2
+        self.send(upload_id, received[:half], 0)
+        self.send(upload_id, received[half:], half)
+        return upload_id
+
+    def complete(self, upload_id, **payload):
+        return self.client.post(
+            f"/uploads/{upload_id}/complete/", payload, content_type="application/json"
+        )
+
+    def stored_files(self):
+        return sorted(
+            os.path.relpath(os.path.join(root, name), self.media)
+            for root, _, names in os.walk(self.media) for name in names
+            if not root.startswith(uploads.temp_dir())
+        )
+
+    def test_parts_resume_at_the_server_offset(self):
+        upload_id = self.start(self.data)
+        self.assertEqual(self.send(upload_id, self.data[:10], 0).json()["offset"], 10)
+        # A retried or skipped part is refused with where to resume
+        for offset in (0, 20):
+            response = self.send(upload_id, self.data[offset:offset + 10], offset)
+            self.assertEqual((response.status_code, response.json()["offset"]), (409, 10))
+        self.assertEqual(self.client.get(f"/uploads/{upload_id}/").json()["offset"], 10)
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+
+    def test_completed_upload_becomes_a_post(self):
+        upload_id = self.upload(self.data)
+        response = self.complete(upload_id, caption="chunked")
+        self.assertEqual(response.status_code, 200)
+        post = Post.objects.get(pk=response.json()["post_id"])
+        with post.image.open("rb") as fh:
+            self.assertEqual(fh.read(), self.data)
+        self.assertFalse(os.path.exists(os.path.join(uploads.temp_dir(), f"{upload_id}.part")))
+        self.assertEqual(self.complete(upload_id).status_code, 409)
+
+    def test_completed_upload_becomes_a_message(self):
+        upload_id = self.upload(self.data)
+        response = self.complete(upload_id, to="bob", content="look")
+        message = Message.objects.get(pk=response.json()["message_id"])
+        self.assertEqual((message.content, message.seq), ("look", 1))
+        self.assertTrue(message.image.name.startswith("chat_images/"))
+
+    def test_corrupted_upload_is_refused(self):
+        upload_id = self.upload(self.data, received=self.data[:-1] + b"!")
+        self.assertEqual(self.complete(upload_id).status_code, 422)
+        self.assertEqual(self.stored_files(), [])
+
+    def test_only_listed_extensions_start(self):
+        for kind, filename in [("image", "page.html"), ("image", "vector.svg"), ("audio", "x.js")]:
+            with self.subTest(filename=filename):
+                response = self.client.post("/uploads/", {
+                    "kind": kind, "filename": filename, "size": 10, "sha256": "0" * 64,
+                }, content_type="application/json")
+                self.assertEqual(response.status_code, 415)
+
+    def test_image_must_really_be_one(self):
+        html = b"<html><script>alert(1)</script></html>"
+        upload_id = self.upload(html, filename="photo.png")
+        self.assertEqual(self.complete(upload_id).status_code, 415)
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(Post.objects.exists())
+
+    def test_image_extension_comes_from_its_format(self):
+        upload_id = self.upload(self.data, filename="photo.jpg")
+        post = Post.objects.get(pk=self.complete(upload_id).json()["post_id"])
+        self.assertTrue(post.image.name.endswith(".png"))
+
+    def test_failed_save_leaves_the_upload_retryable(self):
+        upload_id = self.upload(self.data)
+        with mock.patch.object(Post, "save", side_effect=DatabaseError("disk full")):
+            with self.assertRaises(DatabaseError):
+                self.complete(upload_id)
+        # No orphaned file, and not marked complete
+        self.assertEqual(self.stored_files(), [])
+        self.assertFalse(self.client.get(f"/uploads/{upload_id}/").json()["complete"])
+
+        response = self.complete(upload_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.stored_files(), [Post.objects.get().image.name])
+
+
+# ======================================================
+# LIKE COUNTER BUFFER
+# ======================================================
+class LikeCounterTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.post = Post.objects.create(author=self.alice, caption="liked")
+        self.buffer = LikeCounterBuffer(window=60)
+        self.addCleanup(self.buffer.flush)
+
+    def test_unlike_flushed_before_its_like_counts_the_rows(self):
+        bob = User.objects.create_user("bob")
+        carol = User.objects.create_user("carol")
+        Like.objects.create(user=bob, post=self.post)
+        # Carol liked on another worker and unliked here; this -1 reaches
+        # the row before that worker's +1s for both likes
+        self.buffer.add(self.post.id, -1)
+        self.buffer.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+
+        other_worker = LikeCounterBuffer(window=60)
+        other_worker.add(self.post.id, 2)
+        other_worker.flush()
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 1)
+        self.assertFalse(Like.objects.filter(user=carol).exists())
+
+    def test_failed_write_keeps_deltas(self):
+        fans = [User.objects.create_user(f"fan{i}") for i in range(4)]
+        Like.objects.bulk_create([Like(user=fan, post=self.post) for fan in fans])
+        self.buffer.add(self.post.id, 3)
+        with mock.patch("core.likes.score_bump", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.assertEqual(self.buffer.pending(self.post.id), 3)
+
+        self.buffer.add(self.post.id, 1)
+        self.assertEqual(self.buffer.flush(), 1)
+        self.post.refresh_from_db()
+        self.assertEqual(self.post.like_count, 4)
+
+    def test_quiet_worker_flushes_on_timer(self):
+        flushed = threading.Event()
+        buffer = LikeCounterBuffer(window=0.01)
+        with mock.patch.object(buffer, "flush", side_effect=flushed.set):
+            buffer.add(self.post.id, 1)
+            self.assertTrue(flushed.wait(5))
+
+    def test_set_like_is_idempotent(self):
+        bob = User.objects.create_user("bob", password="pw")
+        self.addCleanup(like_buffer.flush)
+        self.addCleanup(notification_buffer.flush)
+        self.assertEqual(set_like(bob, self.post, True), (True, 1))
+        self.assertEqual(set_like(bob, self.post, True), (True, 1))
+        self.assertEqual(set_like(bob, self.post, False), (False, 0))
+        self.assertEqual(like_buffer.pending(self.post.id), 0)
+
+    def test_likes_etag_moves_once_the_count_is_stored(self):
+        bob = User.objects.create_user("bob", password="pw")
+        self.addCleanup(notification_buffer.flush)
+        key = versions.post_likes_key(self.post.id)
+        before = versions.get_version(key)
+        with mock.patch("core.likes.like_buffer", self.buffer):
+            set_like(bob, self.post, True)
+        self.assertEqual(versions.get_version(key), before)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.buffer.flush()
+        self.assertNotEqual(versions.get_version(key), before)
+
+    def test_like_and_comment_views(self):
+        bob = User.objects.create_user("bob", password="pw")
+        self.client.force_login(bob)
+        self.addCleanup(like_buffer.flush)
+        self.addCleanup(notification_buffer.flush)
+        xhr = {"HTTP_X_REQUESTED_WITH": "XMLHttpRequest"}
+        liked = self.client.post(f"/post/{self.post.id}/like/", {"liked": "1"}, **xhr).json()
+        self.assertEqual(liked, {"liked": True, "total_likes": 1})
+        unliked = self.client.post(f"/post/{self.post.id}/like/", {"liked": "0"}, **xhr).json()
+        self.assertEqual(unliked, {"liked": False, "total_likes": 0})
+
+        self.client.post(f"/post/{self.post.id}/comment/", {"text": " hi "}, **xhr)
+        self.assertEqual(Comment.objects.get(post=self.post).text, "hi")
+
+
+# ======================================================
+# NOTIFICATION BUFFER
+# ======================================================
+class NotificationBufferTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.fans = [User.objects.create_user(f"fan{i}") for i in range(5)]
+        self.post = Post.objects.create(author=self.alice, caption="popular")
+        self.buffer = NotificationBuffer(window=60)
+
+    def like(self, actor, post=None):
+        post = post or self.post
+        self.buffer.add(post.author_id, Notification.LIKE, actor.id, post_id=post.id)
+
+    def row(self):
+        return Notification.objects.get(recipient=self.alice, verb=Notification.LIKE)
+
+    def test_actors_are_counted_once(self):
+        for fan in self.fans:
+            self.like(fan)
+        self.buffer.flush()
+        self.assertEqual(self.row().actor_count, 5)
+
+        # Liking again is the same actor, moved to the front
+        self.like(self.fans[0])
+        self.buffer.flush()
+        self.assertEqual(self.row().actor_count, 5)
+        self.assertEqual(self.row().actors[0], self.fans[0].id)
+
+        self.like(User.objects.create_user("newcomer"))
+        self.buffer.flush()
+        self.assertEqual(self.row().actor_count, 6)
+        # One row write per flush: no per-actor rows
+        self.assertEqual(Notification.objects.count(), 1)
+
+    @mock.patch("core.notifications.MAX_ACTORS", 3)
+    def test_actor_list_is_capped(self):
+        for fan in self.fans:
+            self.like(fan)
+        self.buffer.flush()
+        self.assertEqual(self.row().actors, [f.id for f in self.fans[:1:-1]])
+        self.assertEqual(self.row().actor_count, 5)
+
+    def test_failed_write_keeps_events(self):
+        self.like(self.fans[0])
+        with mock.patch("core.notifications._write", side_effect=RuntimeError("db down")):
+            with self.assertRaises(RuntimeError):
+                self.buffer.flush()
+        self.like(self.fans[1])
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.row().actors, [self.fans[1].id, self.fans[0].id])
+
+    def test_quiet_worker_flushes_on_timer(self):
+        flushed = threading.Event()
+        buffer = NotificationBuffer(window=0.01)
+        with mock.patch.object(buffer, "flush", side_effect=flushed.set):
+            buffer.add(self.alice.id, Notification.LIKE, self.fans[0].id, post_id=self.post.id)
+            self.assertTrue(flushed.wait(5))
+
+    def test_bad_page_cursor_is_a_400(self):
+        self.client.force_login(self.alice)
+        with mock.patch("core.views.notification_buffer", self.buffer):
+            for before in ("abc", "-1", "1.5"):
+                with self.subTest(before=before):
+                    response = self.client.get("/notifications/", {"before": before})
+                    self.assertEqual(response.status_code, 400)
+            self.assertEqual(self.client.get("/notifications/", {"before": "5"}).status_code, 200)
+
+    def test_deleted_post_does_not_sink_the_batch(self):
+        doomed = Post.objects.create(author=self.alice, caption="deleted soon")
+        self.like(self.fans[0], doomed)
+        self.like(self.fans[1])
+        doomed.delete()
+        self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.row().actors, [self.fans[1].id])
+
+    def test_failing_group_is_isolated(self):
+        bob = User.objects.create_user("bob")
+        self.like(self.fans[0])
+        self.buffer.add(bob.id, Notification.FOLLOW, self.fans[0].id)
+        write = notifications._write
+
+        def flaky(events):
+            if any(key[0] == bob.id for key in events):
+                raise IntegrityError("recipient deleted")
+            return write(events)
+
+        with mock.patch("core.notifications._write", side_effect=flaky):
+            self.assertEqual(self.buffer.flush(), 1)
+        self.assertEqual(self.row().actor_count, 1)
+
+    def test_reading_flushes_only_own_events(self):
+        bob = User.objects.create_user("bob", password="pw")
+        self.like(self.fans[0])
+        self.buffer.add(bob.id, Notification.FOLLOW, self.fans[0].id)
+        with mock.patch("core.views.notification_buffer", self.buffer):
+            self.client.force_login(self.alice)
+            data = self.client.get("/notifications/").json()
+        self.assertEqual(len(data["notifications"]), 1)
+        self.assertFalse(Notification.objects.filter(recipient=bob).exists())
+        self.assertEqual(self.buffer.flush(), 1)
+
+
+# ======================================================
+# WHO TO FOLLOW
+# ======================================================
+class SuggestionTests(TestCase):
+    def setUp(self):
+        # The popular list is cached under one key for everyone
+        cache.clear()
+        me, f1, f2, x, y, z = (
+            User.objects.create_user(name) for name in ("me", "f1", "f2", "x", "y", "z")
+        )
+        self.me, self.x, self.y, self.z = me, x, y, z
+        for follower, following in (
+            (me, f1), (me, f2),
+            (f1, x), (f2, x), (f1, y),
+            # Back at me, and at someone I already follow
+            (f1, me), (f1, f2),
+        ):
+            Follow.objects.create(follower=follower, following=following)
+
+    def ids(self, **kwargs):
+        return [s["id"] for s in suggestions.compute_suggestions(self.me.id, **kwargs)]
+
+    def test_friends_of_friends_rank_first(self):
+        # x is followed by both my follows, y by one; z only pads the list
+        self.assertEqual(self.ids(), [self.x.id, self.y.id, self.z.id])
+
+    def test_limit(self):
+        self.assertEqual(self.ids(limit=2), [self.x.id, self.y.id])
+        self.assertEqual(self.ids(limit=1), [self.x.id])
+
+    def test_followed_ids_stay_in_the_database(self):
+        with CaptureQueriesContext(connection) as ctx:
+            self.ids()
+        fof = next(q["sql"] for q in ctx.captured_queries if "COUNT" in q["sql"])
+        # The follow set is a nested SELECT, not a list of ids
+        self.assertIn("IN (SELECT", fof)
+
+
+# ======================================================
+# STATIC BUNDLES
+# ======================================================
+# The optional minifiers aren't installed here; make sure of it
+@mock.patch.dict("sys.modules", {"rcssmin": None, "rjsmin": None})
+class AssetTests(TestCase):
+    def test_css_fallback_only_drops_comments_and_whitespace(self):
+        css = (
+            "/*! keep */\n/* drop */\n"
+            ".nav a :hover {\n  width: calc(100% - 2px);\n  margin: 0 auto;\n}\n"
+            "ul > li + li , p ~ p { color : red ; }\n"
+            'q::before { content: "a , b  /* c */ { d }"; }\n'
+        )
+        self.assertEqual(
+            assets.minify_css(css),
+            "/*! keep */ .nav a :hover{width: calc(100% - 2px);margin: 0 auto;}"
+            "ul > li + li,p ~ p{color : red;}"
+            'q::before{content: "a , b  /* c */ { d }";}\n',
+        )
+
+    def test_js_fallback_keeps_tokens(self):
+        js = "// header\nfunction f(a) {\n    /* note */\n    return a + 1; // inline\n}\n\n"
+        self.assertEqual(
+            assets.minify_js(js), "function f(a) {\nreturn a + 1; // inline\n}\n"
+        )
+
+    def test_build_writes_each_bundle(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(STATICFILES_DIRS=[tmp]):
+            os.makedirs(os.path.join(tmp, "src"))
+            for name, text in (("a.css", "a { color: red; }"), ("b.css", "b { color: blue; }")):
+                with open(os.path.join(tmp, "src", name), "w") as f:
+                    f.write(text)
+
+            written = assets.build({"dist/x.min.css": ["src/a.css", "src/b.css"]})
+            with open(os.path.join(tmp, "dist", "x.min.css")) as f:
+                output = f.read()
+        self.assertEqual(output, "a{color: red;}b{color: blue;}\n")
+        self.assertEqual(written, {"dist/x.min.css": len(output)})
+
+    def test_manifest_hashes_every_bundle(self):
+        with tempfile.TemporaryDirectory() as tmp, override_settings(STATIC_ROOT=tmp):
+            # The checked-in bundles: whatever url() they point at has to
+            # resolve for post-processing
+            call_command("collectstatic", interactive=False, verbosity=0)
+
+            from django.contrib.staticfiles.storage import staticfiles_storage
+            for name in assets.BUNDLES:
+                hashed = staticfiles_storage.stored_name(name)
+                self.assertNotEqual(hashed, name)
+                self.assertTrue(os.path.exists(os.path.join(tmp, hashed)))
+                self.assertTrue(os.path.exists(os.path.join(tmp, hashed + ".gz")))
+
+
+# ======================================================
+# CONVERSATION SEQUENCES AND /sync
+# ======================================================
+class ChatSyncTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.client.force_login(self.alice)
+
+    def send(self, sender, receiver, content):
+        return Message.objects.create(sender=sender, receiver=receiver, content=content)
+
+    def changes(self, since=0, user=None):
+        client = self.client
+        if user is not None:
+            client = self.client_class()
+            client.force_login(user)
+        other = self.bob if user in (None, self.alice) else self.alice
+        return client.get(f"/sync/{other.username}/", {"since": since}).json()
+
+    def test_messages_are_numbered_per_conversation(self):
+        carol = User.objects.create_user("carol")
+        first = self.send(self.alice, self.bob, "a")
+        elsewhere = self.send(self.alice, carol, "elsewhere")
+        second = self.send(self.bob, self.alice, "b")
+        self.assertEqual((first.seq, second.seq, elsewhere.seq), (1, 2, 1))
+
+        data = self.changes()
+        self.assertEqual(
+            [(e["seq"], e["type"], e["content"]) for e in data["events"]],
+            [(1, "new", "a"), (2, "new", "b")],
+        )
+        self.assertEqual((data["seq"], data["has_more"]), (2, False))
+        self.assertEqual(self.changes(since=2)["events"], [])
+        receipts.read_buffer.flush()
+
+    def test_deletions_are_tombstones(self):
+        kept = self.send(self.bob, self.alice, "kept")
+        hidden = self.send(self.bob, self.alice, "hidden for alice")
+        gone = self.send(self.alice, self.bob, "gone")
+        since = gone.seq
+
+        self.client.post(f"/delete-message/{hidden.id}/delete_for_me/")
+        self.client.post(f"/delete-message/{gone.id}/delete_for_everyone/")
+
+        alice = self.changes(since=since)["events"]
+        self.assertEqual(
+            [(e["type"], e["message_id"]) for e in alice],
+            [("deleted_for_me", hidden.id), ("deleted_for_everyone", gone.id)],
+        )
+        # The other participant isn't told about alice's delete-for-me
+        bob = self.changes(since=since, user=self.bob)["events"]
+        self.assertEqual([e["type"] for e in bob], ["deleted_for_everyone"])
+
+        # A fresh device: only what alice can still see, then the tombstones
+        self.assertEqual(
+            [(e["type"], e["message_id"]) for e in self.changes()["events"]],
+            [("new", kept.id), ("deleted_for_me", hidden.id), ("deleted_for_everyone", gone.id)],
+        )
+        receipts.read_buffer.flush()
+
+    def test_reads_are_events(self):
+        carol = User.objects.create_user("carol")
+        message = self.send(self.alice, self.bob, "read me")
+        receipts.mark_read(self.bob.id, self.alice.id, message.id)
+        # Not a message of bob's conversation with carol: no event there
+        receipts.mark_read(self.bob.id, carol.id, message.id)
+        receipts.read_buffer.flush()
+        self.assertEqual(sync.current_seq(self.bob, carol), 0)
+
+        events = self.changes(since=message.seq)["events"]
+        self.assertEqual(
+            [(e["type"], e["reader"], e["message_id"], e["message_seq"]) for e in events],
+            [("read", "bob", message.id, message.seq)],
+        )
+
+    @override_settings(CHAT_SYNC_PAGE_SIZE=2)
+    def test_pages_and_revalidation(self):
+        for i in range(3):
+            self.send(self.bob, self.alice, f"m{i}")
+
+        first = self.changes()
+        self.assertEqual(([e["seq"] for e in first["events"]], first["has_more"]), ([1, 2], True))
+        rest = self.changes(since=first["seq"])
+        self.assertEqual(([e["seq"] for e in rest["events"]], rest["has_more"]), ([3], False))
+
+        with mock.patch("core.versions.shared", return_value=True):
+            response = self.client.get("/sync/bob/", {"since": 3})
+            unchanged = self.client.get("/sync/bob/", {"since": 3}, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(unchanged.status_code, 304)
+        self.assertEqual(self.client.get("/sync/bob/", {"since": "x"}).status_code, 400)
+        receipts.read_buffer.flush()
+
+
+# ======================================================
+# MESSAGE ARCHIVE
+# ======================================================
+class MessageArchiveTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.client.force_login(self.alice)
+        self.messages = [
+            Message.objects.create(sender=sender, receiver=receiver, content=f"m{i}")
+            for i, (sender, receiver) in enumerate(
+                [(self.alice, self.bob), (self.bob, self.alice)] * 2 + [(self.alice, self.bob)]
+            )
+        ]
+        old = timezone.now() - timedelta(days=400)
+        Message.objects.filter(id__in=[m.id for m in self.messages[:3]]).update(timestamp=old)
+        self.archived = retention.archive_conversation(
+            self.alice.id, self.bob.id, timezone.now() - timedelta(days=365)
+        )
+
+    def page(self, user, other, before_id, limit):
+        return [m["content"] for m in retention.older_messages(user, other, before_id, limit)]
+
+    def test_archive_and_history_paging(self):
+        self.assertEqual(self.archived, (3, 0))
+        self.assertEqual(Message.objects.count(), 2)
+        segment = MessageArchive.objects.get()
+        self.assertEqual((segment.first_id, segment.last_id, segment.count),
+                         (self.messages[0].id, self.messages[2].id, 3))
+
+        newest = self.messages[-1].id + 1
+        # Hot rows first, topped up from the archive
+        self.assertEqual(self.page(self.alice, self.bob, newest, 3), ["m2", "m3", "m4"])
+        self.assertEqual(self.page(self.alice, self.bob, self.messages[2].id, 3), ["m0", "m1"])
+        self.assertEqual(self.page(self.bob, self.alice, self.messages[1].id, 3), ["m0"])
+
+    def delete(self, message, action, user=None):
+        client = self.client
+        if user is not None:
+            client = self.client_class()
+            client.force_login(user)
+        return client.post(f"/delete-message/{message.id}/{action}/")
+
+    def test_delete_archived_for_me(self):
+        m1 = self.messages[1]
+        self.assertEqual(self.delete(m1, "delete_for_me").status_code, 200)
+        newest = self.messages[-1].id + 1
+        self.assertEqual(self.page(self.alice, self.bob, newest, 5), ["m0", "m2", "m3", "m4"])
+        self.assertEqual(self.page(self.bob, self.alice, newest, 5), ["m0", "m1", "m2", "m3", "m4"])
+        events, _, _ = sync.changes_since(self.alice, self.bob, sync.current_seq(self.alice, self.bob) - 1)
+        self.assertEqual(
+            [(e["type"], e["message_id"]) for e in events], [("deleted_for_me", m1.id)]
+        )
+
+        # Deleted by both: dropped from the segment, like archiving does
+        self.assertEqual(self.delete(m1, "delete_for_me", user=self.bob).status_code, 200)
+        self.assertEqual(MessageArchive.objects.get().count, 2)
+
+    def test_delete_archived_for_everyone(self):
+        m0, m1, m2 = self.messages[:3]
+        self.assertEqual(self.delete(m1, "delete_for_everyone").status_code, 403)
+        self.assertEqual(self.delete(m2, "delete_for_everyone").status_code, 200)
+        segment = MessageArchive.objects.get()
+        self.assertEqual((segment.count, segment.last_id), (2, m1.id))
+        self.assertEqual(self.page(self.bob, self.alice, self.messages[3].id, 5), ["m0", "m1"])
+
+        self.assertEqual(self.delete(m0, "delete_for_everyone").status_code, 200)
+        self.assertEqual(self.delete(m1, "delete_for_everyone", user=self.bob).status_code, 200)
+        self.assertFalse(MessageArchive.objects.exists())
+        self.assertEqual(self.delete(m0, "delete_for_me").status_code, 404)
+
+    def test_strangers_cannot_reach_archived_messages(self):
+        carol = User.objects.create_user("carol", password="pw")
+        self.assertEqual(self.delete(self.messages[0], "delete_for_me", user=carol).status_code, 404)
+        self.assertEqual(MessageArchive.objects.get().count, 3)
+
+
+# ======================================================
+# READ WATERMARKS
+# ======================================================
+class ReadReceiptTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.client.force_login(self.alice)
+        # Ids repeat across rolled-back tests: don't inherit "already written"
+        buffer = mock.patch.object(receipts, "read_buffer", receipts.ReadWatermarkBuffer())
+        buffer.start()
+        self.addCleanup(buffer.stop)
+        self.addCleanup(receipts.read_buffer.flush)
+
+    def send(self, sender, receiver, content):
+        return Message.objects.create(sender=sender, receiver=receiver, content=content)
+
+    def watermark(self):
+        return receipts.last_read(self.alice.id, self.bob.id)
+
+    def test_poll_marks_only_delivered_messages(self):
+        first = self.send(self.bob, self.alice, "one")
+        self.client.get("/chat/bob/", {"last_id": 10 ** 12}, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(self.watermark(), 0)
+
+        self.client.get("/chat/bob/", {"last_id": 0}, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        self.assertEqual(self.watermark(), first.id)
+        # A message sent after a stale tab's huge last_id is still unread
+        later = self.send(self.bob, self.alice, "two")
+        self.client.get("/chat/bob/", {"last_id": 10 ** 12}, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+        receipts.read_buffer.flush()
+        self.assertEqual(receipts.unread_counts(self.alice.id), {self.bob.id: 1})
+        self.assertLess(self.watermark(), later.id)
+
+    @override_settings(CHANNEL_LAYERS={"default": {"BACKEND": "channels.layers.InMemoryChannelLayer"}})
+    def test_socket_read_is_clamped_and_validated(self):
+        from channels.testing import WebsocketCommunicator
+        from .consumers import ChatConsumer
+
+        first = self.send(self.bob, self.alice, "one")
+
+        async def ack(*payloads):
+            communicator = WebsocketCommunicator(ChatConsumer.as_asgi(), "/ws/chat/bob/")
+            communicator.scope["user"] = self.alice
+            communicator.scope["url_route"] = {"kwargs": {"username": "bob"}}
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+            for payload in payloads:
+                await communicator.send_json_to(payload)
+            # The bad payloads didn't drop the socket: the last one lands
+            for _ in range(100):
+                if receipts.read_buffer.pending(self.alice.id, self.bob.id):
+                    break
+                await asyncio.sleep(0.02)
+            await communicator.disconnect()
+
+        async_to_sync(ack)(
+            {"type": "read", "last_read_id": "abc"},
+            {"type": "read", "last_read_id": [1]},
+            {"type": "read", "last_read_id": 10 ** 12},
+        )
+        self.assertEqual(self.watermark(), first.id)
+
+    def test_unread_counts_one_query_per_database(self):
+        others = [User.objects.create_user(f"friend{i}") for i in range(5)]
+        for other in others:
+            seen = self.send(other, self.alice, "seen")
+            self.send(other, self.alice, "new")
+            receipts.mark_read(self.alice.id, other.id, seen.id)
+        self.send(self.bob, self.alice, "never opened")
+        receipts.read_buffer.flush()
+
+        # The watermarks, then never-opened and past-watermark counts
+        with self.assertNumQueries(3):
+            counts = receipts.unread_counts(self.alice.id)
+        self.assertEqual(counts, {**{o.id: 1 for o in others}, self.bob.id: 1})
+
+    def test_failed_flush_keeps_the_marks(self):
+        first = self.send(self.bob, self.alice, "one")
+        second = self.send(self.bob, self.alice, "two")
+        buffer = receipts.read_buffer
+        buffer.advance(self.alice.id, self.bob.id, first.id)
+        with mock.patch.object(
+            ReadWatermark.objects, "bulk_create", side_effect=DatabaseError("gone away")
+        ):
+            with self.assertRaises(DatabaseError):
+                buffer.flush()
+        self.assertEqual(buffer.pending(self.alice.id, self.bob.id), first.id)
+
+        # A later, higher mark wins over the restored one; a lower one doesn't
+        buffer.advance(self.alice.id, self.bob.id, second.id)
+        buffer._restore({(self.alice.id, self.bob.id): first.id})
+        self.assertEqual(buffer.pending(self.alice.id, self.bob.id), second.id)
+        buffer.flush()
+        self.assertEqual(self.watermark(), second.id)
+
+
+# ======================================================
+# FOLLOW GRAPH
+# ======================================================
+class FollowGraphTests(TestCase):
+    def setUp(self):
+        # Not one a view of an earlier test started building
+        graph.reset_graph()
+        self.users = [User.objects.create_user(f"user{i}") for i in range(5)]
+        a, b, c, d, _ = (u.id for u in self.users)
+        for follower, following in ((a, b), (b, a), (a, c), (c, b), (d, b)):
+            Follow.objects.create(follower_id=follower, following_id=following)
+        self.addCleanup(graph.reset_graph)
+
+    def ids(self, *indexes):
+        return [self.users[i].id for i in indexes]
+
+    def assertQueries(self, g):
+        a, b, c, d, e = self.ids(0, 1, 2, 3, 4)
+        self.assertEqual(list(g.following(a)), [b, c])
+        self.assertEqual(list(g.followers(b)), [a, c, d])
+        self.assertEqual(list(g.following(e)), [])
+        self.assertEqual(list(g.followers(10 ** 6)), [])
+        self.assertTrue(g.follows(c, b))
+        self.assertFalse(g.follows(b, c))
+        self.assertTrue(g.is_mutual(a, b))
+        self.assertEqual(list(g.mutuals(a)), [b])
+        self.assertEqual(list(g.follower_overlap(b, c)), [a])
+        self.assertEqual(list(g.followed_by_people_you_follow(a, b)), [c])
+        self.assertEqual(g.degree(b), (1, 3))
+
+    def test_intersect(self):
+        self.assertEqual(graph.intersect([1, 3, 5, 7], [2, 3, 4, 7, 9]), [3, 7])
+        self.assertEqual(graph.intersect([], [1, 2]), [])
+        # Uneven sizes take the binary-search path
+        self.assertEqual(graph.intersect([5, 90, 500], list(range(0, 200, 5))), [5, 90])
+        self.assertTrue(graph.contains([1, 4, 9], 4))
+        self.assertFalse(graph.contains([1, 4, 9], 10))
+
+    def test_csr_lookups(self):
+        self.assertQueries(graph.FollowGraph.from_db())
+        self.assertQueries(graph.DatabaseGraph())
+
+    def test_overlay_and_compaction(self):
+        g = graph.FollowGraph.from_db()
+        a, b, c, d, e = self.ids(0, 1, 2, 3, 4)
+        g.add_edge(e, a)
+        g.remove_edge(d, b)
+        self.assertEqual(list(g.followers(a)), [b, e])
+        self.assertEqual(list(g.followers(b)), [a, c])
+
+        g.compact()
+        self.assertEqual(list(g.followers(a)), [b, e])
+        self.assertEqual(list(g.followers(b)), [a, c])
+        self.assertEqual(g.degree_stats()["edges"], 5)
+
+    @override_settings(FOLLOW_GRAPH_OVERLAY_LIMIT=0)
+    def test_compaction_runs_off_the_request(self):
+        g = graph.FollowGraph.from_db()
+        a, e = self.ids(0, 4)
+        with mock.patch("core.graph.threading.Thread") as thread:
+            g.add_edge(e, a)
+        thread.assert_called_once()
+        self.assertEqual(thread.call_args.kwargs["target"], g.compact)
+        self.assertIn(e, g.followers(a))
+
+    def test_snapshot_round_trip(self):
+        built = graph.FollowGraph.from_db()
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.bin")
+            built.save(path)
+            loaded = graph.FollowGraph.load(path)
+            self.assertQueries(loaded)
+            self.assertEqual(loaded.degree_stats(), built.degree_stats())
+
+            with override_settings(FOLLOW_GRAPH_PATH=path):
+                graph.reset_graph()
+                self.assertIsInstance(graph.get_graph(), graph.FollowGraph)
+
+    def test_ids_past_32_bits(self):
+        csr = graph._CSR.from_pairs([(0, 2 ** 40), (1, 0)], 2)
+        self.assertEqual(list(csr.neighbours(0)), [2 ** 40])
+
+    def test_older_snapshot_layout_is_rebuilt(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "graph.bin")
+            with open(path, "wb") as fh:
+                fh.write(graph.HEADER.pack(b"FGR1", 0, 0))
+            with override_settings(FOLLOW_GRAPH_PATH=path), \
+                    mock.patch("core.graph._start_rebuild") as rebuild:
+                self.assertIsInstance(graph.get_graph(), graph.DatabaseGraph)
+            rebuild.assert_called_once()
+
+    def test_cold_and_stale_graphs_rebuild_in_background(self):
+        missing = os.path.join(tempfile.gettempdir(), "no-such-graph.bin")
+        with override_settings(FOLLOW_GRAPH_PATH=missing), \
+                mock.patch("core.graph._start_rebuild") as rebuild:
+            # Nothing built yet: answered from the table, not built inline
+            self.assertIsInstance(graph.get_graph(), graph.DatabaseGraph)
+            rebuild.assert_called_once()
+
+            stale = graph.FollowGraph.from_db()
+            stale.loaded_at -= 3600
+            graph._graph = stale
+            self.assertIs(graph.get_graph(), stale)
+            self.assertEqual(rebuild.call_count, 2)
+
+    def test_rebuild_keeps_follows_made_meanwhile(self):
+        a, e = self.ids(0, 4)
+        graph._missed = []
+        self.addCleanup(setattr, graph, "_missed", None)
+        # Seen by the signal after the rebuild read the table
+        graph._changed(e, a, True)
+        with mock.patch("core.graph.connections"):
+            graph._rebuild()
+        self.assertIn(e, graph._graph.followers(a))
+        self.assertIsNone(graph._missed)
+
+
+# ======================================================
+# CHAT LOAD TEST
+# ======================================================
+# Sockets authenticate from another thread: the sessions must be committed
+class ChatLoadTestTests(TransactionTestCase):
+    def loadtest(self, **options):
+        out = StringIO()
+        options = {"conversations": 2, "rate": 2, "duration": 0.5, "drain": 2, **options}
+        call_command("loadtest_chat", json=True, stdout=out, **options)
+        return json.loads(out.getvalue())
+
+    def test_every_message_reaches_the_room(self):
+        # Two rooms, each with both participants
+        summary = self.loadtest(clients=4)
+        self.assertEqual(summary["connected"], 4)
+        self.assertEqual(summary["rooms"], 2)
+        self.assertGreater(summary["sent"], 0)
+        # Each message goes to both sockets in its room
+        self.assertEqual(summary["expected_deliveries"], 2 * summary["sent"])
+        self.assertEqual(summary["delivered"], summary["expected_deliveries"])
+        self.assertEqual(summary["dropped"], 0)
+        self.assertFalse(User.objects.filter(username__startswith="loadtest_").exists())
+
+    def test_save_writes_each_message(self):
+        summary = self.loadtest(clients=4, save=True, keep_users=True)
+        self.assertEqual(summary["connected"], 4)
+        self.assertEqual(summary["dropped"], 0)
+        self.assertEqual(User.objects.filter(username__startswith="loadtest_").count(), 4)
+        self.assertEqual(Message.objects.count(), summary["sent"])
+
+
+# ======================================================
+# PRIMARY / REPLICA ROUTING
+# ======================================================
+REPLICA = "replica_test"
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    DATABASE_REPLICAS=[REPLICA],
+    DATABASE_REPLICA_LAG_CHECK=0,
+    DATABASE_REPLICA_MAX_LAG=5,
+)
+class ReplicaRoutingTests(TransactionTestCase):
+    """
+    The primary is the test database; the replica is a second SQLite
+    file that only changes when sync() copies the primary over it, so
+    every test controls exactly how stale the replica is.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        # Registered after the runner's database setup: the replica isn't
+        # a test database, just a file sync() overwrites
+        fd, cls.replica_path = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            REPLICA: {"ENGINE": "django.db.backends.sqlite3", "NAME": cls.replica_path},
+        })
+        connections.settings[REPLICA] = configured[REPLICA]
+        cls.databases = {DEFAULT_DB_ALIAS, REPLICA}
+
+    @classmethod
+    def tearDownClass(cls):
+        connections[REPLICA].close()
+        del connections[REPLICA]
+        del connections.settings[REPLICA]
+        os.remove(cls.replica_path)
+        super().tearDownClass()
+
+    @classmethod
+    def sync(cls):
+        """Replicate: copy the primary's current contents to the replica file."""
+        primary = connections[DEFAULT_DB_ALIAS]
+        primary.ensure_connection()
+        target = sqlite3.connect(cls.replica_path)
+        try:
+            primary.connection.backup(target)
+        finally:
+            target.close()
+
+    def setUp(self):
+        replicas.reset_health()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+        self.post = Post.objects.create(author=self.bob, caption="synced")
+        replicas.measure_lag()  # first heartbeat, so the replica has a baseline
+        self.sync()
+        self.client.force_login(self.alice)
+
+    def test_undecorated_reads_and_all_writes_use_primary(self):
+        self.assertEqual(router.db_for_read(Post), DEFAULT_DB_ALIAS)
+        self.assertEqual(router.db_for_write(Post), DEFAULT_DB_ALIAS)
+        self.assertFalse(router.allow_migrate(REPLICA, "core", model_name="post"))
+
+    def test_decorated_view_reads_replica(self):
+        fresh = Post.objects.create(author=self.bob, caption="not replicated yet")
+        self.assertEqual(self.client.get(f"/post/{self.post.id}/").status_code, 200)
+        # Stale replica: the new post isn't there until the next sync
+        self.assertEqual(self.client.get(f"/post/{fresh.id}/").status_code, 404)
+        self.sync()
+        self.assertEqual(self.client.get(f"/post/{fresh.id}/").status_code, 200)
+
+    def test_write_pins_client_to_primary(self):
+        response = self.client.post(f"/follow/{self.bob.username}/")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(replicas.PIN_COOKIE, response.cookies)
+
+        fresh = Post.objects.create(author=self.bob, caption="not replicated yet")
+        self.assertEqual(self.client.get(f"/post/{fresh.id}/").status_code, 200)
+
+        # Another client without the cookie still reads the stale replica
+        other = self.client_class()
+        other.force_login(self.bob)
+        self.assertEqual(other.get(f"/post/{fresh.id}/").status_code, 404)
+        notification_buffer.flush()
+
+    def test_chat_poll_never_reads_replica(self):
+        # Versioned (ETag) views: the version moves with the primary, so a
+        # stale replica answer would be revalidated as current forever
+        Message.objects.create(sender=self.bob, receiver=self.alice, content="fresh")
+        for url in ("/chat/bob/", "/sync/bob/"):
+            with self.subTest(url=url):
+                response = self.client.get(url, HTTP_X_REQUESTED_WITH="XMLHttpRequest")
+                self.assertIn("fresh", response.content.decode())
+        receipts.read_buffer.flush()
+
+    def test_lagging_replica_is_skipped(self):
+        fresh = Post.objects.create(author=self.bob, caption="not replicated yet")
+        # Replication stalled a minute ago
+        ReplicationHeartbeat.objects.using(REPLICA).filter(pk=1).update(
+            beat_at=timezone.now() - timedelta(minutes=1)
+        )
+        self.assertEqual(replicas.available_replicas(), [])
+        self.assertEqual(self.client.get(f"/post/{fresh.id}/").status_code, 200)
+
+    def test_async_view_reads_replica(self):
+        @replicas.read_replica
+        async def view(request):
+            # Async ORM calls route in a worker thread; the choice follows them there
+            return await sync_to_async(lambda: (router.db_for_read(Post), router.db_for_write(Post)))()
+
+        self.assertEqual(asyncio.run(view(None)), (REPLICA, DEFAULT_DB_ALIAS))
+
+
+# ======================================================
+# MESSAGE SHARDS
+# ======================================================
+SHARDS = ["shard_test1", "shard_test2", "shard_test3"]
+
+
+@override_settings(
+    STORAGES={
+        "default": {"BACKEND": "django.core.files.storage.FileSystemStorage"},
+        "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+    },
+    MESSAGE_SHARDS=SHARDS,
+)
+class MessageShardTests(TransactionTestCase):
+    """
+    Three SQLite files next to the test database, migrated once. The
+    rebalancing test starts unsharded, shards over two of them, then
+    grows to all three.
+    """
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.shard_paths = {}
+        for alias in SHARDS:
+            fd, cls.shard_paths[alias] = tempfile.mkstemp(suffix=".sqlite3")
+            os.close(fd)
+        configured = connections.configure_settings({
+            DEFAULT_DB_ALIAS: connections.settings[DEFAULT_DB_ALIAS],
+            **{
+                alias: {"ENGINE": "django.db.backends.sqlite3", "NAME": path}
+                for alias, path in cls.shard_paths.items()
+            },
+        })
+        for alias in SHARDS:
+            connections.settings[alias] = configured[alias]
+        cls.databases = {DEFAULT_DB_ALIAS, *SHARDS}
+        for alias in SHARDS:
+            call_command("migrate", "core", database=alias, verbosity=0)
+            shards.prepare_shard(alias)
+
+    @classmethod
+    def tearDownClass(cls):
+        for alias, path in cls.shard_paths.items():
+            connections[alias].close()
+            del connections[alias]
+            del connections.settings[alias]
+            os.remove(path)
+        super().tearDownClass()
+
+    def setUp(self):
+        self.users = [User.objects.create_user(f"user{i}", password="pw") for i in range(6)]
+        self.alice, self.bob = self.users[:2]
+        self.client.force_login(self.alice)
+
+    def stored_on(self, message_id):
+        return [
+            alias for alias in [DEFAULT_DB_ALIAS, *SHARDS]
+            if Message.objects.using(alias).filter(id=message_id).exists()
+        ]
+
+    def test_placement_is_symmetric_stable_and_spread(self):
+        pairs = [(a.id, b.id) for a in self.users for b in self.users if a.id < b.id]
+        with override_settings(MESSAGE_SHARDS=SHARDS[:2]):
+            before = {pair: shards.shard_for(*pair) for pair in pairs}
+        self.assertEqual(set(before.values()), set(SHARDS[:2]))
+
+        # A third shard only takes conversations; none move between the old two
+        after = {pair: shards.shard_for(*pair) for pair in pairs}
+        self.assertEqual(set(after.values()), set(SHARDS))
+        for (low, high), alias in after.items():
+            self.assertIn(alias, {before[(low, high)], SHARDS[2]})
+            self.assertEqual(shards.shard_for(high, low), alias)
+
+    def test_writes_land_on_the_conversation_shard(self):
+        home = shards.shard_for(self.alice, self.bob)
+        created = Message.objects.create(sender=self.alice, receiver=self.bob, content="create")
+        saved = Message(sender=self.bob, receiver=self.alice, content="save")
+        saved.save()
+        response = self.client.post(
+            f"/send-message/{self.bob.username}/", {"content": "view"},
+            content_type="application/json",
+        )
+        sent = response.json()["message_id"]
+
+        first, end = shards.id_range(home)
+        for message_id in (created.id, saved.id, sent):
+            self.assertEqual(self.stored_on(message_id), [home])
+            self.assertTrue(first <= message_id < end)
+            self.assertEqual(shards.shard_for_id(message_id), home)
+
+        poll = self.client.get(
+            f"/chat/{self.bob.username}/", HTTP_X_REQUESTED_WITH="XMLHttpRequest"
+        ).json()
+        self.assertEqual([m["content"] for m in poll["messages"]], ["create", "save", "view"])
+        self.assertContains(self.client.get(f"/chat/{self.bob.username}/"), "view")
+        receipts.read_buffer.flush()
+
+    def test_deletes_on_a_shard(self):
+        mine = Message.objects.create(sender=self.alice, receiver=self.bob, content="mine")
+        theirs = Message.objects.create(sender=self.bob, receiver=self.alice, content="theirs")
+
+        self.client.post(f"/delete-message/{theirs.id}/delete_for_me/")
+        self.assertEqual(
+            list(MessageDeletion.objects.using(theirs._state.db).values_list("message_id", "user_id")),
+            [(theirs.id, self.alice.id)],
+        )
+        self.assertEqual(
+            list(Message.objects.conversation(self.alice, self.bob).exclude(deleted_for=self.alice)),
+            [mine],
+        )
+
+        self.assertEqual(
+            self.client.post(f"/delete-message/{theirs.id}/delete_for_everyone/").status_code, 403
+        )
+        self.client.post(f"/delete-message/{mine.id}/delete_for_everyone/")
+        self.assertEqual(self.stored_on(mine.id), [])
+
+    def test_deleting_a_user_clears_their_shard_rows(self):
+        message = Message.objects.create(sender=self.alice, receiver=self.bob, content="bye")
+        self.bob.delete()
+        self.assertEqual(self.stored_on(message.id), [])
+
+    def test_shard_messages_moves_conversations(self):
+        with override_settings(MESSAGE_SHARDS=[]):
+            for i, (a, b) in enumerate([(0, 1), (1, 0), (2, 3), (4, 5), (5, 0)]):
+                Message.objects.create(
+                    sender=self.users[a], receiver=self.users[b], content=f"m{i}"
+                )
+            first, second = Message.objects.conversation(self.alice, self.bob).order_by("id")
+            second.deleted_for.add(self.alice)
+            ReadWatermark.objects.create(user=self.bob, other=self.alice, last_read_id=first.id)
+            stamps = list(Message.objects.order_by("id").values_list("content", "timestamp"))
+
+        for grown in (SHARDS[:2], SHARDS):
+            with override_settings(MESSAGE_SHARDS=grown):
+                call_command("shard_messages", verbosity=0, stdout=open(os.devnull, "w"))
+                self.assertFalse(Message.objects.using(DEFAULT_DB_ALIAS).exists())
+                for alias in grown:
+                    for message in Message.objects.using(alias):
+                        self.assertEqual(
+                            shards.shard_for(message.sender_id, message.receiver_id), alias
+                        )
+                        self.assertEqual(shards.shard_for_id(message.id), alias)
+
+                moved = list(Message.objects.conversation(self.alice, self.bob).order_by("id"))
+                self.assertEqual([m.content for m in moved], ["m0", "m1"])
+                # Sequence numbers and the change log move unchanged
+                self.assertEqual([m.seq for m in moved], [1, 2])
+                events, seq, _ = sync.changes_since(self.bob, self.alice, 0)
+                self.assertEqual(
+                    [(e["seq"], e["message_id"]) for e in events],
+                    [(1, moved[0].id), (2, moved[1].id)],
+                )
+                self.assertEqual(seq, sync.current_seq(self.alice, self.bob))
+                self.assertTrue(moved[1].is_visible_to(self.bob))
+                self.assertFalse(moved[1].is_visible_to(self.alice))
+                self.assertEqual(
+                    ReadWatermark.objects.get(user=self.bob).last_read_id, moved[0].id
+                )
+                everything = [
+                    row for messages in Message.objects.on_shards()
+                    for row in messages.values_list("content", "timestamp")
+                ]
+                self.assertEqual(sorted(everything), sorted(stamps))
+
+    def unsharded_conversation(self):
+        with override_settings(MESSAGE_SHARDS=[]):
+            first = Message.objects.create(sender=self.alice, receiver=self.bob, content="m0")
+            Message.objects.create(sender=self.bob, receiver=self.alice, content="m1")
+            ReadWatermark.objects.create(user=self.bob, other=self.alice, last_read_id=first.id)
+        return shards.shard_for(self.alice, self.bob)
+
+    def test_move_resumes_after_an_interruption(self):
+        target = self.unsharded_conversation()
+        with mock.patch("core.bulk.batched_delete", side_effect=RuntimeError("cut")):
+            with self.assertRaises(RuntimeError):
+                shards.move_conversation(self.alice, self.bob, DEFAULT_DB_ALIAS, target)
+        # Copied, logged, and still on the source
+        self.assertEqual(Message.objects.using(target).count(), 2)
+        self.assertTrue(Conversation.objects.using(DEFAULT_DB_ALIAS).exists())
+
+        self.assertEqual(
+            shards.move_conversation(self.alice, self.bob, DEFAULT_DB_ALIAS, target), 2
+        )
+        moved = list(Message.objects.conversation(self.alice, self.bob).order_by("id"))
+        self.assertEqual([(m.content, m.seq) for m in moved], [("m0", 1), ("m1", 2)])
+        self.assertFalse(Message.objects.using(DEFAULT_DB_ALIAS).exists())
+        self.assertFalse(Conversation.objects.using(DEFAULT_DB_ALIAS).exists())
+        events, seq, _ = sync.changes_since(self.bob, self.alice, 0)
+        self.assertEqual([e["message_id"] for e in events], [m.id for m in moved])
+        self.assertEqual(seq, 2)
+        self.assertEqual(ReadWatermark.objects.get(user=self.bob).last_read_id, moved[0].id)
+
+    def test_move_keeps_the_larger_sequence(self):
+        target = self.unsharded_conversation()
+        Conversation.objects.using(target).create(
+            user_low_id=min(self.alice.id, self.bob.id),
+            user_high_id=max(self.alice.id, self.bob.id),
+            last_seq=7,
+        )
+        shards.move_conversation(self.alice, self.bob, DEFAULT_DB_ALIAS, target)
+        self.assertEqual(sync.current_seq(self.alice, self.bob), 7)
+        self.assertEqual(
+            Message.objects.create(sender=self.alice, receiver=self.bob, content="next").seq, 8
+        )
+
+    def test_move_refuses_a_target_with_its_own_history(self):
+        target = self.unsharded_conversation()
+        # Written to the target while the source still had the conversation
+        Message.objects.create(sender=self.bob, receiver=self.alice, content="elsewhere")
+
+        with self.assertRaises(shards.ShardConflict):
+            shards.move_conversation(self.alice, self.bob, DEFAULT_DB_ALIAS, target)
+        self.assertEqual(Message.objects.using(DEFAULT_DB_ALIAS).count(), 2)
+        self.assertEqual(Message.objects.using(target).count(), 1)
+
+        with self.assertRaises(CommandError):
+            call_command("shard_messages", verbosity=0, stdout=open(os.devnull, "w"),
+                         stderr=open(os.devnull, "w"))
+        self.assertEqual(Message.objects.using(DEFAULT_DB_ALIAS).count(), 2)
@@ -0,0 +1,224 @@
+import re
+import unicodedata
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.db.models.signals import post_save
+from django.utils import timezone
+
+from .models import Comment, Hashtag, Mention, Notification, Post, PostTag, User
+from .notifications import notification_buffer
+
+
+# ======================================================
+# PARSING
+# ======================================================
+URL_PATTERN = r"https?://[^\s<>\"']+"
+HASHTAG_PATTERN = r"(?<![\w#/])#(\w{1,100})"
+MENTION_PATTERN = r"(?<![\w@./])@([\w.@+-]{1,150})"
+
+URL_RE = re.compile(URL_PATTERN, re.I)
+HASHTAG_RE = re.compile(HASHTAG_PATTERN)
+MENTION_RE = re.compile(MENTION_PATTERN)
+# One pass for rendering: group 1 = url, 2 = tag, 3 = username
+TOKEN_RE = re.compile(f"({URL_PATTERN})|{HASHTAG_PATTERN}|{MENTION_PATTERN}", re.I)
+
+URL_TRAILING = ".,;:!?)]}'\""
+MENTION_TRAILING = ".-+@"
+
+
+def normalize_tag(raw):
+    return unicodedata.normalize("NFKC", raw).casefold()
+
+
+def clean_url(raw):
+    return raw.rstrip(URL_TRAILING)
+
+
+def clean_username(raw):
+    return raw.rstrip(MENTION_TRAILING)
+
+
+def _unique(values):
+    return list(dict.fromkeys(v for v in values if v))
+
+
+def extract(text):
+    """(hashtags, usernames, links) in order of first appearance."""
+    text = text or ""
+    # Links first, so "#fragment" and "user@host" inside URLs don't count
+    links = _unique(clean_url(m) for m in URL_RE.findall(text))
+    bare = URL_RE.sub(" ", text)
+    tags = _unique(
+        normalize_tag(t) for t in HASHTAG_RE.findall(bare) if not t.isdigit()
+    )
+    mentions = _unique(clean_username(u) for u in MENTION_RE.findall(bare))
+    return tags, mentions, links
+
+
+# ======================================================
+# INDEXING
+# ======================================================
+def _hashtag_ids(names):
+    if not names:
+        return {}
+    Hashtag.objects.bulk_create(
+        [Hashtag(name=n) for n in names], ignore_conflicts=True
+    )
+    return dict(Hashtag.objects.filter(name__in=names).values_list("name", "id"))
+
+
+def _sync(model, target_field, sources, wanted, extra):
+    """
+    Make `model` rows for `sources` ({(post_id, comment_id): ...}) match
+    `wanted` ({source: set of target ids}). Returns the created
+    (source, target_id) pairs.
+    """
+    caption_posts = [p for p, c in sources if c is None]
+    comment_ids = [c for _, c in sources if c is not None]
+    existing = model.objects.filter(
+        Q(comment__isnull=True, post_id__in=caption_posts) | Q(comment_id__in=comment_ids)
+    ).values_list("pk", "post_id", "comment_id", f"{target_field}_id")
+
+    have = {}
+    stale = []
+    for pk, post_id, comment_id, target in existing:
+        source = (post_id, comment_id)
+        if target in wanted.get(source, ()):
+            have.setdefault(source, set()).add(target)
+        else:
+            stale.append(pk)
+    if stale:
+        model.objects.filter(pk__in=stale).delete()
+
+    new = [
+        (source, target)
+        for source, targets in wanted.items()
+        for target in targets - have.get(source, set())
+    ]
+    model.objects.bulk_create(
+        [
+            model(
+                post_id=source[0],
+                comment_id=source[1],
+                created_at=sources[source]["created_at"],
+                **{f"{target_field}_id": target},
+                **extra(source),
+            )
+            for source, target in new
+        ],
+        ignore_conflicts=True,
+    )
+    return new
+
+
+def index_sources(sources, notify_mentions=True):
+    """
+    Index hashtags and mentions for a batch of texts.
+    `sources` maps (post_id, comment_id|None) to
+    {"text", "author_id", "created_at"}.
+    """
+    parsed = {key: extract(src["text"]) for key, src in sources.items()}
+
+    tag_ids = _hashtag_ids(_unique(t for tags, _, _ in parsed.values() for t in tags))
+    usernames = _unique(u for _, names, _ in parsed.values() for u in names)
+    user_ids = dict(
+        User.objects.filter(username__in=usernames).values_list("username", "id")
+    ) if usernames else {}
+
+    _sync(
+        PostTag, "hashtag", sources,
+        {key: {tag_ids[t] for t in p[0] if t in tag_ids} for key, p in parsed.items()},
+        extra=lambda source: {},
+    )
+    new_mentions = _sync(
+        Mention, "user", sources,
+        {key: {user_ids[u] for u in p[1] if u in user_ids} for key, p in parsed.items()},
+        extra=lambda source: {"author_id": sources[source]["author_id"]},
+    )
+
+    if notify_mentions:
+        for source, user_id in new_mentions:
+            notification_buffer.add(
+                user_id, Notification.MENTION, sources[source]["author_id"], post_id=source[0]
+            )
+    return len(new_mentions)
+
+
+def post_source(post):
+    return {(post.id, None): {
+        "text": post.caption, "author_id": post.author_id, "created_at": post.created_at,
+    }}
+
+
+def comment_source(comment):
+    return {(comment.post_id, comment.id): {
+        "text": comment.text, "author_id": comment.user_id, "created_at": comment.created_at,
+    }}
+
+
+def _needs_index(text, created):
+    # A new row without "#" or "@" has nothing to add and nothing to remove
+    return not created or "#" in (text or "") or "@" in (text or "")
+
+
+def _on_post_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is None or "caption" in update_fields:
+        if _needs_index(instance.caption, created):
+            index_sources(post_source(instance))
+
+
+def _on_comment_saved(sender, instance, created, update_fields=None, **kwargs):
+    if update_fields is None or "text" in update_fields:
+        if _needs_index(instance.text, created):
+            index_sources(comment_source(instance))
+
+
+post_save.connect(_on_post_saved, sender=Post, dispatch_uid="textindex_post")
+post_save.connect(_on_comment_saved, sender=Comment, dispatch_uid="textindex_comment")
+
+
+# ======================================================
+# TRENDING
+# ======================================================
+def trending(limit=10):
+    """
+    Tags on the most posts in the last TRENDING_WINDOW_HOURS, with a
+    bonus for growth over the window before it. Cached briefly.
+    """
+    hours = getattr(settings, "TRENDING_WINDOW_HOURS", 24)
+    key = f"trending:{hours}:{limit}"
+    result = cache.get(key)
+    if result is not None:
+        return result
+
+    now = timezone.now()
+    window = timedelta(hours=hours)
+    current = dict(
+        PostTag.objects.filter(created_at__gte=now - window)
+        .values("hashtag_id").annotate(n=Count("post_id", distinct=True))
+        .order_by("-n").values_list("hashtag_id", "n")[:limit * 5]
+    )
+    previous = dict(
+        PostTag.objects.filter(
+            hashtag_id__in=current,
+            created_at__gte=now - 2 * window,
+            created_at__lt=now - window,
+        ).values("hashtag_id").annotate(n=Count("post_id", distinct=True))
+        .values_list("hashtag_id", "n")
+    )
+    names = dict(Hashtag.objects.filter(id__in=current).values_list("id", "name"))
+
+    ranked = sorted(
+        current,
+        key=lambda t: current[t] + max(0, current[t] - previous.get(t, 0)),
+        reverse=True,
+    )[:limit]
+    result = [
+        {"name": names[t], "count": current[t], "previous": previous.get(t, 0)}
+        for t in ranked
+    ]
+    cache.set(key, result, getattr(settings, "TRENDING_TTL", 300))
+    return result
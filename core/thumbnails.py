@@ -0,0 +1,97 @@
+import os
+import threading
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connections, transaction
+from django.db.models.signals import post_delete, post_save
+from PIL import Image, ImageOps
+
+from .models import Post
+
+
+def thumbnail_size():
+    return getattr(settings, "THUMBNAIL_SIZE", 320)
+
+
+def render(fileobj, size):
+    """JPEG bytes of a centre-cropped size x size square of the image."""
+    with Image.open(fileobj) as image:
+        # JPEG can decode straight at a reduced scale; much cheaper for photos
+        image.draft("RGB", (size * 2, size * 2))
+        image = ImageOps.exif_transpose(image)
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+        image = ImageOps.fit(image, (size, size), Image.Resampling.LANCZOS)
+
+        out = BytesIO()
+        image.save(out, "JPEG", quality=80, optimize=True, progressive=True)
+        return out.getvalue()
+
+
+def make_thumbnail(post):
+    """
+    Generate and store `post`'s thumbnail. Returns the stored name, or
+    None when the post has no image or it can't be decoded (the grid
+    then falls back to the full image). An undecodable image is marked
+    thumbnail_failed and not tried again.
+    """
+    if not post.image:
+        return None
+    try:
+        with post.image.open("rb") as fh:
+            data = render(fh, thumbnail_size())
+    except (OSError, ValueError, Image.DecompressionBombError):
+        Post.objects.filter(pk=post.pk).update(thumbnail_failed=True)
+        post.thumbnail_failed = True
+        return None
+
+    field = Post._meta.get_field("thumbnail")
+    base = os.path.splitext(os.path.basename(post.image.name))[0]
+    name = field.storage.save(field.generate_filename(post, f"{base}.jpg"), ContentFile(data))
+    # update(), not save(): no second post_save round
+    Post.objects.filter(pk=post.pk).update(thumbnail=name, thumbnail_failed=False)
+    post.thumbnail.name = name
+    return name
+
+
+def _make_in_thread(post_id):
+    try:
+        post = Post.objects.filter(pk=post_id).only(
+            "id", "image", "thumbnail", "thumbnail_failed"
+        ).first()
+        if post is not None and not post.thumbnail:
+            make_thumbnail(post)
+    except Exception:
+        # Left without one: the grid shows the full image, and
+        # make_thumbnails picks it up
+        pass
+    finally:
+        connections.close_all()
+
+
+def _on_post_saved(sender, instance, created, update_fields=None, using=None, **kwargs):
+    if update_fields is None or "image" in update_fields:
+        if instance.image and not instance.thumbnail and not instance.thumbnail_failed:
+            # Decoding a large upload takes longer than the rest of the
+            # request: do it once the post is committed, off the request
+            post_id = instance.pk
+            transaction.on_commit(lambda: threading.Thread(
+                target=_make_in_thread, args=(post_id,), daemon=True, name="thumbnail",
+            ).start(), using=using)
+
+
+def _on_post_deleted(sender, instance, using=None, **kwargs):
+    if instance.thumbnail:
+        name, storage = instance.thumbnail.name, instance.thumbnail.storage
+        transaction.on_commit(lambda: storage.delete(name), using=using)
+
+
+post_save.connect(_on_post_saved, sender=Post, dispatch_uid="thumbnails_post")
+post_delete.connect(_on_post_deleted, sender=Post, dispatch_uid="thumbnails_post_delete")
@@ -0,0 +1,262 @@
+import hashlib
+import os
+import re
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files import File
+from django.core.files.storage import FileSystemStorage
+from django.db import router, transaction
+from django.utils import timezone
+from PIL import Image
+
+from .models import ChunkedUpload
+
+
+# Parts are read from the request and written in pieces this big,
+# so memory per upload stays constant whatever the part size.
+COPY_BUFFER = 64 * 1024
+
+# What each kind may be. Media is served back from MEDIA_URL, so nothing
+# else (.html, .svg, ...) gets stored. Images are stored under the
+# extension of the format Pillow finds in them, whatever the client said.
+IMAGE_FORMATS = {"JPEG": ".jpg", "PNG": ".png", "GIF": ".gif", "WEBP": ".webp"}
+ALLOWED_EXTENSIONS = {
+    ChunkedUpload.IMAGE: {".jpg", ".jpeg", ".png", ".gif", ".webp"},
+    ChunkedUpload.AUDIO: {".mp3", ".m4a", ".aac", ".ogg", ".oga", ".opus", ".wav", ".webm"},
+}
+
+
+class UploadError(Exception):
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+
+def _max_size():
+    return getattr(settings, "CHUNKED_UPLOAD_MAX_SIZE", 100 * 1024 * 1024)
+
+
+def chunk_size():
+    return getattr(settings, "CHUNKED_UPLOAD_CHUNK_SIZE", 1024 * 1024)
+
+
+def temp_dir():
+    # Under MEDIA_ROOT by default so completion is a rename, not a copy
+    return getattr(settings, "CHUNKED_UPLOAD_TEMP_DIR", os.path.join(settings.MEDIA_ROOT, ".partial"))
+
+
+def part_path(upload):
+    return os.path.join(temp_dir(), f"{upload.id}.part")
+
+
+# ======================================================
+# INITIATE
+# ======================================================
+def initiate(owner, kind, filename, size, sha256):
+    if kind not in dict(ChunkedUpload.KIND_CHOICES):
+        raise UploadError("Unknown upload kind")
+    if not 0 < size <= _max_size():
+        raise UploadError("Invalid size", status=413 if size > 0 else 400)
+    sha256 = (sha256 or "").lower()
+    if not re.fullmatch(r"[0-9a-f]{64}", sha256):
+        raise UploadError("sha256 must be 64 hex digits")
+    if _extension(filename) not in ALLOWED_EXTENSIONS[kind]:
+        raise UploadError(f"Not an accepted {kind} file type", status=415)
+
+    upload = ChunkedUpload.objects.create(
+        owner=owner,
+        kind=kind,
+        filename=os.path.basename(filename)[:255] or kind,
+        size=size,
+        sha256=sha256,
+    )
+    os.makedirs(temp_dir(), exist_ok=True)
+    # Create (empty) now so parts can be pwrite()n at any offset later
+    with open(part_path(upload), "wb"):
+        pass
+    return upload
+
+
+# ======================================================
+# PARTS
+# ======================================================
+def write_part(upload, offset, stream, length):
+    """
+    Write `length` bytes from `stream` at `offset`. The offset must match
+    what the server already has, so a client that lost a response just
+    asks for the offset again and resumes there. Returns the new offset.
+    """
+    if upload.is_complete:
+        raise UploadError("Upload already completed", status=409)
+    if offset != upload.offset:
+        raise UploadError(f"Expected offset {upload.offset}", status=409)
+    if length <= 0 or offset + length > upload.size:
+        raise UploadError("Part runs past the declared size", status=416)
+
+    fd = os.open(part_path(upload), os.O_WRONLY)
+    try:
+        position = offset
+        remaining = length
+        while remaining:
+            piece = stream.read(min(COPY_BUFFER, remaining))
+            if not piece:
+                break
+            position += os.pwrite(fd, piece, position)
+            remaining -= len(piece)
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+    if remaining:
+        raise UploadError("Part body shorter than Content-Length")
+
+    # Compare-and-set: a concurrent retry of the same part can't double-count
+    updated = ChunkedUpload.objects.filter(pk=upload.pk, offset=offset).update(offset=position)
+    if not updated:
+        upload.refresh_from_db(fields=["offset"])
+        raise UploadError(f"Expected offset {upload.offset}", status=409)
+    upload.offset = position
+    return position
+
+
+# ======================================================
+# COMPLETE
+# ======================================================
+def _extension(filename):
+    return os.path.splitext(filename or "")[1].lower()
+
+
+def stored_filename(upload, path):
+    """
+    The name to store a verified upload under: the client's base name
+    with an extension the server chose. Images must open with Pillow as
+    one of IMAGE_FORMATS; anything else is refused.
+    """
+    base = os.path.splitext(upload.filename)[0] or upload.kind
+    if upload.kind != ChunkedUpload.IMAGE:
+        extension = _extension(upload.filename)
+        if extension not in ALLOWED_EXTENSIONS[upload.kind]:
+            raise UploadError(f"Not an accepted {upload.kind} file type", status=415)
+        return base + extension
+    try:
+        with Image.open(path) as image:
+            image_format = image.format
+            image.verify()
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError):
+        raise UploadError("Not an image", status=415)
+    if image_format not in IMAGE_FORMATS:
+        raise UploadError(f"Unsupported image format {image_format}", status=415)
+    return base + IMAGE_FORMATS[image_format]
+
+
+def file_sha256(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for block in iter(lambda: fh.read(COPY_BUFFER), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _move_into_storage(path, instance, field, filename):
+    """
+    Give the finished temp file a permanent name in `field`'s storage.
+    On local storage that is a hard link plus unlink — no second copy.
+    """
+    storage = field.storage
+    name = field.generate_filename(instance, filename)
+
+    if not isinstance(storage, FileSystemStorage):
+        with open(path, "rb") as fh:
+            name = storage.save(name, File(fh, name=filename))
+        os.remove(path)
+        return name
+
+    while True:
+        name = storage.get_available_name(name)
+        target = storage.path(name)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        try:
+            os.link(path, target)
+        except FileExistsError:
+            continue
+        except OSError:
+            # Temp dir on another filesystem: fall back to a streamed copy
+            with open(path, "rb") as fh:
+                name = storage.save(name, File(fh, name=filename))
+        os.remove(path)
+        return name
+
+
+def _move_back(storage, name, path):
+    """Undo _move_into_storage: the stored file becomes the temp file again."""
+    if isinstance(storage, FileSystemStorage):
+        os.link(storage.path(name), path)
+    else:
+        with storage.open(name, "rb") as src, open(path, "wb") as dst:
+            for block in iter(lambda: src.read(COPY_BUFFER), b""):
+                dst.write(block)
+    storage.delete(name)
+
+
+def complete(upload, instance, field_name):
+    """
+    Verify the upload, attach it to `instance.<field_name>` (a Message
+    or Post) and save the instance. If the save fails, the file goes
+    back to where it was and the upload can be completed again.
+    """
+    if upload.offset != upload.size:
+        raise UploadError(f"Upload incomplete ({upload.offset}/{upload.size})", status=409)
+
+    # Claim it first so two concurrent completes can't both move the file
+    now = timezone.now()
+    claimed = ChunkedUpload.objects.filter(
+        pk=upload.pk, completed_at__isnull=True
+    ).update(completed_at=now)
+    if not claimed:
+        raise UploadError("Upload already completed", status=409)
+
+    path = part_path(upload)
+    try:
+        if os.path.getsize(path) != upload.size or file_sha256(path) != upload.sha256:
+            raise UploadError("sha256 mismatch", status=422)
+        filename = stored_filename(upload, path)
+        field = instance._meta.get_field(field_name)
+        name = _move_into_storage(path, instance, field, filename)
+        setattr(instance, field_name, name)
+        try:
+            # With its signal handlers' writes: all of it, or none of it
+            with transaction.atomic(using=router.db_for_write(type(instance), instance=instance)):
+                instance.save()
+        except Exception:
+            _move_back(field.storage, name, path)
+            setattr(instance, field_name, None)
+            raise
+    except Exception:
+        ChunkedUpload.objects.filter(pk=upload.pk).update(completed_at=None)
+        raise
+
+    upload.completed_at = now
+    return instance
+
+
+# ======================================================
+# HOUSEKEEPING
+# ======================================================
+def purge_stale(older_than_hours=None):
+    """Drop upload rows past their expiry and any temp file still left."""
+    hours = older_than_hours
+    if hours is None:
+        hours = getattr(settings, "CHUNKED_UPLOAD_EXPIRY_HOURS", 24)
+    cutoff = timezone.now() - timedelta(hours=hours)
+
+    stale = ChunkedUpload.objects.filter(created_at__lt=cutoff)
+    removed = 0
+    for upload in stale.iterator():
+        try:
+            os.remove(part_path(upload))
+        except FileNotFoundError:
+            pass
+        removed += 1
+    stale.delete()
+    return removed
@@ -17,6 +17,7 @@ urlpatterns = [
     # Search
     # ------------------
     path("search/", views.search, name="search"),
+    path("tags/<str:name>/", views.hashtag, name="hashtag"),
 
     # ------------------
     # Authentication
@@ -32,17 +33,48 @@ urlpatterns = [
     path("post/<int:post_id>/", views.post_detail, name="post_detail"),
     path("post/<int:post_id>/like/", views.like_post, name="like_post"),
     path("post/<int:post_id>/comment/", views.add_comment, name="add_comment"),
+    path("post/<int:post_id>/comments/", views.post_comments, name="post_comments"),
+    path("post/<int:post_id>/likes/", views.post_likes, name="post_likes"),
 
     # ------------------
     # Profiles
     # ------------------
     path("profile/<str:username>/", views.profile, name="profile"),
     path("follow/<str:username>/", views.follow_toggle, name="follow_toggle"),
+    path("profile/<str:username>/counts/", views.follow_counts, name="follow_counts"),
+
+    # ------------------
+    # Notifications
+    # ------------------
+    path("notifications/", views.notifications, name="notifications"),
+    path(
+        "notifications/read/",
+        views.notifications_mark_read,
+        name="notifications_mark_read"
+    ),
+
+    # ------------------
+    # Chunked uploads (resumable)
+    # ------------------
+    path("uploads/", views.upload_start, name="upload_start"),
+    path("uploads/<uuid:upload_id>/", views.upload_part, name="upload_part"),
+    path(
+        "uploads/<uuid:upload_id>/complete/",
+        views.upload_complete,
+        name="upload_complete"
+    ),
+
+    # ------------------
+    # Data export
+    # ------------------
+    path("export/", views.export_data, name="export_data"),
 
     # ------------------
     # Chat
     # ------------------
     path("chat/<str:username>/", views.chat_room, name="chat_room"),
+    path("chat-unread/", views.chat_unread, name="chat_unread"),
+    path("sync/<str:username>/", views.chat_sync, name="chat_sync"),
     path("send-message/<str:username>/", views.send_message, name="send_message"),
     path(
         "delete-message/<int:message_id>/<str:action>/",
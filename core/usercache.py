@@ -0,0 +1,139 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models.signals import post_delete, post_save
+
+from .models import User
+
+
+def _ttl():
+    return getattr(settings, "USER_CACHE_TTL", 60)
+
+
+def _shared_enabled():
+    return getattr(settings, "USER_CACHE_SHARED", True)
+
+
+def shared_key(user_id):
+    return f"usersummary:{user_id}"
+
+
+def summarize(user):
+    """The compact form templates and JSON need: id, username, avatar."""
+    return {
+        "id": user.id,
+        "username": user.username,
+        "avatar": user.profile_image_url,
+    }
+
+
+# ======================================================
+# PROCESS-LOCAL LRU WITH TTL
+# ======================================================
+class LRUCache:
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return None
+            value, expires = item
+            if expires < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+local_cache = LRUCache(
+    maxsize=getattr(settings, "USER_CACHE_SIZE", 10000),
+    ttl=_ttl(),
+)
+
+
+# ======================================================
+# LOOKUPS
+# ======================================================
+def get_many(user_ids):
+    """
+    {id: summary} for the given ids: local LRU first, then the shared
+    cache, then one `id IN (...)` query for whatever is left.
+    """
+    result = {}
+    missing = []
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        summary = local_cache.get(user_id)
+        if summary is None:
+            missing.append(user_id)
+        else:
+            result[user_id] = summary
+
+    if missing and _shared_enabled():
+        found = cache.get_many([shared_key(i) for i in missing])
+        for summary in found.values():
+            result[summary["id"]] = summary
+            local_cache.set(summary["id"], summary)
+        missing = [i for i in missing if i not in result]
+
+    if missing:
+        users = User.objects.filter(id__in=missing).only("id", "username", "profile_image")
+        fresh = {u.id: summarize(u) for u in users}
+        for user_id, summary in fresh.items():
+            local_cache.set(user_id, summary)
+        if fresh and _shared_enabled():
+            cache.set_many({shared_key(i): s for i, s in fresh.items()}, _ttl() * 10)
+        result.update(fresh)
+
+    return result
+
+
+def get(user_id):
+    return get_many([user_id]).get(user_id)
+
+
+def attach(objects, id_attr, attr):
+    """Set `obj.<attr>` to the summary for `obj.<id_attr>` on each object."""
+    objects = list(objects)
+    summaries = get_many(getattr(obj, id_attr) for obj in objects)
+    for obj in objects:
+        setattr(obj, attr, summaries.get(getattr(obj, id_attr)))
+    return objects
+
+
+def invalidate(user_id):
+    local_cache.delete(user_id)
+    if _shared_enabled():
+        cache.delete(shared_key(user_id))
+
+
+def _on_user_change(sender, instance, **kwargs):
+    invalidate(instance.id)
+
+
+post_save.connect(_on_user_change, sender=User, dispatch_uid="usercache_save")
+post_delete.connect(_on_user_change, sender=User, dispatch_uid="usercache_delete")
@@ -0,0 +1,146 @@
+import asyncio
+import time
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+from django.http import HttpResponseNotModified, JsonResponse
+
+
+# ======================================================
+# VERSION COUNTERS (IN CACHE)
+# ======================================================
+# Every write that changes what a JSON endpoint would return bumps a
+# counter here. Readers compare the counter with the client's ETag
+# before touching the database.
+def chat_key(username_a, username_b):
+    a, b = sorted([username_a, username_b])
+    return f"ver:chat:{a}:{b}"
+
+
+def post_comments_key(post_id):
+    return f"ver:post:{post_id}:comments"
+
+
+def post_likes_key(post_id):
+    return f"ver:post:{post_id}:likes"
+
+
+def follows_key(username):
+    return f"ver:user:{username}:follows"
+
+
+def shared():
+    """
+    Whether every worker sees the same counters. A per-process cache
+    (LocMem, the default without REDIS_CACHE_URL) only hears about
+    writes made by its own worker, so the others would answer 304 for
+    data that changed: ETags are then neither sent nor honoured.
+    VERSIONS_SHARED overrides the guess (a single-process server).
+    """
+    explicit = getattr(settings, "VERSIONS_SHARED", None)
+    if explicit is not None:
+        return explicit
+    return not isinstance(caches["default"], LocMemCache)
+
+
+def get_version(key):
+    version = cache.get(key)
+    if version is None:
+        # Seed from the clock so an evicted counter never reuses an old ETag
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key, 0)
+    return version
+
+
+def bump(*keys):
+    for key in keys:
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def wait_for_change(key, version, timeout, interval=0.25):
+    """Long-poll helper: block (cache reads only) until `key` moves on."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        time.sleep(interval)
+        current = get_version(key)
+        if current != version:
+            return current
+    return version
+
+
+# Async counterparts for the native async views; same keys and semantics.
+async def aget_version(key):
+    version = await cache.aget(key)
+    if version is None:
+        await cache.aadd(key, time.time_ns(), None)
+        version = await cache.aget(key, 0)
+    return version
+
+
+async def abump(*keys):
+    for key in keys:
+        try:
+            await cache.aincr(key)
+        except ValueError:
+            await cache.aset(key, time.time_ns(), None)
+
+
+async def await_change(key, version, timeout, interval=0.25):
+    """
+    wait_for_change for the async views. Sleeps on the event loop, but
+    each check goes through the cache's sync API in the request's thread.
+    """
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        await asyncio.sleep(interval)
+        current = await aget_version(key)
+        if current != version:
+            return current
+    return version
+
+
+def longpoll_seconds(request):
+    try:
+        wait = float(request.GET.get("wait", 0))
+    except ValueError:
+        return 0
+    return max(0, min(wait, getattr(settings, "LONGPOLL_MAX_SECONDS", 25)))
+
+
+# ======================================================
+# ETAGS
+# ======================================================
+def make_etag(*parts):
+    return '"' + "-".join(str(p) for p in parts) + '"'
+
+
+def etag_matches(request, etag):
+    if not shared():
+        return False
+    header = request.headers.get("If-None-Match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    candidates = [t.strip().removeprefix("W/") for t in header.split(",")]
+    return etag in candidates
+
+
+def not_modified(etag):
+    response = HttpResponseNotModified()
+    response["ETag"] = etag
+    return response
+
+
+def json_with_etag(data, etag):
+    response = JsonResponse(data)
+    if not shared():
+        return response
+    response["ETag"] = etag
+    # Let browsers cache but always revalidate with If-None-Match
+    response["Cache-Control"] = "private, no-cache"
+    return response
@@ -1,15 +1,27 @@
-from django.shortcuts import render, get_object_or_404, redirect
+from asgiref.sync import sync_to_async
+from django.shortcuts import render, get_object_or_404, aget_object_or_404, redirect
+from django.conf import settings
+from django.db.models import Prefetch
 from django.contrib.auth import get_user_model
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse, HttpResponse, HttpResponseForbidden
+from django.http import (
+    Http404, JsonResponse, HttpResponse, HttpResponseBadRequest, HttpResponseForbidden,
+    StreamingHttpResponse,
+)
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_POST
-from django.db.models import Q
 import json
 
-from .models import Post, Comment, Message, Follow, Like
+from .models import Post, Comment, Message, Follow, Like, Notification, ChunkedUpload, Hashtag, PostTag
 from .forms import PostForm, SignUpForm
+from .likes import set_like, like_count
+from .notifications import notify, notification_buffer, serialize, unread_count
+from .suggestions import get_suggestions, invalidate_suggestions
+from . import graph, profiles, ranking, receipts, retention, sync, textindex, uploads, usercache, versions
+from .replicas import read_replica
+from .export import stream_user_archive
+from .retention import older_messages, has_archive
 
 User = get_user_model()
 
@@ -19,42 +31,69 @@ def home(request):
 
 # ====================== FEED ======================
 @login_required
+@read_replica
 def feed(request):
-    posts = Post.objects.prefetch_related(
-        "likes", "comments", "author"
-    ).order_by("-created_at")
+    try:
+        posts, next_cursor = ranking.feed_page(
+            # Grouped by post, newest first within each: the order of the
+            # (post, created_at) index, so no sort
+            Post.objects.prefetch_related(Prefetch(
+                "comments", queryset=Comment.objects.order_by("-post_id", "-created_at")
+            )),
+            cursor=request.GET.get("cursor"),
+            page_size=settings.FEED_PAGE_SIZE,
+        )
+    except ranking.InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+
+    all_users = get_suggestions(request.user)
+
+    liked_ids = set(
+        Like.objects.filter(
+            user=request.user, post_id__in=[p.id for p in posts]
+        ).values_list("post_id", flat=True)
+    )
 
-    all_users = User.objects.exclude(id=request.user.id)
+    # Authors and commenters come from the user-summary cache, not User rows
+    usercache.attach(posts, "author_id", "author_info")
+    usercache.attach(
+        [c for p in posts for c in p.comments.all()], "user_id", "user_info"
+    )
 
     for post in posts:
-        post.total_likes_count = post.likes.count()
-        post.is_liked = post.likes.filter(user=request.user).exists()
+        post.total_likes_count = like_count(post)
+        post.is_liked = post.id in liked_ids
 
     return render(request, "core/feed.html", {
         "posts": posts,
-        "all_users": all_users
+        "all_users": all_users,
+        "trending": textindex.trending(),
+        "next_cursor": next_cursor
     })
 
 
 # ====================== LIKE POST ======================
 @login_required
-def like_post(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+async def like_post(request, post_id):
+    post = await aget_object_or_404(Post, id=post_id)
 
     if request.method == "POST":
-        like_qs = Like.objects.filter(user=request.user, post=post)
-
-        if like_qs.exists():
-            like_qs.delete()
-            liked = False
+        user = await request.auser()
+        # Explicit state ("liked=1" / "liked=0") is idempotent;
+        # clients that don't send it keep the old toggle behaviour.
+        form, _ = await sync_to_async(_parse_form)(request)
+        wanted = form.get("liked")
+        if wanted is None:
+            liked = not await Like.objects.filter(user=user, post=post).aexists()
         else:
-            Like.objects.create(user=request.user, post=post)
-            liked = True
+            liked = wanted.lower() in ("1", "true", "on")
+
+        liked, total_likes = await sync_to_async(set_like)(user, post, liked)
 
         if request.headers.get("x-requested-with") == "XMLHttpRequest":
             return JsonResponse({
                 "liked": liked,
-                "total_likes": post.likes.count()
+                "total_likes": total_likes
             })
 
     return redirect(request.META.get("HTTP_REFERER", "/"))
@@ -62,10 +101,26 @@ def like_post(request, post_id):
 
 # ====================== SEARCH ======================
 @login_required
+@read_replica
 def search(request):
     query = request.GET.get("q", "")
-    users = User.objects.filter(username__icontains=query).exclude(id=request.user.id)
-    posts = Post.objects.filter(caption__icontains=query).order_by("-created_at")
+
+    # "#tag" goes straight to the indexed hashtag page
+    tags, _, _ = textindex.extract(query)
+    if query.strip().startswith("#") and tags:
+        return redirect("hashtag", name=tags[0])
+    user_ids = list(
+        User.objects.filter(username__icontains=query)
+        .exclude(id=request.user.id)
+        .values_list("id", flat=True)
+    )
+    summaries = usercache.get_many(user_ids)
+    users = [summaries[i] for i in user_ids if i in summaries]
+
+    posts = usercache.attach(
+        Post.objects.filter(caption__icontains=query).order_by("-created_at"),
+        "author_id", "author_info"
+    )
 
     return render(request, "core/search.html", {
         "query": query,
@@ -74,6 +129,39 @@ def search(request):
     })
 
 
+# ====================== HASHTAGS ======================
+@login_required
+def hashtag(request, name):
+    name = textindex.normalize_tag(name)
+    tag = Hashtag.objects.filter(name=name).first()
+    if tag is None:
+        # Searched for, or linked to, before anyone used it: nothing to page
+        return render(request, "core/hashtag.html", {
+            "tag": Hashtag(name=name),
+            "posts": [],
+            "trending": textindex.trending(),
+        })
+    try:
+        posts, next_cursor = ranking.feed_page(
+            Post.objects.filter(
+                id__in=PostTag.objects.filter(hashtag=tag).values("post_id")
+            ),
+            cursor=request.GET.get("cursor"),
+            page_size=settings.FEED_PAGE_SIZE,
+            ordering="chronological",
+        )
+    except ranking.InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    usercache.attach(posts, "author_id", "author_info")
+
+    return render(request, "core/hashtag.html", {
+        "tag": tag,
+        "posts": posts,
+        "trending": textindex.trending(),
+        "next_cursor": next_cursor
+    })
+
+
 # ====================== SIGNUP ======================
 def signup(request):
     if request.method == "POST":
@@ -97,6 +185,7 @@ def create_post(request):
         if form.is_valid():
             post = form.save(commit=False)
             post.author = request.user
+            post.score = ranking.initial_score(request.user)
             post.save()
             messages.success(request, "Post created successfully")
             return redirect("feed")
@@ -109,11 +198,15 @@ def create_post(request):
 
 # ====================== POST DETAIL ======================
 @login_required
+@read_replica
 def post_detail(request, post_id):
     post = get_object_or_404(Post, id=post_id)
-    comments = post.comments.order_by("created_at")
+    post.author_info = usercache.get(post.author_id)
+    comments = usercache.attach(
+        post.comments.order_by("created_at"), "user_id", "user_info"
+    )
 
-    return render(request, "core/post_detail.html", {
+    return render(request, "core/post.html", {
         "post": post,
         "comments": comments
     })
@@ -121,13 +214,18 @@ def post_detail(request, post_id):
 
 # ====================== ADD COMMENT ======================
 @login_required
-def add_comment(request, post_id):
-    post = get_object_or_404(Post, id=post_id)
+async def add_comment(request, post_id):
+    post = await aget_object_or_404(Post.objects.select_related("author"), id=post_id)
 
     if request.method == "POST":
-        text = request.POST.get("text", "").strip()
+        user = await request.auser()
+        form, _ = await sync_to_async(_parse_form)(request)
+        text = form.get("text", "").strip()
         if text:
-            Comment.objects.create(post=post, user=request.user, text=text)
+            await Comment.objects.acreate(post=post, user=user, text=text)
+            await sync_to_async(ranking.record_comment)(post)
+            await versions.abump(versions.post_comments_key(post.id))
+            await sync_to_async(notify)(post.author, Notification.COMMENT, user, post)
 
         if request.headers.get("x-requested-with") == "XMLHttpRequest":
             return JsonResponse({"success": True})
@@ -135,123 +233,349 @@ def add_comment(request, post_id):
     return redirect(request.META.get("HTTP_REFERER", "/"))
 
 
+# ====================== POST JSON (CONDITIONAL GET) ======================
+@login_required
+def post_comments(request, post_id):
+    etag = versions.make_etag(
+        "comments", post_id, versions.get_version(versions.post_comments_key(post_id))
+    )
+    if versions.etag_matches(request, etag):
+        return versions.not_modified(etag)
+
+    post = get_object_or_404(Post, id=post_id)
+    comments = usercache.attach(
+        post.comments.order_by("-created_at")[:50], "user_id", "user_info"
+    )
+
+    return versions.json_with_etag({
+        "comments": [
+            {
+                "id": c.id,
+                "user": c.user_info["username"],
+                "text": c.text,
+                "created_at": c.created_at.isoformat(),
+            }
+            for c in reversed(comments)
+        ]
+    }, etag)
+
+
+@login_required
+def post_likes(request, post_id):
+    etag = versions.make_etag(
+        "likes", post_id, versions.get_version(versions.post_likes_key(post_id))
+    )
+    if versions.etag_matches(request, etag):
+        return versions.not_modified(etag)
+
+    post = get_object_or_404(Post, id=post_id)
+    return versions.json_with_etag({"total_likes": like_count(post)}, etag)
+
+
 # ====================== PROFILE ======================
 @login_required
+@read_replica
 def profile(request, username):
     user_profile = get_object_or_404(User, username=username)
 
-    posts = Post.objects.filter(author=user_profile).order_by("-created_at")
-    followers_count = Follow.objects.filter(following=user_profile).count()
-    following_count = Follow.objects.filter(follower=user_profile).count()
+    # One grid page at a time, only the columns the tiles use
+    try:
+        posts, next_cursor = ranking.feed_page(
+            Post.objects.filter(author=user_profile).only("id", "image", "thumbnail", "caption"),
+            cursor=request.GET.get("cursor"),
+            page_size=settings.PROFILE_PAGE_SIZE,
+            ordering="chronological",
+        )
+    except ranking.InvalidCursor:
+        return HttpResponseBadRequest("Invalid cursor")
+    stats = profiles.header_stats(user_profile.id)
     is_following = Follow.objects.filter(
         follower=request.user, following=user_profile
     ).exists()
 
+    follow_graph = graph.get_graph()
+    followed_by = follow_graph.followed_by_people_you_follow(
+        request.user.id, user_profile.id
+    )
+    summaries = usercache.get_many(followed_by[:3])
+
     return render(request, "core/profile.html", {
         "user_profile": user_profile,
         "posts": posts,
-        "followers_count": followers_count,
-        "following_count": following_count,
-        "is_following": is_following
+        "next_cursor": next_cursor,
+        "thumbnail_size": settings.THUMBNAIL_SIZE,
+        "stats": stats,
+        "is_following": is_following,
+        "follows_you": follow_graph.follows(user_profile.id, request.user.id),
+        "followed_by": [summaries[i] for i in followed_by[:3] if i in summaries],
+        "followed_by_others": max(0, len(followed_by) - 3)
     })
 
 
 # ====================== FOLLOW TOGGLE ======================
 @login_required
-def follow_toggle(request, username):
+async def follow_toggle(request, username):
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    target_user = get_object_or_404(User, username=username)
+    user = await request.auser()
+    target_user = await aget_object_or_404(User, username=username)
 
-    if target_user == request.user:
+    if target_user == user:
         return JsonResponse({"error": "Cannot follow yourself"}, status=400)
 
-    follow_qs = Follow.objects.filter(
-        follower=request.user, following=target_user
-    )
+    follow_qs = Follow.objects.filter(follower=user, following=target_user)
 
-    if follow_qs.exists():
-        follow_qs.delete()
+    if await follow_qs.aexists():
+        await follow_qs.adelete()
         state = "follow"
     else:
-        Follow.objects.create(follower=request.user, following=target_user)
+        await Follow.objects.acreate(follower=user, following=target_user)
+        await sync_to_async(notify)(target_user, Notification.FOLLOW, user)
         state = "unfollow"
 
+    await sync_to_async(invalidate_suggestions)(user.id)
+    await versions.abump(
+        versions.follows_key(target_user.username),
+        versions.follows_key(user.username),
+    )
+
     return JsonResponse({
         "state": state,
-        "followers_count": Follow.objects.filter(following=target_user).count(),
-        "following_count": Follow.objects.filter(follower=request.user).count(),
+        "followers_count": await Follow.objects.filter(following=target_user).acount(),
+        "following_count": await Follow.objects.filter(follower=user).acount(),
     })
 
 
+# ====================== FOLLOW COUNTS ======================
+@login_required
+def follow_counts(request, username):
+    etag = versions.make_etag(
+        "follows", username, versions.get_version(versions.follows_key(username))
+    )
+    if versions.etag_matches(request, etag):
+        return versions.not_modified(etag)
+
+    user_profile = get_object_or_404(User, username=username)
+    stats = profiles.header_stats(user_profile.id)
+    return versions.json_with_etag({
+        "followers_count": stats["followers"],
+        "following_count": stats["following"],
+    }, etag)
+
+
 # ====================== CHAT ROOM ======================
 @login_required
-def chat_room(request, username):
+async def chat_room(request, username):
+    # A held long-poll still keeps its request's thread: the cache and
+    # session calls under it are sync_to_async (see bench_asgi)
+    if request.headers.get("x-requested-with") == "XMLHttpRequest":
+        if "before_id" in request.GET:
+            return await sync_to_async(chat_history)(request, username)
+        return await chat_poll(request, username)
+    return await sync_to_async(chat_page)(request, username)
+
+
+def chat_page(request, username):
     other_user = get_object_or_404(User, username=username)
+    # Taken before the page's messages: /sync from here may repeat a few
+    # changes, never miss one
+    seq = sync.current_seq(request.user, other_user)
 
-    messages_qs = Message.objects.filter(
-        Q(sender=request.user, receiver=other_user) |
-        Q(sender=other_user, receiver=request.user)
-    ).exclude(
+    # Latest page only; older history (incl. archived) loads via ?before_id=
+    latest = Message.objects.conversation(request.user, other_user).exclude(
         deleted_for=request.user
-    ).order_by("timestamp")
-
-    if request.headers.get("x-requested-with") == "XMLHttpRequest":
-        last_id = int(request.GET.get("last_id", 0))
-        messages = messages_qs.filter(id__gt=last_id)
-
-        return JsonResponse({
-            "messages": [
-                {
-                    "message_id": m.id,
-                    "sender": m.sender.username,
-                    "content": m.content,
-                    "image": m.image.url if m.image else None,
-                    "audio": m.audio.url if m.audio else None,
-                }
-                for m in messages
-            ]
-        })
+    ).order_by("-id")[:settings.CHAT_PAGE_SIZE]
+    messages_list = usercache.attach(list(latest)[::-1], "sender_id", "sender_info")
+    has_older = (
+        len(messages_list) >= settings.CHAT_PAGE_SIZE
+        or has_archive(request.user, other_user)
+    )
+    if messages_list:
+        receipts.mark_read(request.user.id, other_user.id, messages_list[-1].id)
 
     return render(request, "core/chat.html", {
         "other_user": other_user,
-        "messages": messages_qs
+        "messages": messages_list,
+        "has_older": has_older,
+        "read_up_to": receipts.last_read(other_user.id, request.user.id),
+        "seq": seq,
+    })
+
+
+def chat_history(request, username):
+    try:
+        before_id = int(request.GET["before_id"])
+    except ValueError:
+        return JsonResponse({"error": "Invalid before_id"}, status=400)
+
+    other_user = get_object_or_404(User, username=username)
+    page = older_messages(
+        request.user, other_user, before_id, settings.CHAT_PAGE_SIZE
+    )
+    return JsonResponse({
+        "messages": page,
+        "has_more": len(page) == settings.CHAT_PAGE_SIZE,
+    })
+
+
+async def chat_poll(request, username):
+    """
+    XHR poll for new messages. The conversation version lives in the
+    cache, so an unchanged conversation answers 304 without a query.
+    With ?wait=<seconds> the request is held (bounded) until something
+    changes — a long-poll fallback for clients without WebSockets.
+
+    Reads the primary, never a replica: the version is bumped when the
+    primary commits, and a lagging replica's rows under the new ETag
+    would be revalidated as "unchanged" from then on.
+    """
+    try:
+        last_id = int(request.GET.get("last_id", 0))
+    except ValueError:
+        last_id = 0
+
+    user = await request.auser()
+    key = versions.chat_key(user.username, username)
+    version = await versions.aget_version(key)
+    etag = versions.make_etag("chat", version, user.id, last_id)
+
+    if versions.etag_matches(request, etag):
+        wait = versions.longpoll_seconds(request)
+        if wait:
+            version = await versions.await_change(key, version, wait)
+        new_etag = versions.make_etag("chat", version, user.id, last_id)
+        if new_etag == etag:
+            return versions.not_modified(etag)
+        etag = new_etag
+
+    other_user = await aget_object_or_404(User, username=username)
+    messages = Message.objects.conversation(user, other_user).exclude(
+        deleted_for=user
+    ).filter(
+        id__gt=last_id
+    ).order_by("id")
+    messages = [m async for m in messages]
+    senders = await sync_to_async(usercache.get_many)([user.id, other_user.id])
+
+    # Only what this response delivers: last_id comes from the client
+    # (a stale tab, or anything at all), and the watermark never goes back
+    if messages:
+        receipts.mark_read(user.id, other_user.id, max(m.id for m in messages))
+    read_up_to = await sync_to_async(receipts.last_read)(other_user.id, user.id)
+
+    return versions.json_with_etag({
+        "read_up_to": read_up_to,
+        "messages": [
+            {
+                "message_id": m.id,
+                "seq": m.seq,
+                "sender": senders[m.sender_id]["username"],
+                "content": m.content,
+                "image": m.image.url if m.image else None,
+                "audio": m.audio.url if m.audio else None,
+            }
+            for m in messages
+        ]
+    }, etag)
+
+
+@login_required
+async def chat_sync(request, username):
+    """
+    Everything that changed in a conversation after ?since=<seq>: new
+    messages, deletions and reads, in order. Resume from the returned
+    seq; has_more means ask again straight away. ETag and ?wait= work
+    as for the chat poll, and like it this reads the primary only.
+    """
+    try:
+        since = max(int(request.GET.get("since", 0)), 0)
+    except ValueError:
+        return JsonResponse({"error": "Invalid since"}, status=400)
+
+    user = await request.auser()
+    key = versions.chat_key(user.username, username)
+    version = await versions.aget_version(key)
+    etag = versions.make_etag("sync", version, user.id, since)
+
+    if versions.etag_matches(request, etag):
+        wait = versions.longpoll_seconds(request)
+        if wait:
+            version = await versions.await_change(key, version, wait)
+        new_etag = versions.make_etag("sync", version, user.id, since)
+        if new_etag == etag:
+            return versions.not_modified(etag)
+        etag = new_etag
+
+    other_user = await aget_object_or_404(User, username=username)
+    events, seq, has_more = await sync_to_async(sync.changes_since)(user, other_user, since)
+
+    shown = [e["message_id"] for e in events if e["type"] == "new"]
+    if shown:
+        receipts.mark_read(user.id, other_user.id, max(shown))
+
+    return versions.json_with_etag({
+        "events": events,
+        "seq": seq,
+        "has_more": has_more,
+    }, etag)
+
+
+@login_required
+def chat_unread(request):
+    """Unread counts per conversation, from the read watermarks."""
+    counts = receipts.unread_counts(request.user.id)
+    summaries = usercache.get_many(counts)
+    return JsonResponse({
+        "conversations": {
+            summaries[i]["username"]: n for i, n in counts.items() if i in summaries
+        },
+        "total": sum(counts.values()),
     })
 
 
 # ====================== SEND MESSAGE ======================
+def _parse_form(request):
+    # Multipart parsing writes uploads to memory/temp files: keep it off the loop
+    return request.POST, request.FILES
+
+
 @login_required
 @csrf_exempt
-def send_message(request, username):
-    receiver = get_object_or_404(User, username=username)
+async def send_message(request, username):
+    receiver = await aget_object_or_404(User, username=username)
 
     if request.method != "POST":
         return JsonResponse({"error": "Invalid request"}, status=400)
 
-    content = ""
+    user = await request.auser()
+    files = {}
     if request.content_type == "application/json":
         data = json.loads(request.body)
         content = data.get("content", "").strip()
     else:
-        content = request.POST.get("content", "").strip()
+        post, files = await sync_to_async(_parse_form)(request)
+        content = post.get("content", "").strip()
 
-    audio = request.FILES.get("audio")
-    image = request.FILES.get("image")
+    audio = files.get("audio")
+    image = files.get("image")
 
     if not content and not audio and not image:
         return JsonResponse({"error": "Empty message"}, status=400)
 
-    msg = Message.objects.create(
-        sender=request.user,
+    # acreate runs the save, including writing files to storage, in a thread
+    msg = await Message.objects.acreate(
+        sender=user,
         receiver=receiver,
         content=content,
         audio=audio,
         image=image
     )
+    await versions.abump(versions.chat_key(user.username, receiver.username))
 
     return JsonResponse({
         "message_id": msg.id,
+        "seq": msg.seq,
         "sender": msg.sender.username,
         "content": msg.content,
         "image": msg.image.url if msg.image else None,
@@ -259,24 +583,201 @@ def send_message(request, username):
     })
 
 
+# ====================== CHUNKED UPLOADS ======================
+def _payload(request):
+    if request.content_type == "application/json":
+        return json.loads(request.body or b"{}")
+    return request.POST
+
+
+def _upload_state(upload):
+    return {
+        "upload_id": str(upload.id),
+        "offset": upload.offset,
+        "size": upload.size,
+        "complete": upload.is_complete,
+    }
+
+
+@login_required
+@require_POST
+def upload_start(request):
+    data = _payload(request)
+    try:
+        upload = uploads.initiate(
+            request.user,
+            kind=data.get("kind", ""),
+            filename=data.get("filename", ""),
+            size=int(data.get("size", 0)),
+            sha256=data.get("sha256", ""),
+        )
+    except ValueError:
+        return JsonResponse({"error": "Invalid size"}, status=400)
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+
+    return JsonResponse(
+        {**_upload_state(upload), "chunk_size": uploads.chunk_size()}, status=201
+    )
+
+
+@login_required
+def upload_part(request, upload_id):
+    """
+    GET: where to resume. POST: raw part bytes (application/octet-stream)
+    for the position in the Upload-Offset header.
+    """
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, owner=request.user)
+
+    if request.method == "GET":
+        return JsonResponse(_upload_state(upload))
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request"}, status=405)
+
+    try:
+        offset = int(request.headers.get("Upload-Offset", ""))
+        length = int(request.headers.get("Content-Length", ""))
+    except ValueError:
+        return JsonResponse({"error": "Upload-Offset and Content-Length required"}, status=400)
+
+    try:
+        uploads.write_part(upload, offset, request, length)
+    except uploads.UploadError as e:
+        return JsonResponse({**_upload_state(upload), "error": str(e)}, status=e.status)
+
+    return JsonResponse(_upload_state(upload))
+
+
+@login_required
+@require_POST
+def upload_complete(request, upload_id):
+    """
+    Attach a fully received upload: to a chat message when `to` names a
+    user, otherwise to a new post (images only).
+    """
+    upload = get_object_or_404(ChunkedUpload, id=upload_id, owner=request.user)
+    data = _payload(request)
+
+    try:
+        if data.get("to"):
+            receiver = get_object_or_404(User, username=data["to"])
+            msg = Message(
+                sender=request.user,
+                receiver=receiver,
+                content=(data.get("content") or "").strip(),
+            )
+            uploads.complete(upload, msg, upload.kind)
+            versions.bump(versions.chat_key(request.user.username, receiver.username))
+            return JsonResponse({
+                "message_id": msg.id,
+                "seq": msg.seq,
+                "sender": request.user.username,
+                "content": msg.content,
+                "image": msg.image.url if msg.image else None,
+                "audio": msg.audio.url if msg.audio else None,
+            })
+
+        if upload.kind != ChunkedUpload.IMAGE:
+            return JsonResponse({"error": "Posts take images only"}, status=400)
+        post = Post(
+            author=request.user,
+            caption=data.get("caption", ""),
+            score=ranking.initial_score(request.user),
+        )
+        uploads.complete(upload, post, "image")
+        return JsonResponse({"post_id": post.id, "image": post.image.url})
+    except uploads.UploadError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+
+
 # ====================== DELETE MESSAGE ======================
 @login_required
 @require_POST
 def delete_message(request, message_id, action):
-    msg = get_object_or_404(Message, id=message_id)
+    if action not in ("delete_for_me", "delete_for_everyone"):
+        return JsonResponse({"error": "Invalid action"}, status=400)
+
+    msg = Message.objects.for_id(message_id).filter(id=message_id).first()
+    if msg is None:
+        # Old enough to have been archived: rewrite its segment instead
+        pair = retention.delete_archived(
+            request.user, message_id, for_everyone=action == "delete_for_everyone"
+        )
+        if pair is None:
+            raise Http404
+        names = usercache.get_many(pair)
+        versions.bump(versions.chat_key(*(names[i]["username"] for i in pair)))
+        return JsonResponse({"success": True})
 
-    if request.user not in [msg.sender, msg.receiver]:
+    if request.user.id not in (msg.sender_id, msg.receiver_id):
         return HttpResponseForbidden()
 
+    # Participants come from the user cache: on a shard there is no
+    # user table to join
+    names = usercache.get_many([msg.sender_id, msg.receiver_id])
+    conversation = versions.chat_key(
+        names[msg.sender_id]["username"], names[msg.receiver_id]["username"]
+    )
+
     if action == "delete_for_me":
-        msg.deleted_for.add(request.user)
+        sync.delete_for_me(msg, request.user)
+        versions.bump(conversation)
         return JsonResponse({"success": True})
 
-    if action == "delete_for_everyone":
-        if request.user != msg.sender:
-            return HttpResponseForbidden()
+    if request.user.id != msg.sender_id:
+        return HttpResponseForbidden()
 
-        msg.delete()
-        return JsonResponse({"success": True})
+    sync.delete_for_everyone(msg)
+    versions.bump(conversation)
+    return JsonResponse({"success": True})
 
-    return JsonResponse({"error": "Invalid action"}, status=400)
+
+# ====================== NOTIFICATIONS ======================
+@login_required
+def notifications(request):
+    # Make this user's own pending events visible before reading
+    notification_buffer.flush(request.user.id)
+
+    page_size = 20
+    qs = Notification.objects.filter(recipient=request.user)
+
+    before = request.GET.get("before")
+    if before:
+        try:
+            before = int(before)
+        except ValueError:
+            before = -1
+        if before < 0:
+            return HttpResponseBadRequest("Invalid cursor")
+        qs = qs.filter(id__lt=before)
+
+    rows = list(qs.order_by("-id")[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+
+    return JsonResponse({
+        "notifications": serialize(rows),
+        "unread_count": unread_count(request.user),
+        "next_before": rows[-1].id if has_more else None,
+    })
+
+
+@login_required
+@require_POST
+def notifications_mark_read(request):
+    updated = Notification.objects.filter(
+        recipient=request.user, read=False
+    ).update(read=True)
+    return JsonResponse({"success": True, "updated": updated})
+
+
+# ====================== DATA EXPORT ======================
+@login_required
+def export_data(request):
+    response = StreamingHttpResponse(
+        stream_user_archive(request.user), content_type="application/zip"
+    )
+    response["Content-Disposition"] = (
+        f'attachment; filename="{request.user.username}-export.zip"'
+    )
+    return response
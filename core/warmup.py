@@ -0,0 +1,74 @@
+import logging
+import time
+from pathlib import Path
+
+logger = logging.getLogger(__name__)
+
+
+def compile_templates():
+    """Load every core template once so the cached loader holds them compiled."""
+    from django.template import engines
+
+    done = 0
+    template_dir = Path(__file__).resolve().parent / "templates"
+    for engine in engines.all():
+        for path in sorted(template_dir.rglob("*.html")):
+            name = path.relative_to(template_dir).as_posix()
+            try:
+                engine.get_template(name)
+                done += 1
+            except Exception:
+                logger.exception("warm-up: could not compile %s", name)
+    return done
+
+
+def prime_connections():
+    """
+    Open every database and cache connection. They're per thread: the
+    thread that goes on to serve requests keeps them, any other still
+    pays the driver imports and finds out now if a server doesn't answer.
+    """
+    from django.core.cache import caches
+    from django.db import connections
+
+    for conn in connections.all():
+        conn.ensure_connection()
+    for cache in caches.all():
+        cache.get("warmup:ping")
+
+
+def load_urlconf():
+    from django.urls import get_resolver
+
+    # Building the resolver imports every view module
+    get_resolver().url_patterns
+
+
+def warm_up(websocket=True, connections=False):
+    """
+    Run the cold-path work a worker would otherwise do on its first
+    requests. Returns {step: seconds}; failures are logged, not raised,
+    so a warm-up problem never stops the worker from starting.
+    Connections are only opened when asked: a preloading server runs
+    this in a master process whose sockets every forked worker would
+    share, so those prime theirs after the fork (gunicorn.conf.py).
+    """
+    steps = [
+        ("urlconf", load_urlconf),
+        ("templates", compile_templates),
+    ]
+    if websocket:
+        from social.asgi import websocket_application
+        steps.append(("websocket", websocket_application))
+    if connections:
+        steps.append(("connections", prime_connections))
+
+    timings = {}
+    for name, step in steps:
+        start = time.perf_counter()
+        try:
+            step()
+        except Exception:
+            logger.exception("warm-up step %s failed", name)
+        timings[name] = time.perf_counter() - start
+    return timings
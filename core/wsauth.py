@@ -0,0 +1,19 @@
+from types import SimpleNamespace
+
+from channels.auth import AuthMiddleware
+from channels.db import database_sync_to_async
+from channels.sessions import SessionMiddlewareStack
+
+from .auth import get_user
+
+
+class CachedAuthMiddleware(AuthMiddleware):
+    """channels AuthMiddleware using core.auth's cached user resolution."""
+
+    async def resolve_scope(self, scope):
+        request = SimpleNamespace(session=scope["session"])
+        scope["user"]._wrapped = await database_sync_to_async(get_user)(request)
+
+
+def CachedAuthMiddlewareStack(inner):
+    return SessionMiddlewareStack(CachedAuthMiddleware(inner))
@@ -0,0 +1,16 @@
+# Read by gunicorn from the working directory it is started in
+
+
+def post_worker_init(worker):
+    # After the fork, so the sockets belong to this worker alone. A sync
+    # worker serves requests on this thread, which keeps the connections
+    from django.conf import settings
+
+    if settings.WARM_UP_ON_START:
+        from core.warmup import prime_connections
+
+        try:
+            prime_connections()
+        except Exception:
+            # Same as warm_up(): never keep the worker from starting
+            worker.log.exception("warm-up: could not open connections")
@@ -8,27 +8,51 @@ https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
 """
 
 import os
-import django # <-- ADD THIS LINE
 
 os.environ.setdefault("DJANGO_SETTINGS_MODULE", "social.settings")
 
 # ----------------------------------------------------
-# 1. Initialize Django App Registry
+# 1. Initialize Django (get_asgi_application() calls django.setup()).
 # This must happen BEFORE importing any code (like routing) that uses models.
-django.setup() # <-- ADD THIS LINE
+from django.core.asgi import get_asgi_application
+
+django_asgi_app = get_asgi_application()
 # ----------------------------------------------------
 
-# 2. Import Channel and app-dependent components AFTER setup()
-from channels.routing import ProtocolTypeRouter, URLRouter
-from django.core.asgi import get_asgi_application
-from channels.auth import AuthMiddlewareStack
-import core.routing # <-- MOVE THIS IMPORT DOWN HERE
+# 2. The websocket stack (channels auth, routing, consumers) is only
+# imported when the first socket connects, or during warm-up.
+from django.conf import settings
+from channels.routing import ProtocolTypeRouter
 
-application = ProtocolTypeRouter({
-    "http": get_asgi_application(),
-    "websocket": AuthMiddlewareStack(
-        URLRouter(
-            core.routing.websocket_urlpatterns
+_websocket_app = None
+
+
+def websocket_application():
+    global _websocket_app
+    if _websocket_app is None:
+        from channels.routing import URLRouter
+        from core.wsauth import CachedAuthMiddlewareStack
+        import core.routing
+
+        _websocket_app = CachedAuthMiddlewareStack(
+            URLRouter(
+                core.routing.websocket_urlpatterns
+            )
         )
-    ),
-})
\ No newline at end of file
+    return _websocket_app
+
+
+async def lazy_websocket(scope, receive, send):
+    return await websocket_application()(scope, receive, send)
+
+
+application = ProtocolTypeRouter({
+    "http": django_asgi_app,
+    "websocket": lazy_websocket,
+})
+
+if settings.WARM_UP_ON_START:
+    from core.warmup import warm_up
+    # Daphne serves from the process that imported this, so nothing
+    # forks after connections are opened
+    warm_up(connections=True)
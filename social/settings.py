@@ -5,7 +5,6 @@ Production-ready for Render.com and local development.
 
 from pathlib import Path
 import os
-import dj_database_url
 
 # -------------------
 # BASE DIRECTORY
@@ -55,11 +54,12 @@ INSTALLED_APPS = [
 # -------------------
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
-    "whitenoise.middleware.WhiteNoiseMiddleware",
+    "core.middleware.StaticFilesMiddleware",  # WhiteNoise, async-capable
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
-    "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "core.auth.CachedAuthenticationMiddleware",  # request.user from cache first
+    "core.replicas.ReplicaPinningMiddleware",  # read-your-writes for replica reads
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
 ]
@@ -73,8 +73,15 @@ TEMPLATES = [
     {
         "BACKEND": "django.template.backends.django.DjangoTemplates",
         "DIRS": [],  # You can add BASE_DIR / "templates" if needed
-        "APP_DIRS": True,
+        "APP_DIRS": False,  # app directories are searched via "loaders" below
         "OPTIONS": {
+            # Compile each template once per process, also in DEBUG
+            "loaders": [
+                ("django.template.loaders.cached.Loader", [
+                    "django.template.loaders.filesystem.Loader",
+                    "django.template.loaders.app_directories.Loader",
+                ]),
+            ],
             "context_processors": [
                 "django.template.context_processors.debug",
                 "django.template.context_processors.request",
@@ -95,14 +102,59 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db.sqlite3",
+        "CONN_MAX_AGE": int(os.environ.get("CONN_MAX_AGE", "0")),
+        "CONN_HEALTH_CHECKS": True,
     }
 }
 
+# -------------------
+# READ REPLICAS (core.replicas)
+# -------------------
+# Comma-separated replica databases (SQLite files here), kept in sync with
+# the primary by replication outside Django. Only @read_replica views use
+# them; migrations run on the primary alone.
+for _i, _name in enumerate(filter(None, os.environ.get("DATABASE_REPLICAS", "").split(","))):
+    DATABASES[f"replica{_i + 1}"] = {
+        **DATABASES["default"],
+        "NAME": _name.strip(),
+        "TEST": {"MIRROR": "default"},
+    }
+
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias.startswith("replica")]
+# Replicas further behind than this (seconds, via a heartbeat row) get no reads
+DATABASE_REPLICA_MAX_LAG = float(os.environ.get("DATABASE_REPLICA_MAX_LAG", "5"))
+DATABASE_REPLICA_LAG_CHECK = float(os.environ.get("DATABASE_REPLICA_LAG_CHECK", "2"))
+# After a write, that client reads from the primary for this long
+READ_YOUR_WRITES_SECONDS = int(os.environ.get("READ_YOUR_WRITES_SECONDS", "10"))
+
+# -------------------
+# MESSAGE SHARDS (core.shards)
+# -------------------
+# Comma-separated databases (SQLite files here) that take chat messages,
+# split by conversation. Empty: everything stays in the primary. Append
+# only (an alias's position fixes its id range), then run
+# `manage.py shard_messages` to create the tables and move conversations.
+for _i, _name in enumerate(filter(None, os.environ.get("MESSAGE_SHARD_DATABASES", "").split(","))):
+    DATABASES[f"messages{_i + 1}"] = {
+        **DATABASES["default"],
+        "NAME": _name.strip(),
+    }
+
+MESSAGE_SHARDS = [alias for alias in DATABASES if alias.startswith("messages")]
+# Ids each shard hands out: shard N uses [N * span, (N + 1) * span)
+MESSAGE_SHARD_ID_SPAN = 2 ** 40
+DATABASE_ROUTERS = ["core.shards.MessageShardRouter", "core.replicas.PrimaryReplicaRouter"]
+
 # -------------------
 # AUTHENTICATION
 # -------------------
 AUTH_USER_MODEL = "core.User"
 
+# Seconds the authenticated User row is served from cache (core.auth);
+# saves and deletes invalidate it immediately. Only with REDIS_CACHE_URL:
+# a per-process cache can't hear other workers' invalidations
+AUTH_USER_CACHE_TTL = int(os.environ.get("AUTH_USER_CACHE_TTL", "30"))
+
 AUTH_PASSWORD_VALIDATORS = [
     {"NAME": "django.contrib.auth.password_validation.UserAttributeSimilarityValidator"},
     {"NAME": "django.contrib.auth.password_validation.MinimumLengthValidator"},
@@ -115,12 +167,143 @@ AUTH_PASSWORD_VALIDATORS = [
 # -------------------
 REDIS_HOST = os.environ.get("REDIS_HOST", "127.0.0.1")
 
-CHANNEL_LAYERS = {
-    "default": {
-        "BACKEND": "channels_redis.core.RedisChannelLayer",
-        "CONFIG": {"hosts": [(REDIS_HOST, 6379)]},
-    },
-}
+# "memory" runs a single worker without Redis (local load tests, offline dev)
+CHANNEL_LAYER = os.environ.get("CHANNEL_LAYER", "redis")
+
+if CHANNEL_LAYER == "memory":
+    CHANNEL_LAYERS = {
+        "default": {"BACKEND": "channels.layers.InMemoryChannelLayer"},
+    }
+else:
+    CHANNEL_LAYERS = {
+        "default": {
+            "BACKEND": "channels_redis.core.RedisChannelLayer",
+            "CONFIG": {"hosts": [(REDIS_HOST, 6379)]},
+        },
+    }
+
+# -------------------
+# CACHE
+# -------------------
+# Without it each worker has its own cache, and the JSON endpoints skip
+# ETags/304s (core.versions.shared): their version counters live here
+REDIS_CACHE_URL = os.environ.get("REDIS_CACHE_URL")
+# VERSIONS_SHARED=1: one server process, so its local cache is shared anyway
+VERSIONS_SHARED = os.environ.get("VERSIONS_SHARED") == "1" or None
+
+if REDIS_CACHE_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_CACHE_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+
+# Sessions: cache with DB write-through when the cache is shared (the
+# test core.versions.shared makes). In a per-process cache a logout on
+# one worker would leave the session alive in the others, so plain DB
+# then. "...signed_cookies" avoids the store entirely (session data then
+# travels in the cookie)
+SESSION_ENGINE = os.environ.get(
+    "SESSION_ENGINE",
+    "django.contrib.sessions.backends.cached_db" if REDIS_CACHE_URL or VERSIONS_SHARED
+    else "django.contrib.sessions.backends.db",
+)
+
+# -------------------
+# SUGGESTIONS ("who to follow")
+# -------------------
+SUGGESTIONS_LIMIT = int(os.environ.get("SUGGESTIONS_LIMIT", "15"))
+SUGGESTIONS_TTL = int(os.environ.get("SUGGESTIONS_TTL", str(60 * 30)))
+
+# -------------------
+# FOLLOW GRAPH (core.graph)
+# -------------------
+# Snapshot written by `manage.py build_follow_graph`, mmapped by every worker
+FOLLOW_GRAPH_PATH = os.environ.get("FOLLOW_GRAPH_PATH", str(BASE_DIR / "var" / "follow_graph.bin"))
+# Older snapshots are ignored and the graph is built from the database instead;
+# a worker's graph is rebuilt (in the background) once it is this old
+FOLLOW_GRAPH_MAX_AGE = int(os.environ.get("FOLLOW_GRAPH_MAX_AGE", "600"))
+
+# -------------------
+# USER SUMMARY CACHE (core.usercache)
+# -------------------
+# Per-process LRU of {id, username, avatar}; the shared cache keeps them 10x longer
+USER_CACHE_TTL = int(os.environ.get("USER_CACHE_TTL", "60"))
+USER_CACHE_SIZE = int(os.environ.get("USER_CACHE_SIZE", "10000"))
+USER_CACHE_SHARED = os.environ.get("USER_CACHE_SHARED", "True") == "True"
+
+# -------------------
+# FEED
+# -------------------
+# "chronological" or "ranked" (engagement score, see core.ranking)
+FEED_ORDERING = os.environ.get("FEED_ORDERING", "chronological")
+FEED_PAGE_SIZE = int(os.environ.get("FEED_PAGE_SIZE", "20"))
+FEED_RANKING_HALF_LIFE_HOURS = float(os.environ.get("FEED_RANKING_HALF_LIFE_HOURS", "12"))
+FEED_RANKING_WINDOW_DAYS = int(os.environ.get("FEED_RANKING_WINDOW_DAYS", "7"))
+
+# -------------------
+# PROFILES
+# -------------------
+# Posts per grid page (a multiple of 3 fills the rows)
+PROFILE_PAGE_SIZE = int(os.environ.get("PROFILE_PAGE_SIZE", "24"))
+# Header counts (core.profiles); signals drop them on every change
+PROFILE_STATS_TTL = int(os.environ.get("PROFILE_STATS_TTL", "600"))
+# Edge of the square grid thumbnails (core.thumbnails)
+THUMBNAIL_SIZE = int(os.environ.get("THUMBNAIL_SIZE", "320"))
+
+# -------------------
+# HASHTAGS & TRENDING (core.textindex)
+# -------------------
+TRENDING_WINDOW_HOURS = int(os.environ.get("TRENDING_WINDOW_HOURS", "24"))
+TRENDING_TTL = int(os.environ.get("TRENDING_TTL", "300"))
+
+# -------------------
+# LIKES
+# -------------------
+# Seconds like/unlike counter deltas are buffered before being written
+LIKE_FLUSH_INTERVAL = float(os.environ.get("LIKE_FLUSH_INTERVAL", "2.0"))
+
+# -------------------
+# NOTIFICATIONS
+# -------------------
+# Events are aggregated into one row per target per bucket
+NOTIFICATION_BUCKET_SECONDS = int(os.environ.get("NOTIFICATION_BUCKET_SECONDS", "3600"))
+NOTIFICATION_FLUSH_INTERVAL = float(os.environ.get("NOTIFICATION_FLUSH_INTERVAL", "5.0"))
+# Push new notifications over the channel layer (ws/notifications/)
+NOTIFICATIONS_PUSH = os.environ.get("NOTIFICATIONS_PUSH", "False") == "True"
+
+# -------------------
+# CHAT HISTORY & RETENTION
+# -------------------
+CHAT_PAGE_SIZE = int(os.environ.get("CHAT_PAGE_SIZE", "50"))
+# Events per /sync response (core.sync); clients page with has_more
+CHAT_SYNC_PAGE_SIZE = int(os.environ.get("CHAT_SYNC_PAGE_SIZE", "200"))
+# Read watermarks (core.receipts) are written at most once per window per conversation
+READ_RECEIPT_FLUSH_INTERVAL = float(os.environ.get("READ_RECEIPT_FLUSH_INTERVAL", "1.0"))
+# Messages older than this move to compressed MessageArchive segments
+MESSAGE_RETENTION_DAYS = int(os.environ.get("MESSAGE_RETENTION_DAYS", "365"))
+MESSAGE_ARCHIVE_SEGMENT_SIZE = int(os.environ.get("MESSAGE_ARCHIVE_SEGMENT_SIZE", "500"))
+
+# -------------------
+# CHUNKED UPLOADS (core.uploads)
+# -------------------
+CHUNKED_UPLOAD_CHUNK_SIZE = int(os.environ.get("CHUNKED_UPLOAD_CHUNK_SIZE", str(1024 * 1024)))
+CHUNKED_UPLOAD_MAX_SIZE = int(os.environ.get("CHUNKED_UPLOAD_MAX_SIZE", str(100 * 1024 * 1024)))
+# Unfinished uploads older than this are removed by `manage.py purge_uploads`
+CHUNKED_UPLOAD_EXPIRY_HOURS = int(os.environ.get("CHUNKED_UPLOAD_EXPIRY_HOURS", "24"))
+
+# -------------------
+# POLLING
+# -------------------
+# Upper bound for ?wait= long-polls on the chat endpoint
+LONGPOLL_MAX_SECONDS = float(os.environ.get("LONGPOLL_MAX_SECONDS", "25"))
 
 # -------------------
 # INTERNATIONALIZATION
@@ -136,7 +319,25 @@ USE_TZ = True
 STATIC_URL = "/static/"
 STATICFILES_DIRS = [BASE_DIR / "static"]
 STATIC_ROOT = BASE_DIR / "staticfiles"
-STATICFILES_STORAGE = "whitenoise.storage.CompressedManifestStaticFilesStorage"
+# Django 5.1+ reads STORAGES (STATICFILES_STORAGE alone is ignored)
+STORAGES = {
+    "default": {
+        "BACKEND": "django.core.files.storage.FileSystemStorage",
+    },
+    "staticfiles": {
+        # Content-hashed names + gzip/brotli copies of static/dist bundles
+        "BACKEND": "whitenoise.storage.CompressedManifestStaticFilesStorage",
+    },
+}
+# Only index hashed files at startup (halves whitenoise's file scan)
+WHITENOISE_KEEP_ONLY_HASHED_FILES = not DEBUG
+
+# -------------------
+# STARTUP
+# -------------------
+# Load the URLconf, compile templates and open connections before the
+# worker takes traffic
+WARM_UP_ON_START = os.environ.get("WARM_UP_ON_START", "True") == "True"
 
 # -------------------
 # MEDIA FILES
@@ -14,3 +14,11 @@ from django.core.wsgi import get_wsgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'social.settings')
 
 application = get_wsgi_application()
+
+from django.conf import settings
+
+if settings.WARM_UP_ON_START:
+    from core.warmup import warm_up
+    # May run in a preloading master: connections are opened per worker
+    # in gunicorn.conf.py instead
+    warm_up(websocket=False)
@@ -0,0 +1,4 @@
+const navbar = document.getElementById('mainNavbar');
+window.addEventListener('scroll', () => {
+navbar.classList.toggle('scrolled', window.scrollY > 10);
+});
@@ -0,0 +1,204 @@
+function getCookie(name) {
+let cookieValue = null;
+if (document.cookie && document.cookie !== '') {
+document.cookie.split(';').forEach(cookie => {
+cookie = cookie.trim();
+if (cookie.startsWith(name + '=')) {
+cookieValue = decodeURIComponent(cookie.slice(name.length + 1));
+}
+});
+}
+return cookieValue;
+}
+const chatRoot     = document.querySelector(".chat-container");
+const messagesBox  = document.getElementById("messages");
+const msgInput     = document.getElementById("msg");
+const sendBtn      = document.getElementById("send");
+const micBtn       = document.getElementById("mic");
+const recordStatus = document.getElementById("record-status");
+const timerEl      = document.getElementById("timer");
+const cancelRecord = document.getElementById("cancel-record");
+const currentUser  = chatRoot.dataset.currentUser;
+const chatAd = document.getElementById("chat-ad");
+const adPlaceholder = document.getElementById("ad-placeholder");
+let mediaRecorder = null;
+let audioChunks = [];
+let recordingInterval = null;
+let seconds = 0;
+function buildMessage(data) {
+const div = document.createElement("div");
+div.classList.add("message");
+if (data.sender === currentUser) div.classList.add("mine");
+div.id = `msg-${data.message_id}`;
+div.style.marginBottom = "8px";
+let html = `<strong>${data.sender}:</strong>`;
+if (data.content) html += `<div>${data.content}</div>`;
+if (data.image)   html += `<div><img src="${data.image}" style="max-width:90%; border-radius:6px;"></div>`;
+if (data.audio)   html += `<div><audio controls src="${data.audio}" style="width:90%;"></audio></div>`;
+html += `<div>`;
+if (data.sender === currentUser) {
+html += `<button class="delete-btn btn btn-sm btn-outline-danger" data-id="${data.message_id}" data-action="delete_for_me">Delete for me</button>
+<button class="delete-btn btn btn-sm btn-outline-warning" data-id="${data.message_id}" data-action="delete_for_everyone">Delete for everyone</button>`;
+} else {
+html += `<button class="delete-btn btn btn-sm btn-outline-danger" data-id="${data.message_id}" data-action="delete_for_me">Delete for me</button>`;
+}
+html += `</div>`;
+div.innerHTML = html;
+return div;
+}
+function appendMessage(data) {
+if (document.getElementById(`msg-${data.message_id}`)) return;
+messagesBox.insertBefore(buildMessage(data), chatAd);
+messagesBox.scrollTop = messagesBox.scrollHeight;
+}
+let readUpTo = Number(chatRoot.dataset.readUpTo || 0);
+function showSeen(upTo) {
+readUpTo = Math.max(readUpTo, upTo);
+document.getElementById("seen-marker")?.remove();
+const seen = [...messagesBox.querySelectorAll(".message.mine[id^='msg-']")]
+.filter(el => Number(el.id.split("-")[1]) <= readUpTo);
+if (!seen.length) return;
+const marker = document.createElement("div");
+marker.id = "seen-marker";
+marker.className = "text-muted small";
+marker.textContent = "Seen";
+seen[seen.length - 1].appendChild(marker);
+}
+showSeen(readUpTo);
+const loadOlderBtn = document.getElementById("load-older");
+loadOlderBtn?.addEventListener("click", async () => {
+const first = messagesBox.querySelector(".message[id^='msg-']");
+const beforeId = first ? first.id.split("-")[1] : Number.MAX_SAFE_INTEGER;
+try {
+const res = await fetch(chatRoot.dataset.pollUrl + "?before_id=" + beforeId, {
+headers: { "X-Requested-With": "XMLHttpRequest" }
+});
+const data = await res.json();
+const previousHeight = messagesBox.scrollHeight;
+[...data.messages].reverse().forEach(msg => {
+if (!document.getElementById(`msg-${msg.message_id}`)) {
+loadOlderBtn.after(buildMessage(msg));
+}
+});
+messagesBox.scrollTop += messagesBox.scrollHeight - previousHeight;
+if (!data.has_more) loadOlderBtn.remove();
+} catch (err) { console.error(err); }
+});
+messagesBox.addEventListener("click", async (e) => {
+if (!e.target.classList.contains("delete-btn")) return;
+const id = e.target.dataset.id;
+const action = e.target.dataset.action;
+const csrftoken = getCookie("csrftoken");
+try {
+const res = await fetch(`/delete-message/${id}/${action}/`, {
+method: "POST",
+headers: { "X-CSRFToken": csrftoken }
+});
+if (res.ok) {
+const msgDiv = document.getElementById(`msg-${id}`);
+msgDiv?.remove();
+}
+} catch (err) { console.error(err); }
+});
+chatAd.addEventListener("click", () => {
+adPlaceholder.style.display = "block";
+adPlaceholder.textContent = "Double-click to close";
+});
+adPlaceholder.addEventListener("dblclick", () => {
+adPlaceholder.style.display = "none";
+});
+sendBtn.addEventListener("click", async () => {
+const content = msgInput.value.trim();
+if (!content) return;
+const csrftoken = getCookie("csrftoken");
+try {
+const res = await fetch(chatRoot.dataset.sendUrl, {
+method: "POST",
+headers: { "X-CSRFToken": csrftoken, "Content-Type": "application/json" },
+body: JSON.stringify({ content: content })
+});
+const data = await res.json();
+appendMessage(data);
+msgInput.value = "";
+} catch (err) { console.error(err); }
+});
+micBtn.addEventListener("click", async () => {
+if (!mediaRecorder || mediaRecorder.state === "inactive") {
+try {
+const stream = await navigator.mediaDevices.getUserMedia({ audio: true });
+mediaRecorder = new MediaRecorder(stream);
+audioChunks = [];
+seconds = 0;
+mediaRecorder.ondataavailable = e => audioChunks.push(e.data);
+mediaRecorder.onstop = sendAudioMessage;
+mediaRecorder.start();
+recordStatus.style.display = "block";
+timerEl.textContent = "0:00";
+micBtn.textContent = "🛑"; // Change button text to stop icon
+recordingInterval = setInterval(() => {
+seconds++;
+const min = Math.floor(seconds / 60);
+const sec = seconds % 60;
+timerEl.textContent = `${min}:${sec.toString().padStart(2,'0')}`;
+}, 1000);
+} catch (err) {
+alert("Microphone access denied. Ensure your site uses HTTPS.");
+console.error(err);
+}
+} else if (mediaRecorder.state === "recording") {
+mediaRecorder.stop();
+clearInterval(recordingInterval);
+recordStatus.style.display = "none";
+micBtn.textContent = "🎤"; // Reset button text
+}
+});
+cancelRecord.addEventListener("click", (e) => {
+e.preventDefault();
+if (mediaRecorder && mediaRecorder.state === "recording") mediaRecorder.stop();
+audioChunks = [];
+clearInterval(recordingInterval);
+recordStatus.style.display = "none";
+micBtn.textContent = "🎤"; // Reset button text
+});
+async function sendAudioMessage() {
+const audioBlob = new Blob(audioChunks, { type: 'audio/webm' });
+const formData = new FormData();
+formData.append('audio', audioBlob);
+const csrftoken = getCookie("csrftoken");
+try {
+const res = await fetch(chatRoot.dataset.sendUrl, {
+method: 'POST',
+headers: { 'X-CSRFToken': csrftoken },
+body: formData
+});
+const data = await res.json();
+appendMessage(data);
+} catch (err) {
+console.error(err);
+}
+audioChunks = [];
+}
+let syncSeq = Number(chatRoot.dataset.seq || 0);
+function applyEvent(event) {
+if (event.type === "new") {
+appendMessage(event);
+} else if (event.type === "read") {
+if (event.reader !== currentUser) showSeen(event.message_id);
+} else {
+document.getElementById(`msg-${event.message_id}`)?.remove();
+}
+}
+function fetchChanges() {
+fetch(chatRoot.dataset.syncUrl + "?since=" + syncSeq)
+.then(res => res.json())
+.then(data => {
+data.events.forEach(applyEvent);
+syncSeq = Math.max(syncSeq, data.seq);
+if (data.has_more) fetchChanges();
+})
+.catch(err => console.error(err));
+}
+setInterval(fetchChanges, 2000);
+window.onload = function() {
+messagesBox.scrollTop = messagesBox.scrollHeight;
+};
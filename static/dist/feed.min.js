@@ -0,0 +1,85 @@
+function getCookie(name) {
+let cookieValue = null;
+if (document.cookie && document.cookie !== '') {
+document.cookie.split(';').forEach(cookie => {
+cookie = cookie.trim();
+if (cookie.startsWith(name + '=')) {
+cookieValue = decodeURIComponent(cookie.slice(name.length + 1));
+}
+});
+}
+return cookieValue;
+}
+const csrftoken = getCookie('csrftoken');
+const feedRoot = document.getElementById('feed');
+document.addEventListener('DOMContentLoaded', () => {
+document.querySelectorAll('.like-btn').forEach(button => {
+button.addEventListener('click', async () => {
+const postId = button.dataset.postId;
+const url = feedRoot.dataset.likeUrl.replace("0", postId);
+const likeCountElement = button.parentElement.querySelector('.like-count');
+const icon = button.querySelector('i');
+const formData = new FormData();
+formData.append('liked', icon.classList.contains('fa-solid') ? '0' : '1');
+try {
+const res = await fetch(url, {
+method: "POST",
+headers: {
+"X-CSRFToken": csrftoken,
+"X-Requested-With": "XMLHttpRequest"
+},
+body: formData
+});
+if(res.ok){
+const data = await res.json();
+likeCountElement.textContent = data.total_likes;
+if(data.liked){
+icon.classList.remove("fa-regular");
+icon.classList.add("fa-solid");
+icon.style.color = "red"; // ❤️ liked
+} else {
+icon.classList.remove("fa-solid");
+icon.classList.add("fa-regular");
+icon.style.color = "gray"; // unliked
+}
+}
+} catch(err){ console.error(err); }
+});
+});
+document.querySelectorAll('.comment-btn').forEach(btn=>{
+btn.addEventListener('click', async ()=>{
+const postId = btn.dataset.postId;
+const input = btn.closest('.input-group').querySelector('.comment-input');
+const text = input.value.trim();
+if(!text) return;
+try{
+const formData = new FormData();
+formData.append('text', text);
+const res = await fetch(`/post/${postId}/comment/`, {
+method:'POST',
+headers:{'X-CSRFToken': csrftoken},
+body: formData
+});
+if(res.ok){
+const ul = btn.closest('.card-body').querySelector('.comments-list');
+const li = document.createElement('li');
+li.classList.add('list-group-item');
+const author = document.createElement('strong');
+author.textContent = `${feedRoot.dataset.username}:`;
+li.append(author, ` ${text}`);
+const noCommentsLi = ul.querySelector('.text-muted');
+if(noCommentsLi){ ul.removeChild(noCommentsLi); }
+ul.appendChild(li);
+input.value='';
+}
+} catch(err){ console.error(err); }
+});
+});
+const clickAd = document.getElementById('fixedClickAd');
+clickAd.addEventListener('click', ()=>{
+clickAd.classList.toggle('expanded');
+clickAd.innerHTML = clickAd.classList.contains('expanded')
+? "<h4 style='text-align:center;'>Full Ad Content Here</h4>"
+: "<p class='ad-label'>Ad</p>";
+});
+});
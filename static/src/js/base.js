@@ -0,0 +1,5 @@
+/* -------------------- NAVBAR -------------------- */
+const navbar = document.getElementById('mainNavbar');
+window.addEventListener('scroll', () => {
+    navbar.classList.toggle('scrolled', window.scrollY > 10);
+});